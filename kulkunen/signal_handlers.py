@@ -3,7 +3,9 @@ import logging
 from django.apps import apps
 from django.db.models.signals import pre_save
 
-from resources.signals import reservation_cancelled, reservation_confirmed, reservation_modified
+from resources.signals import (
+    reservation_cancelled, reservation_confirmed, reservation_modified, reservations_confirmed
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,11 @@ def handle_reservation_confirmed(sender, **kwargs):
     acr.grant_access(reservation)
 
 
+def handle_reservations_confirmed(sender, **kwargs):
+    for reservation in kwargs.get('instances'):
+        handle_reservation_confirmed(sender, instance=reservation)
+
+
 def handle_reservation_cancelled(sender, **kwargs):
     reservation = kwargs.get('instance')
     acr = _get_acr(reservation.resource)
@@ -51,6 +58,7 @@ def handle_respa_resource_save(sender, **kwargs):
 
 def install_signal_handlers():
     reservation_confirmed.connect(handle_reservation_confirmed)
+    reservations_confirmed.connect(handle_reservations_confirmed)
     reservation_cancelled.connect(handle_reservation_cancelled)
     reservation_modified.connect(handle_reservation_modified)
 
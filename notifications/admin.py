@@ -7,11 +7,12 @@ from django.core.management import call_command
 from django import forms
 from django.contrib import admin
 from django.contrib.admin import site as admin_site
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.urls import path, reverse
 from django.shortcuts import render
 from django.http import HttpResponseRedirect, HttpResponse
-from .models import NotificationTemplate, NotificationTemplateGroup
+from .models import NotificationTemplate, NotificationTemplateGroup, QueuedNotification
 from resources.admin.base import PopulateCreatedAndModifiedMixin, CommonExcludeMixin
 
 logger = logging.getLogger(__name__)
@@ -114,5 +115,19 @@ class NotificationTemplateAdmin(TranslatableAdmin):
     update_notification_html_templates.short_description = _('Update notification HTML templates')
 
 
+class QueuedNotificationAdmin(admin.ModelAdmin):
+    list_display = ('reservation', 'type', 'state', 'attempts', 'send_after', 'created_at')
+    list_filter = ('state', 'type')
+    raw_id_fields = ('reservation', 'user', 'template')
+    readonly_fields = ('attempts', 'last_error', 'created_at')
+    actions = ['retry_notifications']
+
+    def retry_notifications(self, request, queryset):
+        queryset.update(state=QueuedNotification.PENDING, attempts=0, send_after=timezone.now())
+
+    retry_notifications.short_description = _('Retry sending the selected notifications')
+
+
 admin_site.register(NotificationTemplateGroup, NotificationGroupAdmin)
 admin_site.register(NotificationTemplate, NotificationTemplateAdmin)
+admin_site.register(QueuedNotification, QueuedNotificationAdmin)
@@ -0,0 +1,88 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from notifications.models import QueuedNotification
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued reservation notifications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Notifications sent per batch (default: 50)')
+        parser.add_argument('--workers', type=int, default=1, help='Batches sent in parallel (default: 1)')
+
+    def _send_batch(self, batch_size, now):
+        """
+        Sends one batch of queued notifications
+
+        Sent notifications are deleted and failed ones are scheduled to be
+        retried. The notifications stay locked until then, so other workers
+        and other runs of this command skip them.
+
+        :rtype: tuple[int, int] numbers of notifications sent and failed
+        """
+        with transaction.atomic():
+            notifications = QueuedNotification.objects.claim_due(batch_size, at=now)
+            sent = []
+            failed = []
+            # the messages of a batch share one connection to the mail server
+            with get_connection() as connection:
+                for notification in notifications:
+                    try:
+                        # a database error rolls back only this notification
+                        with transaction.atomic():
+                            notification.send(connection=connection)
+                    except Exception as exc:
+                        logger.exception('Sending notification %s failed', notification.pk)
+                        notification.set_failed(exc)
+                        failed.append(notification)
+                    else:
+                        sent.append(notification.pk)
+            QueuedNotification.objects.filter(pk__in=sent).delete()
+            QueuedNotification.objects.bulk_update(failed, ['state', 'attempts', 'send_after', 'last_error'])
+        return len(sent), len(failed)
+
+    def _send_due(self, batch_size, now, close_connection=False):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = self._send_batch(batch_size, now)
+                if not sent and not failed:
+                    return total_sent, total_failed
+                total_sent += sent
+                total_failed += failed
+        finally:
+            if close_connection:
+                # worker threads have database connections of their own
+                connections.close_all()
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        # notifications failing now are retried only on later runs
+        now = timezone.now()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [
+                    executor.submit(self._send_due, options['batch_size'], now, close_connection=True)
+                    for _ in range(options['workers'])
+                ]
+                results = [future.result() for future in futures]
+            sent = sum(result[0] for result in results)
+            failed = sum(result[1] for result in results)
+        else:
+            sent, failed = self._send_due(options['batch_size'], now)
+
+        elapsed = time.monotonic() - start
+        logger.info('Sent %d notifications in %.2f s (%.1f/s), %d failed', sent, elapsed, sent / elapsed, failed)
+        self.stdout.write('Sent %d notifications in %.2f s (%.1f/s), %d failed' % (
+            sent, elapsed, sent / elapsed, failed
+        ))
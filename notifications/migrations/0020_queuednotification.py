@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('resources', '0159_reservationreminder_reminder_date_index'),
+        ('notifications', '0019_add_type_reservation_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('reservation_requested', 'Reservation requested'), ('reservation_requested_official', 'Reservation requested official'), ('reservation_requested_official_by_official', 'Reservation requested by official'), ('reservation_cancelled', 'Reservation cancelled'), ('reservation_cancelled_official', 'Reservation cancelled official'), ('reservation_cancelled_by_official', 'Reservation cancelled by official'), ('reservation_created', 'Reservation created'), ('reservation_created_official', 'Reservation created official'), ('reservation_created_by_official', 'Reservation created by official'), ('reservation_modified', 'Reservation modified'), ('reservation_modified_official', 'Reservation modified official'), ('reservation_modified_by_official', 'Reservation modified by official'), ('reservation_created_with_access_code', 'Reservation created with access code'), ('reservation_created_with_access_code_official', 'Reservation created with access code official'), ('reservation_created_with_access_code_by_official', 'Reservation created with access code by official'), ('reservation_confirmed', 'Reservation confirmed'), ('reservation_denied', 'Reservation denied'), ('reservation_access_code_created', 'Access code was created for a reservation'), ('reservation_waiting_for_payment', 'Reservation waiting for payment'), ('catering_order_created', 'Catering order created'), ('catering_order_modified', 'Catering order modified'), ('catering_order_deleted', 'Catering order deleted'), ('reservation_comment_created', 'Reservation comment created'), ('catering_order_comment_created', 'Catering order comment created'), ('reservation_bulk_created', 'Reservation bulk created'), ('reservation_reminder', 'Reservation reminder')], max_length=100, verbose_name='Type')),
+                ('staff_email', models.EmailField(blank=True, max_length=254, verbose_name='Staff email')),
+                ('extra_context', models.JSONField(blank=True, default=dict, verbose_name='Extra context')),
+                ('ical_attachments', models.JSONField(blank=True, default=list, verbose_name='Calendar attachments')),
+                ('state', models.CharField(choices=[('pending', 'pending'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='State')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Send after')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queued_notifications', to='resources.reservation', verbose_name='Reservation')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Queued notification',
+                'verbose_name_plural': 'Queued notifications',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queuednotification',
+            index=models.Index(fields=['state', 'send_after'], name='notificatio_state_send_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0020_queuednotification'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='queuednotification',
+            name='extra_context',
+        ),
+        migrations.RemoveField(
+            model_name='queuednotification',
+            name='staff_email',
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='attachments',
+            field=models.JSONField(blank=True, default=list, verbose_name='Attachments'),
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Context'),
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='email_address',
+            field=models.EmailField(blank=True, max_length=254, verbose_name='Email address'),
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='language',
+            field=models.CharField(default='', max_length=10, verbose_name='Language'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Phone number'),
+        ),
+        migrations.AddField(
+            model_name='queuednotification',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='notifications.notificationtemplate', verbose_name='Notification template'),
+        ),
+        migrations.AlterField(
+            model_name='queuednotification',
+            name='reservation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='queued_notifications', to='resources.reservation', verbose_name='Reservation'),
+        ),
+    ]
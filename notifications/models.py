@@ -1,9 +1,13 @@
+import base64
+import datetime
 import logging
+from decimal import Decimal
+from functools import lru_cache
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.utils import translation
+from django.utils import timezone, translation
 from django.utils.html import strip_tags
 from django.utils.translation import gettext_lazy as _
 from django.utils.formats import date_format
@@ -66,7 +70,6 @@ class NotificationTemplateException(Exception):
     pass
 
 
-
 class NotificationTemplate(TranslatableModel):
     NOTIFICATION_TYPE_CHOICES = (
         (NotificationType.RESERVATION_REQUESTED, _('Reservation requested')),
@@ -150,25 +153,37 @@ class NotificationTemplate(TranslatableModel):
         {'short_message': 'foo', 'subject': 'bar', 'body': 'baz', 'html_body': '<b>foobar</b>'}
 
         """
+        return self.render_many([context], language_code)[0]
 
-        env = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
-        env.filters['reservation_time'] = reservation_time
-        env.filters['format_datetime'] = format_datetime
-        env.filters['format_datetime_tz'] = format_datetime_tz
+    def render_many(self, contexts, language_code=DEFAULT_LANG):
+        """
+        Render this notification template with each of the given contexts
 
+        The template fields are compiled only once. Returns a list of dicts
+        like `render`, in the order of the contexts.
+
+        :type contexts: iterable[dict]
+        :rtype: list[dict[str, str]]
+        """
         logger.debug('Rendering template for notification %s' % self.type)
         with switch_language(self, language_code):
             try:
-                rendered_notification = {
-                    attr: env.from_string(getattr(self, attr)).render(context)
-                    for attr in ('short_message', 'subject', 'html_body')
+                templates = {
+                    attr: compile_template(getattr(self, attr))
+                    for attr in ('short_message', 'subject', 'body', 'html_body')
                 }
-                if self.body:
-                    rendered_notification['body'] = env.from_string(self.body).render(context)
-                else:
-                    # if text body is empty use html body without tags as text body
-                    rendered_notification['body'] = strip_tags(rendered_notification['html_body'])
-                return rendered_notification
+                rendered_notifications = []
+                for context in contexts:
+                    rendered_notification = {
+                        attr: templates[attr].render(context) for attr in ('short_message', 'subject', 'html_body')
+                    }
+                    if self.body:
+                        rendered_notification['body'] = templates['body'].render(context)
+                    else:
+                        # if text body is empty use html body without tags as text body
+                        rendered_notification['body'] = strip_tags(rendered_notification['html_body'])
+                    rendered_notifications.append(rendered_notification)
+                return rendered_notifications
             except TemplateError as e:
                 raise NotificationTemplateException(e) from e
 
@@ -189,14 +204,10 @@ class NotificationTemplate(TranslatableModel):
 
     def validate_templates(self):
         context = {}
-        env = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
-        env.filters['reservation_time'] = reservation_time
-        env.filters['format_datetime'] = format_datetime
-        env.filters['format_datetime_tz'] = format_datetime_tz
         templates = ['short_message', 'body', 'html_body']
         for template in templates:
             try:
-                env.from_string(getattr(self, template)).render(context)
+                compile_template(getattr(self, template)).render(context)
             except UndefinedError as e:
                 # context can have various variables that are hard to test without actual data
                 # so we just skip validation for them
@@ -228,6 +239,35 @@ def format_datetime_tz(dt, tz):
     return format_datetime(dt)
 
 
+def get_template_environment():
+    """
+    Return the sandboxed environment shared by all notification templates
+    """
+    global _template_environment
+    if _template_environment is None:
+        env = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
+        env.filters['reservation_time'] = reservation_time
+        env.filters['format_datetime'] = format_datetime
+        env.filters['format_datetime_tz'] = format_datetime_tz
+        _template_environment = env
+    return _template_environment
+
+
+_template_environment = None
+
+
+# Compiling is the most expensive part of rendering a notification. The
+# compiled templates are keyed by their source, so an edited template is
+# compiled again and the stale one drops out of the cache eventually.
+@lru_cache(maxsize=1024)
+def compile_template(source):
+    """
+    :type source: str
+    :rtype: jinja2.Template
+    """
+    return get_template_environment().from_string(source)
+
+
 def render_notification_template(notification_type, context, language_code=DEFAULT_LANG):
     try:
         template = NotificationTemplate.objects.get(type=notification_type)
@@ -253,3 +293,169 @@ class NotificationTemplateGroup(ModifiableModel):
     def __str__(self):
         return self.name
 
+
+def dump_context(value):
+    """
+    Convert a notification render context to JSON
+
+    Dates, times and decimals are tagged, so that `load_context` restores
+    them for the template filters. Other objects are stored as strings.
+    """
+    if isinstance(value, dict):
+        return {str(key): dump_context(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [dump_context(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {'__timedelta__': value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    return str(value)
+
+
+def load_context(value):
+    """
+    Restore a notification render context stored with `dump_context`
+    """
+    if isinstance(value, list):
+        return [load_context(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, item = next(iter(value.items()))
+        if tag == '__datetime__':
+            return datetime.datetime.fromisoformat(item)
+        if tag == '__date__':
+            return datetime.date.fromisoformat(item)
+        if tag == '__timedelta__':
+            return datetime.timedelta(seconds=item)
+        if tag == '__decimal__':
+            return Decimal(item)
+    return {key: load_context(item) for key, item in value.items()}
+
+
+def dump_attachments(attachments):
+    """
+    Convert (filename, content, mimetype) mail attachments to JSON
+    """
+    return [
+        [filename, base64.b64encode(content.encode() if isinstance(content, str) else content).decode(), mimetype]
+        for filename, content, mimetype in attachments or ()
+    ]
+
+
+class QueuedNotificationQuerySet(models.QuerySet):
+    def due(self, at=None):
+        return self.filter(state=QueuedNotification.PENDING, send_after__lte=at or timezone.now())
+
+    def claim_due(self, count, at=None):
+        """
+        Lock and return at most `count` notifications waiting to be sent
+
+        Notifications locked by another transaction are skipped, so several
+        workers can send notifications at the same time without sending any
+        twice. Must be called in a transaction, which holds the locks.
+
+        :rtype: list[QueuedNotification]
+        """
+        return list(
+            self.due(at).select_for_update(skip_locked=True, of=('self',))
+            .select_related('reservation__resource__unit', 'reservation__user', 'user')
+            .order_by('send_after')[:count]
+        )
+
+
+class QueuedNotification(models.Model):
+    """
+    A reservation notification waiting to be rendered and sent
+
+    Notifications are queued in the same transaction as the change they are
+    about, and sent by the send_notifications management command. They keep
+    a snapshot of their render context and recipients, so notifications of
+    deleted reservations are sent too.
+    """
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (PENDING, _('pending')),
+        (FAILED, _('failed')),
+    )
+
+    reservation = models.ForeignKey('resources.Reservation', verbose_name=_('Reservation'), null=True, blank=True,
+                                    related_name='queued_notifications', on_delete=models.SET_NULL)
+    type = models.CharField(verbose_name=_('Type'), choices=NotificationTemplate.NOTIFICATION_TYPE_CHOICES,
+                            max_length=100)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('User'), null=True, blank=True,
+                             on_delete=models.SET_NULL)
+    template = models.ForeignKey(NotificationTemplate, verbose_name=_('Notification template'), null=True,
+                                 blank=True, related_name='+', on_delete=models.SET_NULL)
+    language = models.CharField(verbose_name=_('Language'), max_length=10)
+    context = models.JSONField(verbose_name=_('Context'), default=dict, blank=True)
+    email_address = models.EmailField(verbose_name=_('Email address'), blank=True)
+    phone_number = models.CharField(verbose_name=_('Phone number'), max_length=255, blank=True)
+    # [filename, base64 content, mimetype] triples of the files to attach
+    attachments = models.JSONField(verbose_name=_('Attachments'), default=list, blank=True)
+    # [filename, [reservation ids]] pairs of the calendar files to attach
+    ical_attachments = models.JSONField(verbose_name=_('Calendar attachments'), default=list, blank=True)
+
+    state = models.CharField(verbose_name=_('State'), choices=STATE_CHOICES, max_length=16, default=PENDING)
+    attempts = models.PositiveIntegerField(verbose_name=_('Attempts'), default=0)
+    send_after = models.DateTimeField(verbose_name=_('Send after'), default=timezone.now)
+    last_error = models.TextField(verbose_name=_('Last error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created at'), auto_now_add=True)
+
+    objects = QueuedNotificationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Queued notification')
+        verbose_name_plural = _('Queued notifications')
+        indexes = [
+            models.Index(fields=['state', 'send_after'], name='notificatio_state_send_idx'),
+        ]
+
+    def __str__(self):
+        return '%s: %s' % (self.reservation_id, self.type)
+
+    def send(self, connection=None):
+        """
+        Render and send the notification
+
+        Errors in delivery are raised, so that the notification can be retried.
+        """
+        from resources.models import Reservation
+        from resources.models.utils import build_reservations_ical_file, send_notification
+
+        if not self.template:
+            raise NotificationTemplateException('The template of the notification has been deleted')
+        attachments = [
+            (filename, base64.b64decode(content), mimetype) for filename, content, mimetype in self.attachments
+        ]
+        if self.email_address:
+            reservations = Reservation.objects.in_bulk({pk for _, pks in self.ical_attachments for pk in pks})
+            for filename, pks in self.ical_attachments:
+                # calendar files of deleted reservations are left out
+                ical_reservations = [reservations[pk] for pk in pks if pk in reservations]
+                if ical_reservations:
+                    attachments.append((filename, build_reservations_ical_file(ical_reservations), 'text/calendar'))
+        return send_notification(
+            self.template, self.language, load_context(self.context), email_address=self.email_address,
+            phone_number=self.phone_number, attachments=attachments, connection=connection, fail_silently=False
+        )
+
+    def set_failed(self, error):
+        """
+        Schedule the notification to be retried with an exponential delay,
+        or leave it failed when it has been tried too many times
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= settings.RESPA_NOTIFICATION_MAX_ATTEMPTS:
+            self.state = QueuedNotification.FAILED
+        else:
+            delay = settings.RESPA_NOTIFICATION_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.send_after = timezone.now() + datetime.timedelta(seconds=delay)
@@ -1,7 +1,9 @@
 import pytest
 from parler.utils.context import switch_language
 
-from notifications.models import NotificationType, NotificationTemplate, render_notification_template
+from notifications.models import (
+    NotificationType, NotificationTemplate, compile_template, render_notification_template
+)
 
 
 @pytest.fixture(scope='function')
@@ -96,3 +98,22 @@ def test_notification_template_rendering_empty_html_body(notification_template):
     assert rendered['subject'] == "testiotsikko, muuttujan arvo: bar!"
     assert rendered['body'] == "testiruumis, muuttujan arvo: baz!"
     assert rendered['html_body'] == ""
+
+
+@pytest.mark.django_db
+def test_notification_template_render_many(notification_template):
+    contexts = [
+        {'short_message_var': i, 'subject_var': i, 'body_var': i, 'html_body_var': i}
+        for i in range(3)
+    ]
+    compile_template.cache_clear()
+
+    rendered = notification_template.render_many(contexts, 'en')
+    assert [r['subject'] for r in rendered] == ["test subject, variable value: %d!" % i for i in range(3)]
+    assert rendered[2] == notification_template.render(contexts[2], 'en')
+    assert compile_template.cache_info().misses == 4
+
+    with switch_language(notification_template, 'en'):
+        notification_template.subject = "changed subject: {{ subject_var }}"
+        notification_template.save()
+    assert notification_template.render(contexts[1], 'en')['subject'] == "changed subject: 1"
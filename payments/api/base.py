@@ -7,7 +7,8 @@ from resources.api.base import TranslatedModelSerializer
 from resources.models.reservation import Reservation
 from resources.models.utils import get_translated_fields
 
-from ..models import Order, OrderLine, Product, ProductCustomerGroup
+from ..models import Order, OrderLine, Product
+from ..utils import get_detailed_price_total
 
 
 class ProductSerializer(TranslatedModelSerializer):
@@ -38,7 +39,8 @@ class ProductSerializer(TranslatedModelSerializer):
         return ret
 
     def get_product_customer_groups(self, obj):
-        product_cgs = ProductCustomerGroup.objects.filter(product=obj)
+        # product customer groups may have been prefetched with the products of resources
+        product_cgs = obj.product_customer_groups.all()
         serializer = ProductCustomerGroupSerializer(product_cgs, many=True)
         return serializer.data
 
@@ -68,15 +70,7 @@ class OrderLineSerializer(serializers.ModelSerializer):
         Returns the rounded price of this orderline with 2 decimal places.
         e.g. '2.00'
         """
-        detailed_prices = obj.get_detailed_price()
-        price = 0
-        for x in detailed_prices:
-            temp = detailed_prices[x]['tax_total'] + detailed_prices[x]['taxfree_price_total']
-            price += temp
-
-        # quantity needs to be handled separately for per period products
-        if obj.product.price_type != Product.PRICE_FIXED:
-            price *= obj.quantity
+        price = get_detailed_price_total(obj.get_detailed_price(), obj.product.price_type, obj.quantity)
         return '{:.2f}'.format(price)
 
     def to_representation(self, instance):
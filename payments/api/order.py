@@ -9,6 +9,9 @@ from resources.models import Reservation
 
 from ..api.base import OrderLineSerializer, OrderSerializerBase
 from ..models import CustomerGroup, Order, OrderCustomerGroupData, OrderLine, Product, ProductCustomerGroup
+from ..pricing import PriceQuoter
+
+MAX_PRICE_QUOTES = 1000
 
 
 class PriceEndpointOrderSerializer(OrderSerializerBase):
@@ -52,6 +55,58 @@ class PriceEndpointOrderSerializer(OrderSerializerBase):
         return attrs
 
 
+class PriceQuoteSerializer(serializers.Serializer):
+    product = serializers.CharField()
+    begin = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    customer_group = serializers.CharField(required=False, allow_null=True, default=None)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, attrs):
+        if attrs['end'] <= attrs['begin']:
+            raise serializers.ValidationError(_('Begin time must be before end time'), code='invalid_date_range')
+        return attrs
+
+
+class PriceQuotationSerializer(serializers.Serializer):
+    quotes = PriceQuoteSerializer(many=True, allow_empty=False)
+
+    def validate_quotes(self, quotes):
+        if len(quotes) > MAX_PRICE_QUOTES:
+            raise serializers.ValidationError(
+                _('At most %(count)d quotes can be requested at once.') % {'count': MAX_PRICE_QUOTES}
+            )
+        return quotes
+
+    def validate(self, attrs):
+        quotes = attrs['quotes']
+        # resolve the products and customer groups of all the quotes at once
+        products = {
+            product.product_id: product
+            for product in Product.objects.current().filter(product_id__in={q['product'] for q in quotes})
+        }
+        customer_groups = set(CustomerGroup.objects.filter(
+            id__in={q['customer_group'] for q in quotes if q['customer_group']}
+        ).values_list('id', flat=True))
+
+        errors = []
+        for quote in quotes:
+            error = {}
+            product = products.get(quote['product'])
+            if not product:
+                error['product'] = _('Invalid product id.')
+            elif quote['quantity'] > product.max_quantity:
+                error['quantity'] = _('Cannot exceed max product quantity')
+            if quote['customer_group'] and quote['customer_group'] not in customer_groups:
+                error['customer_group'] = _('Invalid customer group id')
+            errors.append(error)
+            quote['product'] = product
+        if any(errors):
+            raise serializers.ValidationError({'quotes': errors})
+        attrs['products'] = list(products.values())
+        return attrs
+
+
 class OrderViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['POST'])
     def check_price(self, request):
@@ -96,5 +151,31 @@ class OrderViewSet(viewsets.ViewSet):
 
         return Response(order_data, status=200)
 
+    @action(detail=False, methods=['POST'])
+    def check_prices(self, request):
+        """Returns price quotes for many products, time ranges and customer groups at once"""
+        serializer = PriceQuotationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        quoter = PriceQuoter(serializer.validated_data['products'])
+        quotes = []
+        for quote in serializer.validated_data['quotes']:
+            product = quote['product']
+            prices = quoter.quote(
+                product, quote['begin'], quote['end'],
+                customer_group_id=quote['customer_group'], quantity=quote['quantity']
+            )
+            quotes.append({
+                'product': product.product_id,
+                'begin': quote['begin'],
+                'end': quote['end'],
+                'customer_group': quote['customer_group'],
+                'quantity': quote['quantity'],
+                'unit_price': str(prices['unit_price']),
+                'price': str(prices['price']),
+                'rounded_price': str(prices['rounded_price']),
+            })
+        return Response({'quotes': quotes}, status=200)
+
 
 register_view(OrderViewSet, 'order', 'order')
@@ -3,11 +3,18 @@ from rest_framework import serializers
 from resources.api.resource import ResourceDetailsSerializer, ResourceSerializer
 
 from .base import ProductSerializer
-from ..models import ARCHIVED_AT_NONE
+from ..models import ARCHIVED_AT_NONE, ResourcePriceSummary
+
+
+class ResourcePriceSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResourcePriceSummary
+        fields = ('customer_group', 'price_type', 'min_price', 'max_price')
 
 
 class PaymentsResourceSerializerMixin(serializers.ModelSerializer):
     products = serializers.SerializerMethodField()
+    price_summaries = ResourcePriceSummarySerializer(many=True, read_only=True)
 
     def get_products(self, obj):
         product_list = obj.products.all()
@@ -7,6 +7,7 @@ class PaymentsConfig(AppConfig):
 
     def ready(self):
         """Verify active payment provider configuration"""
+        import payments.signals
         if settings.RESPA_PAYMENTS_ENABLED:
             from .providers import load_provider_config
             load_provider_config()
@@ -1,9 +1,11 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.management.base import BaseCommand
-from django.db.transaction import atomic
+from django.db import connections
 
-from payments.models import Order
+from payments.models import EXPIRE_BATCH_SIZE, Order
 
 logger = logging.getLogger(__name__)
 
@@ -11,8 +13,36 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Sets too old orders from state "waiting" to state "expired".'
 
-    @atomic
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRE_BATCH_SIZE,
+                            help='Orders expired per transaction (default: %d)' % EXPIRE_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1, help='Batches expired in parallel (default: 1)')
+
+    def _expire_batch(self, order_ids, close_connection=False):
+        start = time.monotonic()
+        try:
+            expired = Order.objects.expire_batch(order_ids)
+        finally:
+            if close_connection:
+                # worker threads have database connections of their own
+                connections.close_all()
+        elapsed = time.monotonic() - start
+        logger.info('Expired %d of %d order(s) in %.2f s', expired, len(order_ids), elapsed)
+        return expired
+
     def handle(self, *args, **options):
         logger.info('Expiring too old unpaid orders...')
-        num_of_updated_orders = Order.objects.update_expired()
-        logger.info('Done, {} order(s) got expired.'.format(num_of_updated_orders))
+        start = time.monotonic()
+        batch_size = options['batch_size']
+        order_ids = Order.objects.get_expired_ids()
+        batches = [order_ids[i:i + batch_size] for i in range(0, len(order_ids), batch_size)]
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                expired = sum(executor.map(lambda batch: self._expire_batch(batch, close_connection=True), batches))
+        else:
+            expired = sum(self._expire_batch(batch) for batch in batches)
+
+        elapsed = time.monotonic() - start
+        logger.info('Done, {} order(s) got expired.'.format(expired))
+        self.stdout.write('Expired %d order(s) in %d batch(es) in %.2f s' % (expired, len(batches), elapsed))
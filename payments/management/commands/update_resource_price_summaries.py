@@ -0,0 +1,24 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from payments.models import ResourcePriceSummary
+from resources.models import Resource
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the price summaries of all resources.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Resources recalculated per transaction (default: 500)')
+
+    def handle(self, *args, **options):
+        resource_ids = list(Resource.objects.with_soft_deleted.values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for i in range(0, len(resource_ids), batch_size):
+            ResourcePriceSummary.objects.refresh(resource_ids[i:i + batch_size])
+        logger.info('Updated the price summaries of %d resources', len(resource_ids))
+        self.stdout.write('Updated the price summaries of %d resources' % len(resource_ids))
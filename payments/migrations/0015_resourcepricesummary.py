@@ -0,0 +1,37 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0159_reservationreminder_reminder_date_index'),
+        ('payments', '0014_customer_group_login_methods'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourcePriceSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_type', models.CharField(choices=[('per_period', 'per period'), ('fixed', 'fixed')], max_length=32, verbose_name='price type')),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Min price')),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Max price')),
+                ('customer_group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='payments.customergroup', verbose_name='Customer group')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_summaries', to='resources.resource', verbose_name='resource')),
+            ],
+            options={
+                'verbose_name': 'Resource price summary',
+                'verbose_name_plural': 'Resource price summaries',
+                'ordering': ('resource', 'customer_group', 'price_type'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resourcepricesummary',
+            constraint=models.UniqueConstraint(fields=('resource', 'customer_group', 'price_type'), name='payments_resourcepricesummary_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='resourcepricesummary',
+            constraint=models.UniqueConstraint(condition=models.Q(customer_group__isnull=True), fields=('resource', 'price_type'), name='payments_resourcepricesummary_unique_without_customer_group'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime, timedelta
 from decimal import ROUND_HALF_UP, Decimal
 
@@ -5,6 +6,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models, transaction, DatabaseError
+from django.db.models.signals import post_save
 from django.db.models import Case, DateTimeField, ExpressionWrapper, F, OuterRef, Q, Subquery, When
 from django.utils import translation
 from django.utils.formats import localize
@@ -16,14 +18,12 @@ from rest_framework import serializers
 from resources.models import Reservation, Resource
 from resources.models.base import AutoIdentifiedModel
 from resources.models.utils import generate_id, get_translated_fields
+from resources.signals import reservation_cancelled
 from modeltranslation.translator import NotRegistered, translator
 
 from .exceptions import OrderStateTransitionError
-from .utils import (
-    convert_aftertax_to_pretax, get_fixed_time_slot_price, get_price_period_display,
-    is_datetime_range_between_times, rounded, handle_customer_group_pricing, get_price_dict,
-    finalize_price_data, get_fixed_time_slot_prices
-)
+from .pricing import ProductPricing
+from .utils import convert_aftertax_to_pretax, get_price_period_display, rounded, handle_customer_group_pricing
 
 import logging
 
@@ -43,6 +43,9 @@ TAX_PERCENTAGES = [Decimal(x) for x in (
 
 DEFAULT_TAX_PERCENTAGE = Decimal('24.00')
 
+# Orders expired in one transaction
+EXPIRE_BATCH_SIZE = 100
+
 class CustomerGroupTimeSlotPrice(AutoIdentifiedModel):
     price = models.DecimalField(
         verbose_name=_('price including VAT'), max_digits=10, decimal_places=2,
@@ -385,6 +388,7 @@ class Product(models.Model):
         else:
             self.price_period = None
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
         if self.id:
             resources = self.resources.all()
@@ -420,6 +424,8 @@ class Product(models.Model):
 
     def delete(self, *args, **kwargs):
         Product.objects.filter(id=self.id).update(archived_at=now())
+        # archiving is an update, which does not send the signals the price summaries are refreshed on
+        ResourcePriceSummary.objects.refresh_on_commit(self.resources.values_list('id', flat=True))
 
     def fmt_price_period(self):
         total = int(self.price_period.total_seconds())
@@ -441,191 +447,37 @@ class Product(models.Model):
         return convert_aftertax_to_pretax(self.get_price_for_time_range(begin, end), self.tax_percentage)
 
     @rounded
-    def get_price_for_time_range(self, begin: datetime, end: datetime, product_cg = None) -> Decimal:
-        assert begin < end
+    def get_price_for_time_range(self, begin: datetime, end: datetime, product_cg = None,
+                                 pricing: ProductPricing = None) -> Decimal:
+        '''
+        Returns price for time range.
 
+        Time slot prices are loaded for each call unless already loaded
+        pricing of the product is given.
+        '''
+        assert begin < end
         price = self.price if not product_cg else product_cg.price
-        time_slot_prices = TimeSlotPrice.objects.filter(product=self)
-        tz = self.resources.with_soft_deleted.first().unit.get_tz()
-        local_tz_begin = begin.astimezone(tz)
-        local_tz_end = end.astimezone(tz)
-        if self.price_type == Product.PRICE_FIXED:
-            if time_slot_prices:
-                return get_fixed_time_slot_price(time_slot_prices, local_tz_begin, local_tz_end, self, price)
-            return price
-        elif self.price_type == Product.PRICE_PER_PERIOD:
-            if time_slot_prices:
-                slot_begin = local_tz_begin
-                check_interval = timedelta(minutes=5)
-                price_sum = 0
-                # calculate price for each time chunk and use their sum as final price
-                while slot_begin + check_interval <= local_tz_end:
-                    price_was_added = False
-                    for time_slot_price in time_slot_prices:
-                        if is_datetime_range_between_times(begin_x=slot_begin, end_x=slot_begin + check_interval,
-                            begin_y=time_slot_price.begin, end_y=time_slot_price.end):
-                                cg_time_slot_price = CustomerGroupTimeSlotPrice.objects.filter(
-                                    time_slot_price=time_slot_price, customer_group_id=self._in_memory_cg).first()
-                                slot_price = time_slot_price.price
-                                if cg_time_slot_price:
-                                    slot_price = cg_time_slot_price.price
-                                elif (ProductCustomerGroup.objects.filter(
-                                    product=self, customer_group_id=self._in_memory_cg).exists()
-                                    or hasattr(self, '_orderline_has_stored_pcg_price_for_non_null_cg')):
-                                    # customer group data exists for product but not for time slot ->
-                                    # use default pricing
-                                    break
-
-                                interval_price = slot_price * Decimal(check_interval / self.price_period)
-                                price_sum += interval_price
-                                price_was_added = True
-                                break
-
-                    if not price_was_added:
-                        # time chunk was not in any priced slot -> use default pricing
-                        interval_price = price * Decimal(check_interval / self.price_period)
-                        price_sum += interval_price
-                    slot_begin += check_interval
-                return Decimal(price_sum)
-
-            assert self.price_period, '{} {}'.format(self, self.price_period)
-            return price * Decimal((end - begin) / self.price_period)
-        else:
-            raise NotImplementedError('Cannot calculate price, unknown price type "{}".'.format(self.price_type))
+        pricing = pricing or ProductPricing.for_product(self)
+        return pricing.get_price(
+            begin, end, price,
+            customer_group_id=getattr(self, '_in_memory_cg', None),
+            has_stored_price=hasattr(self, '_orderline_has_stored_pcg_price_for_non_null_cg'),
+        )
 
-    def get_detailed_price_for_time_range(self, begin: datetime, end: datetime, product_cg = None, quantity = 0):
+    def get_detailed_price_for_time_range(self, begin: datetime, end: datetime, product_cg = None, quantity = 0,
+                                          pricing: ProductPricing = None):
         '''
         Returns dict containing detailed price data for time range.
         '''
         assert begin < end
         price = self.price if not product_cg else product_cg.price
         price_tax_free = self.price_tax_free if not product_cg else product_cg.price_tax_free
-        time_slot_prices = TimeSlotPrice.objects.filter(product=self)
-        tz = self.resources.with_soft_deleted.first().unit.get_tz()
-        local_tz_begin = begin.astimezone(tz)
-        local_tz_end = end.astimezone(tz)
-        # dict with keys for each unique price.
-        detailed_pricing = {}
-        if self.price_type == Product.PRICE_FIXED:
-            # fixed price product
-            fixed_slot_price = self.price
-            fixed_taxfree = self.price_tax_free
-            key = 'default_fixed'
-            if time_slot_prices:
-                # fixed price product with added time slot pricing
-                # price with VAT, price without VAT
-                fixed_slot_price, fixed_taxfree = get_fixed_time_slot_prices(
-                    time_slot_prices=time_slot_prices,
-                    begin=local_tz_begin,
-                    end=local_tz_end,
-                    product=self,
-                    default_price=price,
-                    default_price_taxfree=price_tax_free
-                    )
-                key = 'custom_fixed'
-
-            detailed_pricing[key] = get_price_dict(
-                count=quantity,
-                price=fixed_slot_price,
-                pretax=self.get_pretax_price_context(fixed_slot_price, rounded=False),
-                fixed=True,
-                taxfree_price=fixed_taxfree
-            )
-
-            # return detailed pricing for this fixed price product.
-            return detailed_pricing
-        elif self.price_type == Product.PRICE_PER_PERIOD:
-            # per period product
-            if time_slot_prices:
-                # per period product with added time slot pricing
-                slot_begin = local_tz_begin
-                check_interval = timedelta(minutes=5)
-
-                # calculate price for each time chunk
-                while slot_begin + check_interval <= local_tz_end:
-                    price_was_added = False
-                    for time_slot_price in time_slot_prices:
-                        if is_datetime_range_between_times(begin_x=slot_begin, end_x=slot_begin + check_interval,
-                            begin_y=time_slot_price.begin, end_y=time_slot_price.end):
-                                cg_time_slot_price = CustomerGroupTimeSlotPrice.objects.filter(
-                                    time_slot_price=time_slot_price, customer_group_id=self._in_memory_cg).first()
-                                slot_price = time_slot_price.price
-                                tax_free_price = time_slot_price.price_tax_free
-                                if cg_time_slot_price:
-                                    # cg time slot pricing exists -> use its prices.
-                                    slot_price = cg_time_slot_price.price
-                                    tax_free_price = cg_time_slot_price.price_tax_free
-                                elif (ProductCustomerGroup.objects.filter(
-                                    product=self, customer_group_id=self._in_memory_cg).exists()
-                                    or hasattr(self, '_orderline_has_stored_pcg_price_for_non_null_cg')):
-                                    # customer group data exists for product but not for time slot ->
-                                    # use default pricing
-                                    break
-
-                                if time_slot_price.id in detailed_pricing:
-                                    detailed_pricing[time_slot_price.id]['count'] += 1
-                                if time_slot_price.id not in detailed_pricing:
-                                    detailed_pricing[time_slot_price.id] = get_price_dict(
-                                        count=1,
-                                        price=slot_price,
-                                        pretax=self.get_pretax_price_context(slot_price,rounded=False),
-                                        begin=time_slot_price.begin.isoformat('minutes'),
-                                        end=time_slot_price.end.isoformat('minutes'),
-                                        taxfree_price=tax_free_price
-                                    )
-                                    if quantity > 1:
-                                        # quantity is > 1 if there are multiples of the same product
-                                        detailed_pricing[time_slot_price.id]['quantity'] = quantity
-
-                                price_was_added = True
-                                break
-
-                    if not price_was_added:
-                        # time chunk was not in any priced slot -> use default pricing
-                        # default already exists? +1 to count
-                        if 'default' in detailed_pricing:
-                            detailed_pricing['default']['count'] += 1
-                        if 'default' not in detailed_pricing:
-                            # first occurrence of default? -> add default to inner_price
-                            detailed_pricing['default'] = get_price_dict(
-                                count=1,
-                                price=price,
-                                pretax=self.get_pretax_price_context(price, rounded=False),
-                                taxfree_price=price_tax_free
-                            )
-                            if quantity > 1:
-                                # quantity is only defined/>1 if there are multiples of the same product
-                                detailed_pricing['default']['quantity'] = quantity
-
-                    slot_begin += check_interval
-                # finalize the detailed_pricing so that it contains totals.
-                detailed_pricing = finalize_price_data(detailed_pricing, self.price_type, self.price_period)
-                # return detailed pricing for this per period product that contains time slot specific pricing.
-                return detailed_pricing
-
-            # per period product with no time slot prices -> use default.
-            slot_begin = local_tz_begin
-            check_interval = timedelta(minutes=5)
-            while slot_begin + check_interval <= local_tz_end:
-                if 'default' in detailed_pricing:
-                    detailed_pricing['default']['count'] += 1
-                else:
-                    detailed_pricing['default'] = get_price_dict(
-                        count=1,
-                        price=price,
-                        pretax=self.get_pretax_price_context(price, rounded=False),
-                        taxfree_price=self.price_tax_free
-                    )
-                    if quantity > 1:
-                        # quantity is only defined/>1 if there are multiples of the same product
-                        detailed_pricing['default']['quantity'] = quantity
-                slot_begin += check_interval
-
-            detailed_pricing = finalize_price_data(detailed_pricing, self.price_type, self.price_period)
-            # return detailed_pricing for this per period product that has no time slot specific pricing.
-            return detailed_pricing
-        else:
-            raise NotImplementedError('Cannot calculate detailed pricing, unknown price type "{}".'.format(self.price_type))
+        pricing = pricing or ProductPricing.for_product(self)
+        return pricing.get_detailed_price(
+            begin, end, price, price_tax_free, quantity=quantity,
+            customer_group_id=getattr(self, '_in_memory_cg', None),
+            has_stored_price=hasattr(self, '_orderline_has_stored_pcg_price_for_non_null_cg'),
+        )
 
     def get_pretax_price_for_reservation(self, reservation: Reservation, rounded: bool = True) -> Decimal:
         return self.get_pretax_price_for_time_range(reservation.begin, reservation.end, rounded=rounded)
@@ -662,6 +514,95 @@ class Product(models.Model):
         return True
 
 
+# resources whose price summaries are refreshed when the transaction commits
+_pending_price_summaries = threading.local()
+
+
+class ResourcePriceSummaryQuerySet(models.QuerySet):
+    def refresh_on_commit(self, resource_ids):
+        """
+        Recalculates the price summaries of the given resources once the
+        current transaction is committed
+
+        Saving a product saves its resources, customer groups and time slot
+        prices one by one, so the resources are collected and refreshed
+        together instead of once per change.
+
+        :type resource_ids: iterable[str]
+        """
+        pending = getattr(_pending_price_summaries, 'resource_ids', None)
+        if pending is None:
+            pending = _pending_price_summaries.resource_ids = set()
+        pending.update(resource_ids)
+        # only the first callback of the transaction finds resources to refresh
+        transaction.on_commit(self._refresh_pending)
+
+    def _refresh_pending(self):
+        resource_ids = getattr(_pending_price_summaries, 'resource_ids', None)
+        _pending_price_summaries.resource_ids = set()
+        if resource_ids:
+            self.refresh(resource_ids)
+
+    def refresh(self, resource_ids):
+        """
+        Recalculates the price summaries of the given resources
+
+        :type resource_ids: iterable[str]
+        """
+        from .pricing import get_resource_price_summaries
+
+        resource_ids = set(resource_ids)
+        if not resource_ids:
+            return
+        with transaction.atomic():
+            # concurrent refreshes of the same resources wait for each other,
+            # in the same order to avoid deadlocks
+            list(Resource._base_manager.select_for_update().filter(pk__in=resource_ids).order_by('pk')
+                 .values_list('pk', flat=True))
+            self.filter(resource__in=resource_ids).delete()
+            self.bulk_create(get_resource_price_summaries(resource_ids))
+
+
+class ResourcePriceSummary(models.Model):
+    """
+    Lowest and highest price of the rent products of a resource
+
+    Summaries are kept per customer group and price type, with customer
+    group None for the prices without one. Per period prices are prices
+    per hour. The summaries are refreshed whenever the products or their
+    prices change, so resource listings need not price the products.
+    """
+    resource = models.ForeignKey(Resource, verbose_name=_('resource'), related_name='price_summaries',
+                                 on_delete=models.CASCADE)
+    customer_group = models.ForeignKey(CustomerGroup, verbose_name=_('Customer group'), related_name='+',
+                                       null=True, blank=True, on_delete=models.CASCADE)
+    price_type = models.CharField(max_length=32, verbose_name=_('price type'), choices=Product.PRICE_TYPE_CHOICES)
+    min_price = models.DecimalField(verbose_name=_('Min price'), max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(verbose_name=_('Max price'), max_digits=10, decimal_places=2)
+
+    objects = ResourcePriceSummaryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Resource price summary')
+        verbose_name_plural = _('Resource price summaries')
+        ordering = ('resource', 'customer_group', 'price_type')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resource', 'customer_group', 'price_type'],
+                name='payments_resourcepricesummary_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['resource', 'price_type'], condition=Q(customer_group__isnull=True),
+                name='payments_resourcepricesummary_unique_without_customer_group',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {} {}: {}-{}'.format(
+            self.resource_id, self.customer_group_id or '-', self.price_type, self.min_price, self.max_price
+        )
+
+
 class OrderQuerySet(models.QuerySet):
     def can_view(self, user):
         if not user.is_authenticated:
@@ -672,7 +613,10 @@ class OrderQuerySet(models.QuerySet):
 
         return self.filter(reservation__in=allowed_reservations)
 
-    def update_expired(self) -> int:
+    def get_expired_ids(self) -> list:
+        """
+        Returns the ids of the waiting orders whose time to pay has run out
+        """
         earliest_allowed_timestamp = now() - timedelta(minutes=settings.RESPA_PAYMENTS_PAYMENT_WAITING_TIME)
         log_entry_timestamps = OrderLogEntry.objects.filter(order=OuterRef('pk')).order_by('id').values('timestamp')
         # Expire only online payments. Cash payments should not expire.
@@ -687,9 +631,6 @@ class OrderQuerySet(models.QuerySet):
         ).filter(
             created_at__lt=earliest_allowed_timestamp
         )
-        for order in too_old_waiting_orders:
-            order.set_state(Order.EXPIRED)
-
         time_now = now()
         earliest_allowed_requested = time_now - timedelta(hours=settings.RESPA_PAYMENTS_PAYMENT_REQUESTED_WAITING_TIME)
 
@@ -717,9 +658,6 @@ class OrderQuerySet(models.QuerySet):
             )
         )
 
-        for order in too_old_ready_requested_orders:
-            order.set_state(Order.EXPIRED)
-
         # set requested orders which customer has tried to pay to expire faster
         too_old_waiting_requested_orders = self.filter(
             state=Order.WAITING,
@@ -733,11 +671,80 @@ class OrderQuerySet(models.QuerySet):
             last_modified_at__lt=earliest_allowed_timestamp
         )
 
-        for order in too_old_waiting_requested_orders:
-            order.set_state(Order.EXPIRED)
+        order_ids = set()
+        for orders in (too_old_waiting_orders, too_old_ready_requested_orders, too_old_waiting_requested_orders):
+            order_ids.update(orders.values_list('id', flat=True))
+        return sorted(order_ids)
 
-        return too_old_waiting_orders.count() + too_old_ready_requested_orders.count() \
-                + too_old_waiting_requested_orders.count()
+    def expire_batch(self, order_ids) -> int:
+        """
+        Expires the given orders that are still waiting and cancels their reservations
+
+        Orders are updated in bulk in one transaction. Orders locked by
+        another transaction are skipped, so batches can be expired in
+        parallel with each other and with payment callbacks.
+
+        :type order_ids: list[int]
+        :return: the number of orders expired
+        """
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(id__in=order_ids, state=Order.WAITING)
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('reservation__resource', 'reservation__user')
+            )
+            if not orders:
+                return 0
+
+            Order.objects.filter(id__in=[order.id for order in orders]).update(state=Order.EXPIRED)
+            OrderLogEntry.objects.bulk_create([
+                OrderLogEntry(order=order, state_change=Order.EXPIRED) for order in orders
+            ])
+            for order in orders:
+                order.state = Order.EXPIRED
+
+            reservations = [order.reservation for order in orders]
+            previous_states = {reservation.id: reservation.state for reservation in reservations}
+            for reservation in reservations:
+                reservation_cancelled.send(sender=Reservation, instance=reservation, user=reservation.user)
+            modified_at = now()
+            Reservation.objects.filter(id__in=previous_states).update(
+                state=Reservation.CANCELLED, modified_at=modified_at
+            )
+
+            resources = {}
+            for reservation in reservations:
+                reservation.state = Reservation.CANCELLED
+                reservation.modified_at = modified_at
+                resources.setdefault(reservation.resource_id, []).append(reservation)
+            for resource_reservations in resources.values():
+                resource_reservations[0].resource.update_free_intervals(
+                    min(r.begin for r in resource_reservations), max(r.end for r in resource_reservations)
+                )
+            for reservation in reservations:
+                # the reservations were updated in bulk, which does not send
+                # post_save that the calendar integrations listen to
+                reservation._free_intervals_updated = True
+                post_save.send(sender=Reservation, instance=reservation, created=False,
+                               update_fields=None, raw=False, using=reservation._state.db)
+                # with RESPA_NOTIFICATION_OUTBOX_ENABLED the mails are queued
+                # in this transaction and sent by send_notifications
+                reservation.handle_notification(
+                    Reservation.CANCELLED, reservation.user, previous_states[reservation.id]
+                )
+        return len(orders)
+
+    def update_expired(self, batch_size: int = EXPIRE_BATCH_SIZE) -> int:
+        """
+        Expires the waiting orders whose time to pay has run out, in batches
+
+        :return: the number of orders expired
+        """
+        order_ids = self.get_expired_ids()
+        return sum(
+            self.expire_batch(order_ids[i:i + batch_size])
+            for i in range(0, len(order_ids), batch_size)
+        )
 
 
 class Order(models.Model):
@@ -0,0 +1,438 @@
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import models
+
+from .utils import finalize_price_data, get_detailed_price_total, get_price_dict, round_price
+
+# Prices for time ranges are counted in chunks of this length. A trailing
+# part of the range shorter than a chunk is not priced.
+PRICE_CHUNK = timedelta(minutes=5)
+CHUNKS_PER_DAY = timedelta(days=1) // PRICE_CHUNK
+
+
+def get_time_slot_duration(time_slot_price):
+    today = date.today()
+    return datetime.combine(today, time_slot_price.end) - datetime.combine(today, time_slot_price.begin)
+
+
+class ProductPricing:
+    '''
+    Calculates the prices of a product for time ranges
+
+    The time slot prices, their customer group prices and the customer groups
+    of the product are loaded once, so any number of time ranges can be
+    priced without further queries.
+
+    A per period price is the sum of the prices of the five minute chunks of
+    the time range. Each chunk is priced by the first time slot it is within
+    by time of day. The chunks that start at the same time of day get the
+    same price, so only the chunks of the first day of the range are looked
+    at, and each price is counted once for all the days.
+    '''
+
+    def __init__(self, product, time_slot_prices, customer_group_time_slot_prices, customer_group_ids, tz=None):
+        '''
+        :type product: payments.models.Product
+        :type time_slot_prices: list[payments.models.TimeSlotPrice] in the order they are tried
+        :type customer_group_time_slot_prices: iterable[payments.models.CustomerGroupTimeSlotPrice]
+        :param customer_group_ids: ids of the customer groups the product has prices for
+        :param tz: time zone of the product's unit, looked up when needed if not given
+        '''
+        self.product = product
+        self.time_slot_prices = list(time_slot_prices)
+        self.customer_group_time_slot_prices = {
+            (cg_price.time_slot_price_id, cg_price.customer_group_id): cg_price
+            for cg_price in customer_group_time_slot_prices
+        }
+        self.customer_group_ids = set(customer_group_ids)
+        self._tz = tz
+
+    @classmethod
+    def for_product(cls, product, tz=None):
+        from .models import CustomerGroupTimeSlotPrice, ProductCustomerGroup, TimeSlotPrice
+
+        time_slot_prices = list(TimeSlotPrice.objects.filter(product=product))
+        return cls(
+            product,
+            time_slot_prices,
+            CustomerGroupTimeSlotPrice.objects.filter(time_slot_price__in=time_slot_prices),
+            ProductCustomerGroup.objects.filter(product=product).values_list('customer_group_id', flat=True),
+            tz=tz,
+        )
+
+    @property
+    def tz(self):
+        if self._tz is None:
+            self._tz = self.product.resources.with_soft_deleted.first().unit.get_tz()
+        return self._tz
+
+    def has_customer_group_data(self, customer_group_id, has_stored_price=False):
+        '''
+        Whether the product has its own prices for the customer group, so
+        time slots without prices for the group are not used
+        '''
+        return customer_group_id in self.customer_group_ids or has_stored_price
+
+    def get_fixed_time_slot_price(self, begin, end, customer_group_id=None, has_stored_price=False):
+        '''
+        Returns the time slot price and the customer group time slot price
+        used for a fixed price product, or None to use the default price
+
+        Of the time slots the whole time range is within, the shortest one is
+        used, preferring the ones with a price for the customer group.
+
+        :rtype: tuple[TimeSlotPrice, CustomerGroupTimeSlotPrice | None] | None
+        '''
+        begin_time = begin.astimezone(self.tz).time()
+        end_time = end.astimezone(self.tz).time()
+        time_slot_prices = [
+            time_slot_price for time_slot_price in self.time_slot_prices
+            if time_slot_price.begin <= begin_time and time_slot_price.end >= end_time
+        ]
+        if customer_group_id:
+            with_customer_group = [
+                time_slot_price for time_slot_price in time_slot_prices
+                if (time_slot_price.id, customer_group_id) in self.customer_group_time_slot_prices
+            ]
+            if with_customer_group:
+                time_slot_prices = with_customer_group
+            elif self.has_customer_group_data(customer_group_id, has_stored_price):
+                return None
+        if not time_slot_prices:
+            return None
+
+        time_slot_price = time_slot_prices[0]
+        for other in time_slot_prices[1:]:
+            if get_time_slot_duration(other) < get_time_slot_duration(time_slot_price):
+                time_slot_price = other
+        return time_slot_price, self.customer_group_time_slot_prices.get((time_slot_price.id, customer_group_id))
+
+    def _get_chunk_time_slot_price(self, chunk_begin, customer_group_id, has_customer_group_data):
+        begin_time = chunk_begin.time()
+        end_time = (chunk_begin + PRICE_CHUNK).time()
+        for time_slot_price in self.time_slot_prices:
+            if (time_slot_price.begin <= begin_time <= time_slot_price.end
+                    and time_slot_price.begin <= end_time <= time_slot_price.end):
+                cg_price = self.customer_group_time_slot_prices.get((time_slot_price.id, customer_group_id))
+                if cg_price:
+                    return time_slot_price, cg_price
+                if has_customer_group_data:
+                    # customer group data exists for product but not for time slot ->
+                    # use default pricing
+                    return None
+                return time_slot_price, None
+        return None
+
+    def get_chunk_counts(self, begin, end, customer_group_id=None, has_stored_price=False):
+        '''
+        Returns how many chunks of the time range each time slot prices
+
+        Items are (time slot price, customer group time slot price, count)
+        tuples in the order the prices first occur in the time range, time
+        slot price being None for the chunks priced by the default price.
+
+        :rtype: list[tuple[TimeSlotPrice | None, CustomerGroupTimeSlotPrice | None, int]]
+        '''
+        local_begin = begin.astimezone(self.tz)
+        chunk_count = (end - begin) // PRICE_CHUNK
+        days, remainder = divmod(chunk_count, CHUNKS_PER_DAY)
+        has_customer_group_data = self.has_customer_group_data(customer_group_id, has_stored_price)
+
+        counts = OrderedDict()
+        for i in range(min(chunk_count, CHUNKS_PER_DAY)):
+            # chunks are stepped in the offset of the beginning, as they always have been
+            prices = self._get_chunk_time_slot_price(
+                local_begin + i * PRICE_CHUNK, customer_group_id, has_customer_group_data
+            ) or (None, None)
+            key = prices[0].id if prices[0] else None
+            count = days + (1 if i < remainder else 0)
+            if key in counts:
+                counts[key][2] += count
+            else:
+                counts[key] = [prices[0], prices[1], count]
+        return [tuple(item) for item in counts.values()]
+
+    def get_price(self, begin, end, price, customer_group_id=None, has_stored_price=False) -> Decimal:
+        '''
+        Returns the unrounded price of the product for the time range
+
+        :param price: the default price, of the product or its customer group
+        '''
+        product = self.product
+        if product.price_type == product.PRICE_FIXED:
+            if self.time_slot_prices:
+                prices = self.get_fixed_time_slot_price(begin, end, customer_group_id, has_stored_price)
+                if prices:
+                    time_slot_price, cg_price = prices
+                    return Decimal((cg_price or time_slot_price).price)
+                return Decimal(price)
+            return price
+        elif product.price_type == product.PRICE_PER_PERIOD:
+            if self.time_slot_prices:
+                chunk_share = Decimal(PRICE_CHUNK / product.price_period)
+                price_sum = 0
+                for time_slot_price, cg_price, count in self.get_chunk_counts(
+                        begin, end, customer_group_id, has_stored_price):
+                    slot_price = (cg_price or time_slot_price).price if time_slot_price else price
+                    price_sum += count * (slot_price * chunk_share)
+                return Decimal(price_sum)
+
+            assert product.price_period, '{} {}'.format(product, product.price_period)
+            return price * Decimal((end - begin) / product.price_period)
+        else:
+            raise NotImplementedError('Cannot calculate price, unknown price type "{}".'.format(product.price_type))
+
+    def get_detailed_price(self, begin, end, price, price_tax_free, quantity=0,
+                           customer_group_id=None, has_stored_price=False):
+        '''
+        Returns dict containing detailed price data for time range.
+
+        :param price: the default price, of the product or its customer group
+        :param price_tax_free: the default price without VAT
+        '''
+        product = self.product
+        detailed_pricing = {}
+        if product.price_type == product.PRICE_FIXED:
+            # fixed price product
+            fixed_slot_price = product.price
+            fixed_taxfree = product.price_tax_free
+            key = 'default_fixed'
+            if self.time_slot_prices:
+                # fixed price product with added time slot pricing
+                fixed_slot_price, fixed_taxfree = Decimal(price), Decimal(price_tax_free)
+                prices = self.get_fixed_time_slot_price(begin, end, customer_group_id, has_stored_price)
+                if prices:
+                    slot_price = prices[1] or prices[0]
+                    fixed_slot_price, fixed_taxfree = Decimal(slot_price.price), Decimal(slot_price.price_tax_free)
+                key = 'custom_fixed'
+
+            detailed_pricing[key] = get_price_dict(
+                count=quantity,
+                price=fixed_slot_price,
+                pretax=product.get_pretax_price_context(fixed_slot_price, rounded=False),
+                fixed=True,
+                taxfree_price=fixed_taxfree
+            )
+            return detailed_pricing
+        elif product.price_type == product.PRICE_PER_PERIOD:
+            if self.time_slot_prices:
+                counts = self.get_chunk_counts(begin, end, customer_group_id, has_stored_price)
+            else:
+                # per period product with no time slot prices -> use default.
+                counts = [(None, None, (end - begin) // PRICE_CHUNK)] if end - begin >= PRICE_CHUNK else []
+                price_tax_free = product.price_tax_free
+
+            for time_slot_price, cg_price, count in counts:
+                if time_slot_price:
+                    slot_price = cg_price or time_slot_price
+                    detailed_pricing[time_slot_price.id] = get_price_dict(
+                        count=count,
+                        price=slot_price.price,
+                        pretax=product.get_pretax_price_context(slot_price.price, rounded=False),
+                        begin=time_slot_price.begin.isoformat('minutes'),
+                        end=time_slot_price.end.isoformat('minutes'),
+                        taxfree_price=slot_price.price_tax_free
+                    )
+                    key = time_slot_price.id
+                else:
+                    detailed_pricing['default'] = get_price_dict(
+                        count=count,
+                        price=price,
+                        pretax=product.get_pretax_price_context(price, rounded=False),
+                        taxfree_price=price_tax_free
+                    )
+                    key = 'default'
+                if quantity > 1:
+                    # quantity is only defined/>1 if there are multiples of the same product
+                    detailed_pricing[key]['quantity'] = quantity
+
+            # finalize the detailed_pricing so that it contains totals.
+            return finalize_price_data(detailed_pricing, product.price_type, product.price_period)
+        else:
+            raise NotImplementedError(
+                'Cannot calculate detailed pricing, unknown price type "{}".'.format(product.price_type)
+            )
+
+
+class PriceQuoter:
+    '''
+    Quotes prices of products for time ranges and customer groups
+
+    The pricing data of all the products, their customer group prices and
+    the time zones of their units are loaded once, and each distinct quote
+    is calculated only once.
+    '''
+
+    def __init__(self, products):
+        '''
+        :type products: iterable[payments.models.Product]
+        '''
+        from resources.models import Resource
+        from .models import CustomerGroupTimeSlotPrice, ProductCustomerGroup, TimeSlotPrice
+
+        products = {product.id: product for product in products}
+        time_slot_prices = defaultdict(list)
+        for time_slot_price in TimeSlotPrice.objects.filter(product__in=products):
+            time_slot_prices[time_slot_price.product_id].append(time_slot_price)
+        cg_time_slot_prices = defaultdict(list)
+        for cg_price in CustomerGroupTimeSlotPrice.objects.filter(
+                time_slot_price__product__in=products).select_related('time_slot_price'):
+            cg_time_slot_prices[cg_price.time_slot_price.product_id].append(cg_price)
+        self.product_customer_groups = {
+            (product_cg.product_id, product_cg.customer_group_id): product_cg
+            for product_cg in ProductCustomerGroup.objects.filter(product__in=products)
+        }
+        customer_group_ids = defaultdict(list)
+        for product_id, customer_group_id in self.product_customer_groups:
+            customer_group_ids[product_id].append(customer_group_id)
+        # the time zone of a product is the one of its first resource's unit
+        time_zones = {}
+        resources = Resource.objects.with_soft_deleted.filter(products__in=products) \
+            .select_related('unit').annotate(product_pk=models.F('products'))
+        for resource in resources:
+            if resource.product_pk not in time_zones:
+                time_zones[resource.product_pk] = resource.unit.get_tz()
+
+        self.pricings = {
+            product_id: ProductPricing(
+                product, time_slot_prices[product_id], cg_time_slot_prices[product_id],
+                customer_group_ids[product_id], tz=time_zones.get(product_id)
+            )
+            for product_id, product in products.items()
+        }
+        self._quotes = {}
+
+    def quote(self, product, begin, end, customer_group_id=None, quantity=1):
+        '''
+        Returns the price of the product for the time range
+
+        Prices are the ones of the price check endpoint: the unit price, the
+        unrounded price of the quantity and the rounded total of the detailed
+        price.
+
+        :type product: payments.models.Product
+        :rtype: dict
+        '''
+        key = (product.id, begin, end, customer_group_id, quantity)
+        if key not in self._quotes:
+            self._quotes[key] = self._get_quote(product, begin, end, customer_group_id, quantity)
+        return self._quotes[key]
+
+    def _get_quote(self, product, begin, end, customer_group_id, quantity):
+        assert begin < end
+        pricing = self.pricings[product.id]
+        product_cg = self.product_customer_groups.get((product.id, customer_group_id))
+        price = product_cg.price if product_cg else product.price
+        price_tax_free = product_cg.price_tax_free if product_cg else product.price_tax_free
+
+        unit_price = pricing.get_price(begin, end, price, customer_group_id=customer_group_id)
+        detailed_price = pricing.get_detailed_price(
+            begin, end, price, price_tax_free, quantity=quantity, customer_group_id=customer_group_id
+        )
+        return {
+            'unit_price': round_price(unit_price),
+            'price': unit_price * quantity,
+            # formatted like the rounded price of order lines
+            'rounded_price': Decimal(
+                get_detailed_price_total(detailed_price, product.price_type, quantity)
+            ).quantize(Decimal('0.01')),
+        }
+
+
+def get_product_price_ranges(product, time_slot_prices, customer_group_time_slot_prices, product_customer_groups):
+    '''
+    Returns the lowest and highest price of the product per customer group
+
+    The prices are the default price and the prices of the time slots, as
+    they are used for the customer group. Per period prices are converted
+    to prices per hour.
+
+    :type product: payments.models.Product
+    :type time_slot_prices: list[payments.models.TimeSlotPrice]
+    :param customer_group_time_slot_prices: customer group time slot prices by (time slot id, customer group id)
+    :param product_customer_groups: product customer groups by customer group id
+    :return: (min price, max price) by customer group id, None for the prices without customer group
+    :rtype: dict[str | None, tuple[Decimal, Decimal]]
+    '''
+    customer_group_ids = {None} | set(product_customer_groups) | {
+        customer_group_id for _, customer_group_id in customer_group_time_slot_prices
+    }
+    ranges = {}
+    for customer_group_id in customer_group_ids:
+        product_cg = product_customer_groups.get(customer_group_id)
+        prices = [product_cg.price if product_cg else product.price]
+        for time_slot_price in time_slot_prices:
+            cg_price = customer_group_time_slot_prices.get((time_slot_price.id, customer_group_id))
+            if cg_price:
+                prices.append(cg_price.price)
+            elif not product_cg:
+                # with customer group prices of its own the product uses its
+                # default price for the time slots without a price for the group
+                prices.append(time_slot_price.price)
+        if product.price_type == product.PRICE_PER_PERIOD and product.price_period:
+            per_hour = Decimal(timedelta(hours=1) / product.price_period)
+            prices = [round_price(price * per_hour) for price in prices]
+        ranges[customer_group_id] = (min(prices), max(prices))
+    return ranges
+
+
+def get_resource_price_summaries(resource_ids):
+    '''
+    Returns the price summaries of the current rent products of the resources
+
+    A resource has a summary for every customer group any of its products
+    has prices for. Products without prices for the group are included
+    with their prices without customer group.
+
+    :type resource_ids: iterable[str]
+    :rtype: list[payments.models.ResourcePriceSummary]
+    '''
+    from .models import (
+        CustomerGroupTimeSlotPrice, Product, ProductCustomerGroup, ResourcePriceSummary, TimeSlotPrice
+    )
+
+    resource_products = Product.resources.through.objects.filter(
+        resource__in=resource_ids, product__in=Product.objects.current().rents()
+    ).values_list('resource_id', 'product_id')
+    product_ids = {product_id for _, product_id in resource_products}
+    products = Product.objects.in_bulk(product_ids)
+    time_slot_prices = defaultdict(list)
+    for time_slot_price in TimeSlotPrice.objects.filter(product__in=product_ids):
+        time_slot_prices[time_slot_price.product_id].append(time_slot_price)
+    cg_time_slot_prices = defaultdict(dict)
+    for cg_price in CustomerGroupTimeSlotPrice.objects.filter(
+            time_slot_price__product__in=product_ids).select_related('time_slot_price'):
+        cg_time_slot_prices[cg_price.time_slot_price.product_id][
+            (cg_price.time_slot_price_id, cg_price.customer_group_id)] = cg_price
+    product_customer_groups = defaultdict(dict)
+    for product_cg in ProductCustomerGroup.objects.filter(product__in=product_ids):
+        product_customer_groups[product_cg.product_id][product_cg.customer_group_id] = product_cg
+
+    price_ranges = {
+        product_id: get_product_price_ranges(
+            product, time_slot_prices[product_id], cg_time_slot_prices[product_id],
+            product_customer_groups[product_id]
+        )
+        for product_id, product in products.items()
+    }
+    products_by_resource = defaultdict(list)
+    for resource_id, product_id in resource_products:
+        products_by_resource[resource_id].append(products[product_id])
+
+    summaries = []
+    for resource_id, resource_products in products_by_resource.items():
+        customer_group_ids = set().union(*(price_ranges[product.id] for product in resource_products))
+        for customer_group_id in customer_group_ids:
+            ranges = defaultdict(list)
+            for product in resource_products:
+                product_ranges = price_ranges[product.id]
+                ranges[product.price_type].append(product_ranges.get(customer_group_id, product_ranges[None]))
+            for price_type, price_type_ranges in ranges.items():
+                summaries.append(ResourcePriceSummary(
+                    resource_id=resource_id, customer_group_id=customer_group_id, price_type=price_type,
+                    min_price=min(low for low, _ in price_type_ranges),
+                    max_price=max(high for _, high in price_type_ranges),
+                ))
+    return summaries
@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+
+def refresh_price_summaries(product_ids):
+    from .models import Product, ResourcePriceSummary
+
+    ResourcePriceSummary.objects.refresh_on_commit(
+        Product.resources.through.objects.filter(product__in=product_ids).values_list('resource_id', flat=True)
+    )
+
+
+@receiver(post_save, sender='payments.TimeSlotPrice')
+@receiver(post_delete, sender='payments.TimeSlotPrice')
+def refresh_price_summaries_on_time_slot_price_change(sender, instance, **kwargs):
+    # archived time slot prices are copies of the previous versions of products
+    if not instance.is_archived:
+        refresh_price_summaries([instance.product_id])
+
+
+@receiver(post_save, sender='payments.CustomerGroupTimeSlotPrice')
+@receiver(post_delete, sender='payments.CustomerGroupTimeSlotPrice')
+def refresh_price_summaries_on_customer_group_time_slot_price_change(sender, instance, **kwargs):
+    from .models import TimeSlotPrice
+
+    refresh_price_summaries(TimeSlotPrice.objects.filter(
+        id=instance.time_slot_price_id, is_archived=False
+    ).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender='payments.ProductCustomerGroup')
+@receiver(post_delete, sender='payments.ProductCustomerGroup')
+def refresh_price_summaries_on_product_customer_group_change(sender, instance, **kwargs):
+    if instance.product_id:
+        refresh_price_summaries([instance.product_id])
+
+
+@receiver(m2m_changed, sender='payments.Product_resources')
+def refresh_price_summaries_on_product_resources_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh the resources a product is added to or removed from
+
+    New versions of a product get the resources of the previous version
+    only after being saved, so this also refreshes the resources of
+    products whose prices change.
+    """
+    from .models import ResourcePriceSummary
+
+    if action == 'pre_clear':
+        # the cleared resources are not known after clearing
+        instance._cleared_price_summary_ids = (
+            [instance.pk] if reverse else list(instance.resources.values_list('id', flat=True))
+        )
+    elif action == 'post_clear':
+        ResourcePriceSummary.objects.refresh_on_commit(getattr(instance, '_cleared_price_summary_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        ResourcePriceSummary.objects.refresh_on_commit([instance.pk] if reverse else pk_set)
@@ -146,3 +146,28 @@ def test_waiting_for_cash_payment_reservations_dont_get_expired(order_with_produ
     order_with_products.refresh_from_db()
     assert order_with_products.state == Order.WAITING
     assert order_with_products.reservation.state == Reservation.WAITING_FOR_CASH_PAYMENT
+
+
+def test_orders_get_expired_in_batches(resource_in_unit, user):
+    orders = []
+    for i in range(5):
+        reservation = Reservation.objects.create(
+            resource=resource_in_unit, user=user,
+            begin=now() + timedelta(days=i + 1), end=now() + timedelta(days=i + 1, hours=1),
+        )
+        order = OrderFactory(reservation=reservation, state=Order.WAITING, order_number='order-%d' % i)
+        set_order_created_at(order, get_order_expired_time())
+        orders.append(order)
+    set_order_created_at(orders[-1], get_order_not_expired_time())
+
+    assert Order.objects.update_expired(batch_size=2) == 4
+    # the orders are expired only once
+    assert Order.objects.update_expired(batch_size=2) == 0
+
+    for order in orders:
+        order.refresh_from_db()
+        order.reservation.refresh_from_db()
+    assert [order.state for order in orders] == [Order.EXPIRED] * 4 + [Order.WAITING]
+    assert [order.reservation.state for order in orders] == [Reservation.CANCELLED] * 4 + \
+        [Reservation.WAITING_FOR_PAYMENT]
+    assert OrderLogEntry.objects.filter(state_change=Order.EXPIRED).count() == 4
@@ -333,3 +333,61 @@ def test_order_price_check_fixed_price_product_rounded_price_is_correct(begin, e
         orderlines = response.data['order_lines']
         assert len(orderlines) == 2
         assert round(float(orderlines[0]['rounded_price'])) == round(price*quantity)
+
+
+CHECK_PRICES_URL = reverse('order-check-prices')
+
+
+def test_order_check_prices_matches_price_check(user_api_client, product_with_pcgs_and_time_slot_prices,
+                                                product_with_fixed_price_type_and_time_slots,
+                                                product_with_all_named_customer_groups):
+    '''
+    Test the batch endpoint quotes the same prices as the check price endpoint
+    for every product, time range and customer group.
+    '''
+    quotes = []
+    for product in (product_with_pcgs_and_time_slot_prices, product_with_fixed_price_type_and_time_slots):
+        for begin, end in ((datetime(2022, 3, 1, 10, 0), datetime(2022, 3, 1, 12, 0)),
+                           (datetime(2022, 3, 1, 11, 30), datetime(2022, 3, 1, 15, 30))):
+            for customer_group in (None, 'cg-adults-1', 'cg-children-1'):
+                quotes.append({
+                    'product': product.product_id, 'begin': str(begin), 'end': str(end),
+                    'customer_group': customer_group, 'quantity': 2,
+                })
+
+    response = user_api_client.post(CHECK_PRICES_URL, {'quotes': quotes}, format='json')
+    assert response.status_code == 200
+    assert len(response.data['quotes']) == len(quotes)
+
+    for quote, result in zip(quotes, response.data['quotes']):
+        price_check_data = {
+            'order_lines': [
+                {'product': quote['product'], 'quantity': quote['quantity']},
+                # the price check endpoint requires a product with the customer group
+                {'product': product_with_all_named_customer_groups.product_id, 'quantity': 0},
+            ],
+            'begin': quote['begin'],
+            'end': quote['end'],
+        }
+        if quote['customer_group']:
+            price_check_data['customer_group'] = quote['customer_group']
+        order_line = user_api_client.post(CHECK_PRICE_URL, price_check_data, format='json').data['order_lines'][0]
+        assert result['product'] == quote['product']
+        assert result['unit_price'] == order_line['unit_price']
+        assert Decimal(result['price']) == order_line['price']
+        assert result['rounded_price'] == order_line['rounded_price']
+
+
+def test_order_check_prices_invalid_quotes(user_api_client, product):
+    quotes = [
+        {'product': product.product_id, 'begin': '2022-03-01T10:00:00Z', 'end': '2022-03-01T11:00:00Z'},
+        {'product': generate_id(), 'begin': '2022-03-01T10:00:00Z', 'end': '2022-03-01T11:00:00Z'},
+        {'product': product.product_id, 'begin': '2022-03-01T10:00:00Z', 'end': '2022-03-01T11:00:00Z',
+         'customer_group': generate_id()},
+    ]
+    response = user_api_client.post(CHECK_PRICES_URL, {'quotes': quotes}, format='json')
+    assert response.status_code == 400
+    errors = response.data['quotes']
+    assert not errors[0]
+    assert set(errors[1]) == {'product'}
+    assert set(errors[2]) == {'customer_group'}
@@ -0,0 +1,419 @@
+import datetime
+import random
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+import pytz
+
+from ..factories import ProductFactory, TimeSlotPriceFactory
+from ..models import CustomerGroupTimeSlotPrice, Product, ProductCustomerGroup, TimeSlotPrice
+from ..pricing import ProductPricing
+from ..utils import finalize_price_data, get_price_dict, round_price
+
+TZ = pytz.timezone('Europe/Helsinki')
+CHUNK = datetime.timedelta(minutes=5)
+
+
+def reference_price_chunks(pricing, begin, end, customer_group_id, has_stored_price):
+    '''Prices the range five minutes at a time, one chunk after another'''
+    cg_data_exists = customer_group_id in pricing.customer_group_ids or has_stored_price
+    slot_begin = begin.astimezone(TZ)
+    local_end = end.astimezone(TZ)
+    while slot_begin + CHUNK <= local_end:
+        chunk = None
+        for slot in pricing.time_slot_prices:
+            if (slot.begin <= slot_begin.time() <= slot.end
+                    and slot.begin <= (slot_begin + CHUNK).time() <= slot.end):
+                cg_price = pricing.customer_group_time_slot_prices.get((slot.id, customer_group_id))
+                if cg_price:
+                    chunk = (slot, cg_price)
+                elif not cg_data_exists:
+                    chunk = (slot, slot)
+                break
+        yield chunk
+        slot_begin += CHUNK
+
+
+def reference_price(pricing, begin, end, price, customer_group_id, has_stored_price):
+    product = pricing.product
+    price_sum = 0
+    for chunk in reference_price_chunks(pricing, begin, end, customer_group_id, has_stored_price):
+        slot_price = chunk[1].price if chunk else price
+        price_sum += slot_price * Decimal(CHUNK / product.price_period)
+    return Decimal(price_sum)
+
+
+def reference_detailed_price(pricing, begin, end, price, price_tax_free, quantity, customer_group_id,
+                             has_stored_price):
+    product = pricing.product
+    detailed_pricing = {}
+    for chunk in reference_price_chunks(pricing, begin, end, customer_group_id, has_stored_price):
+        key = chunk[0].id if chunk else 'default'
+        if key in detailed_pricing:
+            detailed_pricing[key]['count'] += 1
+            continue
+        if chunk:
+            slot, slot_price = chunk
+            detailed_pricing[key] = get_price_dict(
+                count=1, price=slot_price.price,
+                pretax=product.get_pretax_price_context(slot_price.price, rounded=False),
+                begin=slot.begin.isoformat('minutes'), end=slot.end.isoformat('minutes'),
+                taxfree_price=slot_price.price_tax_free
+            )
+        else:
+            detailed_pricing[key] = get_price_dict(
+                count=1, price=price,
+                pretax=product.get_pretax_price_context(price, rounded=False),
+                taxfree_price=price_tax_free
+            )
+        if quantity > 1:
+            detailed_pricing[key]['quantity'] = quantity
+    return finalize_price_data(detailed_pricing, product.price_type, product.price_period)
+
+
+def random_time(rnd):
+    return datetime.time(rnd.randrange(24), rnd.randrange(0, 60, 5))
+
+
+def random_price(rnd):
+    return Decimal(rnd.randrange(0, 10000)) / 100
+
+
+def random_pricing(rnd, price_type=Product.PRICE_PER_PERIOD):
+    product = Product(
+        price_type=price_type,
+        price_period=datetime.timedelta(minutes=rnd.choice([15, 30, 60, 90, 120])),
+        price=random_price(rnd),
+        price_tax_free=random_price(rnd),
+        tax_percentage=Decimal('24.00'),
+    )
+    time_slot_prices = []
+    for slot_id in range(rnd.randrange(1, 5)):
+        begin, end = sorted([random_time(rnd), random_time(rnd)])
+        time_slot_prices.append(TimeSlotPrice(
+            id=slot_id + 1, product=product, begin=begin, end=end,
+            price=random_price(rnd), price_tax_free=random_price(rnd),
+        ))
+    time_slot_prices.sort(key=lambda slot: (slot.begin, slot.end))
+    cg_prices = [
+        CustomerGroupTimeSlotPrice(
+            time_slot_price_id=slot.id, customer_group_id=cg,
+            price=random_price(rnd), price_tax_free=random_price(rnd),
+        )
+        for slot in time_slot_prices for cg in ('adults', 'children') if rnd.random() < 0.5
+    ]
+    customer_group_ids = [cg for cg in ('adults', 'children') if rnd.random() < 0.3]
+    return ProductPricing(product, time_slot_prices, cg_prices, customer_group_ids, tz=TZ)
+
+
+def random_time_range(rnd):
+    # ranges around the autumn daylight saving time change
+    begin = datetime.datetime(2023, 10, 28, tzinfo=pytz.UTC) + datetime.timedelta(minutes=rnd.randrange(0, 2880))
+    length = rnd.choice([
+        datetime.timedelta(minutes=rnd.randrange(1, 600)),
+        datetime.timedelta(minutes=rnd.randrange(1, 4 * 1440)),
+    ])
+    return begin, begin + length
+
+
+def random_customer_group(rnd):
+    return rnd.choice([None, 'adults', 'children']), rnd.random() < 0.1
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_per_period_price_matches_chunked_sum(seed):
+    rnd = random.Random(seed)
+    pricing = random_pricing(rnd)
+    for _ in range(10):
+        begin, end = random_time_range(rnd)
+        cg, has_stored_price = random_customer_group(rnd)
+        price = pricing.product.price
+
+        result = pricing.get_price(begin, end, price, cg, has_stored_price)
+        expected = reference_price(pricing, begin, end, price, cg, has_stored_price)
+        assert abs(result - expected) < Decimal('1e-15')
+
+        quantity = rnd.choice([0, 1, 3])
+        detailed = pricing.get_detailed_price(
+            begin, end, price, pricing.product.price_tax_free, quantity, cg, has_stored_price
+        )
+        expected = reference_detailed_price(
+            pricing, begin, end, price, pricing.product.price_tax_free, quantity, cg, has_stored_price
+        )
+        assert detailed == expected
+        assert list(detailed) == list(expected)
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_fixed_price_uses_smallest_enclosing_time_slot(seed):
+    rnd = random.Random(seed)
+    pricing = random_pricing(rnd, price_type=Product.PRICE_FIXED)
+    for _ in range(10):
+        begin, end = random_time_range(rnd)
+        cg, has_stored_price = random_customer_group(rnd)
+        price = pricing.product.price
+        local_begin, local_end = begin.astimezone(TZ).time(), end.astimezone(TZ).time()
+
+        enclosing = [
+            slot for slot in pricing.time_slot_prices if slot.begin <= local_begin and slot.end >= local_end
+        ]
+        with_cg = [slot for slot in enclosing if (slot.id, cg) in pricing.customer_group_time_slot_prices]
+        if cg and with_cg:
+            enclosing = with_cg
+        elif cg and (cg in pricing.customer_group_ids or has_stored_price):
+            enclosing = []
+
+        result = pricing.get_price(begin, end, price, cg, has_stored_price)
+        if not enclosing:
+            assert result == price
+            continue
+        slot = min(enclosing, key=lambda s: (
+            datetime.datetime.combine(datetime.date.today(), s.end)
+            - datetime.datetime.combine(datetime.date.today(), s.begin)
+        ))
+        cg_price = pricing.customer_group_time_slot_prices.get((slot.id, cg))
+        assert result == (cg_price or slot).price
+
+
+def test_long_time_ranges_are_priced_per_time_of_day():
+    product = Product(
+        price_type=Product.PRICE_PER_PERIOD, price_period=datetime.timedelta(hours=1),
+        price=Decimal('10.00'), price_tax_free=Decimal('8.06'), tax_percentage=Decimal('24.00'),
+    )
+    night = TimeSlotPrice(
+        id=1, product=product, begin=datetime.time(0), end=datetime.time(6),
+        price=Decimal('4.00'), price_tax_free=Decimal('3.23'),
+    )
+    pricing = ProductPricing(product, [night], [], [], tz=pytz.UTC)
+    begin = datetime.datetime(2023, 1, 1, tzinfo=pytz.UTC)
+    end = begin + datetime.timedelta(days=365)
+
+    # 6 hours of each day at the night price, the rest at the default price
+    assert round_price(pricing.get_price(begin, end, product.price)) == Decimal(365 * (6 * 4 + 18 * 10))
+    counts = pricing.get_chunk_counts(begin, end)
+    assert [(slot, count) for slot, _, count in counts] == [(night, 365 * 6 * 12), (None, 365 * 18 * 12)]
+
+
+def tax_free(price):
+    return round_price(price * 100 / Decimal('124.00'))
+
+
+def fixed_price_pricing():
+    product = Product(
+        price_type=Product.PRICE_FIXED, price=Decimal('50.25'), price_tax_free=tax_free(Decimal('50.25')),
+        tax_percentage=Decimal('24.00'),
+    )
+    slots = [
+        (datetime.time(10), datetime.time(12), Decimal('10.00')),
+        (datetime.time(12), datetime.time(14), Decimal('12.00')),
+        (datetime.time(14), datetime.time(15), Decimal('14.50')),
+        (datetime.time(14), datetime.time(16), Decimal('14.00')),
+        (datetime.time(15), datetime.time(16), Decimal('15.60')),
+        (datetime.time(12), datetime.time(16), Decimal('11.50')),
+    ]
+    time_slot_prices = [
+        TimeSlotPrice(id=slot_id, product=product, begin=begin, end=end, price=price, price_tax_free=tax_free(price))
+        for slot_id, (begin, end, price) in enumerate(slots, start=1)
+    ]
+    cg_prices = [
+        CustomerGroupTimeSlotPrice(
+            time_slot_price_id=slot_id, customer_group_id=cg, price=price, price_tax_free=tax_free(price),
+        )
+        for slot_id, cg, price in (
+            (4, 'cg-adults-1', Decimal('8.00')),
+            (5, 'cg-adults-1', Decimal('7.00')),
+            (5, 'cg-elders-1', Decimal('6.00')),
+        )
+    ]
+    # the children have a product customer group price of their own
+    return ProductPricing(product, time_slot_prices, cg_prices, ['cg-children-1'], tz=pytz.UTC)
+
+
+@pytest.mark.parametrize('slot_times', (
+    ([[datetime.time(8), datetime.time(10), False], [datetime.time(9), datetime.time(10), True],
+      [datetime.time(7), datetime.time(11), False]]),
+    ([[datetime.time(8, 30), datetime.time(16), False], [datetime.time(12), datetime.time(15), False],
+      [datetime.time(11), datetime.time(13, 30), True]]),
+    ([[datetime.time(10), datetime.time(14, 30), True], [datetime.time(9), datetime.time(17), False]]),
+    ([[datetime.time(8), datetime.time(16), False], [datetime.time(8, 30), datetime.time(10, 30), True],
+      [datetime.time(7), datetime.time(13), False], [datetime.time(7), datetime.time(18), False]]),
+))
+def test_fixed_time_slot_price_is_the_shortest_slot(slot_times):
+    product = Product(price_type=Product.PRICE_FIXED, price=Decimal('50.25'))
+    time_slot_prices = [
+        TimeSlotPrice(id=slot_id, product=product, begin=begin, end=end, price=Decimal('10.00'))
+        for slot_id, (begin, end, _) in enumerate(slot_times, start=1)
+    ]
+    expected = next(slot for slot, (_, _, shortest) in zip(time_slot_prices, slot_times) if shortest)
+    pricing = ProductPricing(product, time_slot_prices, [], [], tz=pytz.UTC)
+    # a time range all the time slots are around
+    day = datetime.date(2022, 4, 25)
+    begin = datetime.datetime.combine(day, max(slot.begin for slot in time_slot_prices), tzinfo=pytz.UTC)
+    end = datetime.datetime.combine(day, min(slot.end for slot in time_slot_prices), tzinfo=pytz.UTC)
+
+    assert pricing.get_fixed_time_slot_price(begin, end) == (expected, None)
+
+
+@pytest.mark.parametrize('begin, end, customer_group, default_price, result', (
+    (datetime.time(7), datetime.time(8), None, Decimal('50.25'), Decimal('50.25')),  # default price
+    (datetime.time(7), datetime.time(11), None, Decimal('50.25'), Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), None, Decimal('50.25'), Decimal('10.00')),  # slot price
+    (datetime.time(10), datetime.time(12), None, Decimal('50.25'), Decimal('10.00')),  # slot price
+    (datetime.time(12), datetime.time(13), None, Decimal('50.25'), Decimal('12.00')),  # slot price
+    (datetime.time(12), datetime.time(15, 30), None, Decimal('50.25'), Decimal('11.50')),  # slot price
+    (datetime.time(14), datetime.time(16), None, Decimal('50.25'), Decimal('14.00')),  # slot price
+    (datetime.time(10), datetime.time(16), 'cg-adults-1', Decimal('50.25'), Decimal('50.25')),  # default price
+    (datetime.time(14), datetime.time(15), 'cg-adults-1', Decimal('50.25'), Decimal('8.00')),  # slot cg price
+    (datetime.time(14), datetime.time(16), 'cg-adults-1', Decimal('50.25'), Decimal('8.00')),  # slot cg price
+    (datetime.time(15), datetime.time(16), 'cg-adults-1', Decimal('50.25'), Decimal('7.00')),  # slot cg price
+    (datetime.time(7), datetime.time(8), 'cg-children-1', Decimal('6.50'), Decimal('6.50')),  # pcg price
+    (datetime.time(14), datetime.time(16), 'cg-children-1', Decimal('6.50'), Decimal('6.50')),  # pcg price
+    (datetime.time(7), datetime.time(8), 'cg-elders-1', Decimal('50.25'), Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), 'cg-elders-1', Decimal('50.25'), Decimal('10.00')),  # slot price
+    (datetime.time(14), datetime.time(16), 'cg-elders-1', Decimal('50.25'), Decimal('14.00')),  # slot price
+    (datetime.time(15), datetime.time(16), 'cg-elders-1', Decimal('50.25'), Decimal('6.00')),  # slot cg price
+))
+def test_fixed_time_slot_prices(begin, end, customer_group, default_price, result):
+    pricing = fixed_price_pricing()
+    day = datetime.date(2022, 4, 25)
+    begin = datetime.datetime.combine(day, begin, tzinfo=pytz.UTC)
+    end = datetime.datetime.combine(day, end, tzinfo=pytz.UTC)
+
+    assert pricing.get_price(begin, end, default_price, customer_group) == result
+    detailed = pricing.get_detailed_price(begin, end, default_price, tax_free(default_price), 1, customer_group)
+    assert detailed['custom_fixed']['price'] == result
+    assert detailed['custom_fixed']['taxfree_price'] == tax_free(result)
+
+
+def test_per_period_price_without_time_slots_uses_product_tax_free_price():
+    product = Product(
+        price_type=Product.PRICE_PER_PERIOD, price_period=datetime.timedelta(hours=1),
+        price=Decimal('10.00'), price_tax_free=Decimal('8.06'), tax_percentage=Decimal('24.00'),
+    )
+    pricing = ProductPricing(product, [], [], [], tz=pytz.UTC)
+    begin = datetime.datetime(2023, 1, 1, 12, tzinfo=pytz.UTC)
+    end = begin + datetime.timedelta(hours=2)
+
+    detailed = pricing.get_detailed_price(begin, end, Decimal('5.00'), Decimal('4.03'), 1, 'children')
+    assert detailed['default']['price'] == Decimal('5.00')
+    assert detailed['default']['taxfree_price'] == product.price_tax_free
+
+
+def local_time_range(product, begin, end):
+    """Returns the times of a day in the time zone of the product's unit"""
+    tz = product.resources.first().unit.get_tz()
+    day = datetime.date(2022, 4, 25)
+    return tz.localize(datetime.datetime.combine(day, begin)), tz.localize(datetime.datetime.combine(day, end))
+
+
+def get_price_for_customer_group(product, begin, end, customer_group):
+    product._in_memory_cg = customer_group
+    product_cg = ProductCustomerGroup.objects.filter(product=product, customer_group=customer_group).first()
+    begin, end = local_time_range(product, begin, end)
+    price = product.get_price_for_time_range(begin, end, product_cg=product_cg)
+    detailed = product.get_detailed_price_for_time_range(begin, end, product_cg=product_cg, quantity=1)
+    return price, detailed['custom_fixed']['taxfree_price']
+
+
+@pytest.mark.parametrize('slot_begin, slot_end, is_used', (
+    (datetime.time(8), datetime.time(10), True),
+    (datetime.time(9), datetime.time(10), True),
+    (datetime.time(9, 30), datetime.time(10), False),
+    (datetime.time(8), datetime.time(9), False),
+))
+@pytest.mark.django_db
+def test_fixed_time_slot_price_is_used_within_slot(slot_begin, slot_end, is_used, resource_in_unit):
+    product = ProductFactory.create(
+        price_type=Product.PRICE_FIXED, price=Decimal('50.25'), resources=[resource_in_unit],
+    )
+    TimeSlotPriceFactory.create(begin=slot_begin, end=slot_end, price=Decimal('10.00'), product=product)
+    begin, end = local_time_range(product, datetime.time(9), datetime.time(10))
+
+    expected = Decimal('10.00') if is_used else Decimal('50.25')
+    assert product.get_price_for_time_range(begin, end) == expected
+
+
+@pytest.mark.parametrize('slot_times', (
+    ([[datetime.time(8), datetime.time(10), False], [datetime.time(9), datetime.time(10), True],
+      [datetime.time(7), datetime.time(11), False]]),
+    ([[datetime.time(8, 30), datetime.time(16), False], [datetime.time(12), datetime.time(15), False],
+      [datetime.time(11), datetime.time(13, 30), True]]),
+    ([[datetime.time(10), datetime.time(14, 30), True], [datetime.time(9), datetime.time(17), False]]),
+    ([[datetime.time(8), datetime.time(16), False], [datetime.time(8, 30), datetime.time(10, 30), True],
+      [datetime.time(7), datetime.time(13), False], [datetime.time(7), datetime.time(18), False]]),
+))
+@pytest.mark.django_db
+def test_product_fixed_time_slot_price_is_the_shortest_slot(slot_times, resource_in_unit):
+    product = ProductFactory.create(
+        price_type=Product.PRICE_FIXED, price=Decimal('50.25'), resources=[resource_in_unit],
+    )
+    expected = None
+    for i, (slot_begin, slot_end, shortest) in enumerate(slot_times):
+        time_slot_price = TimeSlotPriceFactory.create(
+            begin=slot_begin, end=slot_end, price=Decimal(10 + i), product=product
+        )
+        if shortest:
+            expected = time_slot_price.price
+    # a time range all the time slots are around
+    begin, end = local_time_range(
+        product, max(slot[0] for slot in slot_times), min(slot[1] for slot in slot_times)
+    )
+
+    assert product.get_price_for_time_range(begin, end) == expected
+
+
+@pytest.mark.parametrize('begin, end, customer_group, result', (
+    (datetime.time(7), datetime.time(8), None, Decimal('50.25')),  # default price
+    (datetime.time(7), datetime.time(11), None, Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), None, Decimal('10.00')),  # slot price
+    (datetime.time(10), datetime.time(12), None, Decimal('10.00')),  # slot price
+    (datetime.time(12), datetime.time(13), None, Decimal('12.00')),  # slot price
+    (datetime.time(12), datetime.time(15, 30), None, Decimal('11.50')),  # slot price
+    (datetime.time(14), datetime.time(16), None, Decimal('14.00')),  # slot price
+    (datetime.time(10), datetime.time(16), 'cg-adults-1', Decimal('50.25')),  # default price
+    (datetime.time(14), datetime.time(15), 'cg-adults-1', Decimal('8.00')),  # slot cg price
+    (datetime.time(14), datetime.time(16), 'cg-adults-1', Decimal('8.00')),  # slot cg price
+    (datetime.time(15), datetime.time(16), 'cg-adults-1', Decimal('7.00')),  # slot cg price
+    (datetime.time(7), datetime.time(8), 'cg-children-1', Decimal('6.50')),  # pcg price
+    (datetime.time(14), datetime.time(16), 'cg-children-1', Decimal('6.50')),  # pcg price
+    (datetime.time(7), datetime.time(8), 'cg-elders-1', Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), 'cg-elders-1', Decimal('10.00')),  # slot price
+    (datetime.time(14), datetime.time(16), 'cg-elders-1', Decimal('14.00')),  # slot price
+))
+@pytest.mark.django_db
+def test_product_fixed_time_slot_price(begin, end, customer_group, result,
+                                       product_with_fixed_price_type_and_time_slots, customer_group_elders):
+    product = product_with_fixed_price_type_and_time_slots
+    price, _ = get_price_for_customer_group(product, begin, end, customer_group)
+    assert price == result
+
+
+@pytest.mark.parametrize('begin, end, customer_group, result', (
+    (datetime.time(7), datetime.time(8), None, Decimal('50.25')),  # default price
+    (datetime.time(7), datetime.time(11), None, Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), None, Decimal('10.00')),  # slot price
+    (datetime.time(10), datetime.time(12), None, Decimal('10.00')),  # slot price
+    (datetime.time(12), datetime.time(13), None, Decimal('12.00')),  # slot price
+    (datetime.time(12), datetime.time(15, 30), None, Decimal('11.50')),  # slot price
+    (datetime.time(14), datetime.time(16), None, Decimal('14.00')),  # slot price
+    (datetime.time(10), datetime.time(16), 'cg-adults-1', Decimal('50.25')),  # default price
+    (datetime.time(14), datetime.time(15), 'cg-adults-1', Decimal('8.00')),  # slot cg price
+    (datetime.time(14), datetime.time(16), 'cg-adults-1', Decimal('8.00')),  # slot cg price
+    (datetime.time(15), datetime.time(16), 'cg-adults-1', Decimal('7.00')),  # slot cg price
+    (datetime.time(7), datetime.time(8), 'cg-children-1', Decimal('6.50')),  # pcg price
+    (datetime.time(14), datetime.time(16), 'cg-children-1', Decimal('6.50')),  # pcg price
+    (datetime.time(7), datetime.time(8), 'cg-elders-1', Decimal('50.25')),  # default price
+    (datetime.time(10), datetime.time(11), 'cg-elders-1', Decimal('10.00')),  # slot price
+    (datetime.time(14), datetime.time(16), 'cg-elders-1', Decimal('14.00')),  # slot price
+    (datetime.time(15), datetime.time(16), 'cg-elders-1', Decimal('6.00')),  # slot cg price
+))
+@pytest.mark.django_db
+def test_product_fixed_time_slot_prices_with_tax(begin, end, customer_group, result,
+                                                 product_with_fixed_price_type_and_time_slots_tax):
+    product = product_with_fixed_price_type_and_time_slots_tax
+    price, price_tax_free = get_price_for_customer_group(product, begin, end, customer_group)
+    assert price == result
+    expected_tax_free = Decimal(100 * result / (100 + product.tax_percentage)).quantize(
+        Decimal('0.01'), rounding=ROUND_HALF_UP
+    )
+    assert price_tax_free == expected_tax_free
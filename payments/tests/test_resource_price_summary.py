@@ -0,0 +1,137 @@
+from datetime import time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.db import IntegrityError, transaction
+from rest_framework.reverse import reverse
+
+from ..factories import (
+    CustomerGroupTimeSlotPriceFactory, ProductCustomerGroupFactory, ProductFactory, TimeSlotPriceFactory
+)
+from ..models import Product, ResourcePriceSummary, ResourcePriceSummaryQuerySet
+
+LIST_URL = reverse('resource-list')
+
+
+@pytest.fixture(autouse=True)
+def auto_use_django_db(db):
+    pass
+
+
+@pytest.fixture
+def rent_product(resource_in_unit, customer_group_adults, customer_group_children, customer_group_elders,
+                 django_capture_on_commit_callbacks):
+    # the price summaries are refreshed when the transaction commits
+    with django_capture_on_commit_callbacks(execute=True):
+        product = ProductFactory.create(
+            type=Product.RENT, price=Decimal('15.00'), price_type=Product.PRICE_PER_PERIOD,
+            price_period=timedelta(minutes=30), resources=[resource_in_unit],
+        )
+        ProductCustomerGroupFactory.create(
+            customer_group=customer_group_adults, product=product, price=Decimal('6.00')
+        )
+        ProductCustomerGroupFactory.create(
+            customer_group=customer_group_children, product=product, price=Decimal('5.50')
+        )
+        time_slot_price = TimeSlotPriceFactory.create(
+            begin=time(10, 0), end=time(12, 0), price=Decimal('5.00'), product=product
+        )
+        CustomerGroupTimeSlotPriceFactory.create(
+            customer_group=customer_group_adults, price=Decimal('4.00'), time_slot_price=time_slot_price
+        )
+        CustomerGroupTimeSlotPriceFactory.create(
+            customer_group=customer_group_elders, price=Decimal('3.00'), time_slot_price=time_slot_price
+        )
+    return product
+
+
+def get_summaries(resource):
+    return {
+        (summary.customer_group_id, summary.price_type): (summary.min_price, summary.max_price)
+        for summary in ResourcePriceSummary.objects.filter(resource=resource)
+    }
+
+
+def test_price_summaries_follow_product_prices(resource_in_unit, rent_product, django_capture_on_commit_callbacks):
+    # per period prices are per hour
+    per_period = Product.PRICE_PER_PERIOD
+    assert get_summaries(resource_in_unit) == {
+        (None, per_period): (Decimal('10.00'), Decimal('30.00')),
+        ('cg-adults-1', per_period): (Decimal('8.00'), Decimal('12.00')),
+        # the product has its own price for children, used in the time slot too
+        ('cg-children-1', per_period): (Decimal('11.00'), Decimal('11.00')),
+        ('cg-elders-1', per_period): (Decimal('6.00'), Decimal('30.00')),
+    }
+
+    # a new version of the product replaces the prices of the previous one
+    product = Product.objects.current().get(product_id=rent_product.product_id)
+    product.price = Decimal('20.00')
+    refresh = ResourcePriceSummaryQuerySet.refresh
+    with mock.patch.object(ResourcePriceSummaryQuerySet, 'refresh', autospec=True, side_effect=refresh) as mock_refresh:
+        with django_capture_on_commit_callbacks(execute=True):
+            product.save()
+    # the prices copied to the new version are refreshed all at once
+    assert mock_refresh.call_count == 1
+    assert get_summaries(resource_in_unit)[(None, per_period)][1] == Decimal('40.00')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.delete()
+    assert get_summaries(resource_in_unit) == {}
+
+
+def test_price_summaries_of_many_products(resource_in_unit, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductFactory.create(price=Decimal('10.00'), price_type=Product.PRICE_FIXED, price_period=None,
+                              type=Product.RENT, resources=[resource_in_unit])
+        ProductFactory.create(price=Decimal('30.00'), price_type=Product.PRICE_FIXED, price_period=None,
+                              type=Product.RENT, resources=[resource_in_unit])
+        # extras are not needed for a reservation
+        ProductFactory.create(price=Decimal('1.00'), price_type=Product.PRICE_FIXED, price_period=None,
+                              type=Product.EXTRA, resources=[resource_in_unit])
+
+    assert get_summaries(resource_in_unit) == {
+        (None, Product.PRICE_FIXED): (Decimal('10.00'), Decimal('30.00')),
+    }
+
+
+def test_resource_list_price_summaries_and_free_of_charge(user_api_client, resource_in_unit, resource_in_unit2,
+                                                          rent_product):
+    response = user_api_client.get(LIST_URL, {'free_of_charge': 'true'})
+    assert response.status_code == 200
+    assert [resource['id'] for resource in response.data['results']] == [resource_in_unit2.id]
+
+    response = user_api_client.get(LIST_URL, {'free_of_charge': 'false'})
+    assert response.status_code == 200
+    assert [resource['id'] for resource in response.data['results']] == [resource_in_unit.id]
+    summaries = response.data['results'][0]['price_summaries']
+    assert {
+        'customer_group': None, 'price_type': Product.PRICE_PER_PERIOD, 'min_price': '10.00', 'max_price': '30.00',
+    } in summaries
+
+
+def test_resource_list_min_price_filter(user_api_client, resource_in_unit, resource_in_unit2, rent_product):
+    resource_in_unit.min_price = Decimal('1.00')
+    resource_in_unit.save()
+    resource_in_unit2.min_price = Decimal('10.00')
+    resource_in_unit2.save()
+
+    # the price summary of the rent products takes precedence over the resource's own min price
+    response = user_api_client.get(LIST_URL, {'min_price': '10.00'})
+    assert response.status_code == 200
+    assert {resource['id'] for resource in response.data['results']} == {resource_in_unit.id, resource_in_unit2.id}
+
+    response = user_api_client.get(LIST_URL, {'min_price': '1.00'})
+    assert response.status_code == 200
+    assert response.data['results'] == []
+
+
+def test_price_summaries_are_unique(resource_in_unit, rent_product):
+    ResourcePriceSummary.objects.refresh([resource_in_unit.id])
+    summaries = ResourcePriceSummary.objects.filter(resource=resource_in_unit)
+    assert summaries.count() == len(get_summaries(resource_in_unit))
+
+    summary = ResourcePriceSummary.objects.get(resource=resource_in_unit, customer_group=None)
+    summary.pk = None
+    with pytest.raises(IntegrityError), transaction.atomic():
+        summary.save()
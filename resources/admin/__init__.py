@@ -33,6 +33,7 @@ from ..models import (
     Unit, UnitAuthorization, UnitIdentifier, UnitGroup, UnitGroupAuthorization,
     UniversalFormFieldType, ResourceUniversalField, ResourceUniversalFormOption, ResourcePublishDate
 )
+from ..models.availability import get_changed_dates, get_periods_state
 from ..models.utils import generate_id
 from munigeo.models import Municipality
 from rest_framework.authtoken.admin import Token
@@ -226,8 +227,14 @@ class ResourceAdmin(PopulateCreatedAndModifiedMixin, CommonExcludeMixin,
     readonly_fields = ('tags', )
 
     def save_related(self, request, form, formsets, change):
+        periods_state = get_periods_state(form.instance.periods.all())
         super().save_related(request, form, formsets, change)
-        form.instance.update_opening_hours()
+        if not change or 'unit' in form.changed_data:
+            form.instance.update_opening_hours()
+            return
+        changed_dates = get_changed_dates(periods_state, get_periods_state(form.instance.periods.all()))
+        if changed_dates:
+            form.instance.update_opening_hours(*changed_dates)
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj=obj, **kwargs)
@@ -282,8 +289,14 @@ class UnitAdmin(PopulateCreatedAndModifiedMixin, CommonExcludeMixin, FixedGuarde
     default_zoom = 12
 
     def save_related(self, request, form, formsets, change):
+        periods_state = get_periods_state(form.instance.periods.all())
         super().save_related(request, form, formsets, change)
-        form.instance.update_opening_hours()
+        if not change:
+            form.instance.update_opening_hours()
+            return
+        changed_dates = get_changed_dates(periods_state, get_periods_state(form.instance.periods.all()))
+        if changed_dates:
+            form.instance.update_opening_hours(*changed_dates)
 
     def get_urls(self):
         urls = super(UnitAdmin, self).get_urls()
@@ -354,6 +367,7 @@ class UnitGroupAuthorizationAdmin(_CommonMixin, LimitAuthorizedToStaff, admin.Mo
 
 class ResourceImageAdmin(PopulateCreatedAndModifiedMixin, CommonExcludeMixin, ImageCroppingMixin, TranslationAdmin):
     exclude = ('sort_order', 'image_format')
+    readonly_fields = ('processing_state',)
 
 
 class EquipmentAliasInline(PopulateCreatedAndModifiedMixin, CommonExcludeMixin, admin.TabularInline):
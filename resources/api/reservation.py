@@ -1,17 +1,20 @@
+import itertools
+import tempfile
 import uuid
 import arrow
 import django_filters
 from arrow.parser import ParserError
 from django.conf import settings
-from guardian.core import ObjectPermissionChecker
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import (
     PermissionDenied, ValidationError as DjangoValidationError
 )
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, prefetch_related_objects
+from django.db.models.signals import post_save
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import AnonymousUser
@@ -21,6 +24,7 @@ from rest_framework.authentication import TokenAuthentication, SessionAuthentica
 from rest_framework.fields import BooleanField, IntegerField
 from rest_framework import renderers
 from rest_framework.exceptions import NotAcceptable, ValidationError
+from rest_framework.decorators import action
 from rest_framework.settings import api_settings as drf_settings
 
 from munigeo import api as munigeo_api
@@ -36,17 +40,22 @@ from resources.models import (
     Reservation, Resource, ReservationMetadataSet,
     ReservationHomeMunicipalityField, ReservationBulk, Unit
 )
-from resources.models.reservation import RESERVATION_EXTRA_FIELDS
-from resources.models.utils import build_reservations_ical_file
+from resources.models.reservation import (
+    RESERVATION_EXTRA_FIELDS, ReservationValidationContext, reservation_constraint_errors
+)
 from resources.pagination import ReservationPagination
-from resources.models.utils import generate_reservation_xlsx, get_object_or_none
+from resources.models.utils import (
+    generate_reservation_csv, generate_reservation_xlsx, get_object_or_none, write_reservation_xlsx
+)
 
-from ..auth import is_general_admin, is_underage, is_overage, is_authenticated_user, is_any_admin, is_any_manager
+from ..auth import (
+    PermissionResolver, is_general_admin, is_underage, is_overage, is_authenticated_user, is_any_admin, is_any_manager
+)
 from .base import (
     NullableDateTimeField, TranslatedModelSerializer, register_view, DRFFilterBooleanWidget,
     ExtraDataMixin, ReservationCreateMixin
 )
-from resources.signals import reservation_confirmed
+from resources.signals import reservations_confirmed
 
 from ..models.utils import has_reservation_data_changed, is_reservation_metadata_or_times_different
 from respa.renderers import ResourcesBrowsableAPIRenderer
@@ -230,6 +239,11 @@ class ReservationSerializer(ExtraDataMixin,
                 'end': reservation.end
             })
 
+        # The permissions of the user and the data the reservation is
+        # validated against are each fetched once for all the checks below.
+        resource._permission_resolver = PermissionResolver.for_user(request_user)
+        context = ReservationValidationContext(resource, request_user, data['begin'], data['end'], exclude=reservation)
+
         if not resource.can_make_reservations(request_user):
             raise PermissionDenied(_('You are not allowed to make reservations in this resource.'))
 
@@ -284,7 +298,7 @@ class ReservationSerializer(ExtraDataMixin,
             data.pop('user', None)
 
         # Check user specific reservation restrictions relating to given period.
-        resource.validate_reservation_period(reservation, request_user, data=data)
+        resource.validate_reservation_period(reservation, request_user, data=data, context=context)
         reserver_phone_number = data.get('reserver_phone_number', '')
         if reserver_phone_number.startswith('+'):
             if not region_code_for_country_code(phonenumbers.parse(reserver_phone_number).country_code):
@@ -341,7 +355,7 @@ class ReservationSerializer(ExtraDataMixin,
         # Only new reservations are taken into account ie. a normal user can modify an existing reservation
         # even if it exceeds the limit. (one that was created via admin ui for example).
         if reservation is None and not isinstance(request_user, AnonymousUser):
-            resource.validate_max_reservations_per_user(request_user)
+            resource.validate_max_reservations_per_user(request_user, context=context)
 
         request = self.context.get('request')
         if request.method == 'POST':
@@ -352,7 +366,7 @@ class ReservationSerializer(ExtraDataMixin,
         # Run model clean
         instance = Reservation(**data)
         try:
-            instance.clean(original_reservation=reservation, user=request_user)
+            instance.clean(original_reservation=reservation, user=request_user, context=context)
         except DjangoValidationError as exc:
             # Convert Django ValidationError to DRF ValidationError so that in the response
             # field specific error messages are added in the field instead of in non_field_messages.
@@ -362,8 +376,24 @@ class ReservationSerializer(ExtraDataMixin,
             for key, value in exc.error_dict.items():
                 error_dict[key] = [error.message for error in value]
             raise ValidationError(error_dict)
+        # saved with the reservation for the database constraints
+        data['enforced_cooldown'] = instance.enforced_cooldown
         return data
 
+    def create(self, validated_data):
+        try:
+            with reservation_constraint_errors():
+                return super().create(validated_data)
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.message_dict)
+
+    def update(self, instance, validated_data):
+        try:
+            with reservation_constraint_errors():
+                return super().update(instance, validated_data)
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.message_dict)
+
     def to_internal_value(self, data):
         hotfix = []
         for field_name in data:
@@ -402,13 +432,14 @@ class ReservationSerializer(ExtraDataMixin,
         prefetched_user = self.context.get('prefetched_user', None)
         user = prefetched_user or self.context['request'].user
 
-        if self.context['request'].accepted_renderer.format == 'xlsx':
-            # Return somewhat different data in case we are dealing with xlsx.
+        if self.context['request'].accepted_renderer.format in ('xlsx', 'csv'):
+            # Return somewhat different data in case we are dealing with xlsx or csv.
             # The excel renderer needs datetime objects, so begin and end are passed as objects
             # to avoid needing to convert them back and forth.
             data.update(**{
                 'unit': resource.unit.name,  # additional
                 'resource': resource.name,  # resource name instead of id
+                'resource_id': resource.id,
                 'begin': instance.begin,  # datetime object
                 'end': instance.end,  # datetime object
                 'user': instance.user.email if instance.user else '',  # just email
@@ -513,15 +544,28 @@ class ReservationBulkSerializer(ReservationCreateMixin, serializers.Serializer):
         resource = attrs['resource']
         _cattrs = attrs.copy()
         reservation_stack = _cattrs.pop('reservation_stack')
-        if len(reservation_stack) > 100:
+        if len(reservation_stack) > settings.RESPA_RESERVATION_BULK_MAX_SIZE:
             raise NotAcceptable({
                 'reservation_stack': _('Reservation failed. Too many reservations at once.')
             })
-        for data in reservation_stack:
-            reservation = Reservation(**_cattrs, **data)
-            reservation.clean()
-            resource.validate_reservation_period(reservation, reservation.user)
-            resource.validate_max_reservations_per_user(reservation.user)
+        reservations = [Reservation(**_cattrs, **data) for data in reservation_stack]
+        if not reservations:
+            return attrs
+
+        # The opening hours and the reservations around the whole stack are
+        # fetched once, and each reservation is then checked against them
+        # and the reservations of the stack before it.
+        user = reservations[0].user
+        resource._permission_resolver = PermissionResolver.for_user(user)
+        context = ReservationValidationContext(
+            resource, user, min(r.begin for r in reservations), max(r.end for r in reservations)
+        )
+        for data, reservation in zip(reservation_stack, reservations):
+            reservation.clean(context=context)
+            resource.validate_reservation_period(reservation, user, context=context)
+            context.add(reservation)
+            data['enforced_cooldown'] = reservation.enforced_cooldown
+        resource.validate_max_reservations_per_user(user, context=context)
 
         return attrs
 
@@ -533,19 +577,32 @@ class ReservationBulkSerializer(ReservationCreateMixin, serializers.Serializer):
 
     def create(self, validated_data):
         reservation_stack = validated_data.pop('reservation_stack')
-        reservations = []
         user = validated_data['user']
-        for reservation_data in reservation_stack:
-            reservation = Reservation.objects.create(state=Reservation.CONFIRMED,
-                                      approver=user, **validated_data, **reservation_data)
-            reservation_confirmed.send(
-                sender=self.__class__,
-                instance=reservation, user=user)
-            reservation.save()
-            reservations.append(reservation)
-
-        instance = ReservationBulk.objects.create(created_by=user)
-        instance.reservations.add(*reservations)
+        resource = validated_data['resource']
+        with transaction.atomic():
+            instance = ReservationBulk.objects.create(created_by=user)
+            reservations = [
+                Reservation(state=Reservation.CONFIRMED, approver=user, bulk=instance,
+                            **validated_data, **reservation_data)
+                for reservation_data in reservation_stack
+            ]
+            for reservation in reservations:
+                reservation.set_computed_fields()
+            try:
+                with reservation_constraint_errors():
+                    Reservation.objects.bulk_create(reservations)
+            except DjangoValidationError as exc:
+                raise ValidationError(exc.message_dict)
+            resource.update_free_intervals(
+                min(r.begin for r in reservations), max(r.end for r in reservations)
+            )
+            for reservation in reservations:
+                # bulk_create does not send post_save, which the calendar
+                # integrations listen to; the free intervals are up to date.
+                reservation._free_intervals_updated = True
+                post_save.send(sender=Reservation, instance=reservation, created=True,
+                               update_fields=None, raw=False, using=instance._state.db)
+            reservations_confirmed.send(sender=self.__class__, instances=reservations, user=user)
 
         return instance
 
@@ -597,9 +654,16 @@ class ExcludePastFilterBackend(filters.BaseFilterBackend):
         return queryset
 
 
+def parse_weekdays(params):
+    try:
+        return [int(day) for day in params.get('weekdays', '').split(',') if day]
+    except ValueError:
+        raise exceptions.ParseError(_('Invalid value in filter %(filter)s') % {'filter': 'weekdays'})
+
+
 class ReservationFilterBackend(filters.BaseFilterBackend):
     """
-    Filter reservations by time.
+    Filter reservations by time, and reports also by the weekdays they begin on.
     """
 
     def filter_queryset(self, request, queryset, view):
@@ -626,6 +690,21 @@ class ReservationFilterBackend(filters.BaseFilterBackend):
             queryset = queryset.filter(end__gte=times['start'])
         if times.get('end', None):
             queryset = queryset.filter(begin__lte=times['end'])
+        return self.filter_weekdays(request, queryset, view)
+
+    def filter_weekdays(self, request, queryset, view):
+        """
+        Filter reports by the weekdays reservations begin on in the server TIME_ZONE
+
+        Other responses ignore the weekdays, as they did before reports
+        were filtered in SQL.
+        """
+        if getattr(view, 'action', None) != 'export' and request.accepted_renderer.format != 'xlsx':
+            return queryset
+        weekdays = parse_weekdays(request.query_params)
+        if weekdays:
+            # weekdays are given Monday being 0, ISO week days start from 1
+            queryset = queryset.filter(begin__iso_week_day__in=[weekday + 1 for weekday in weekdays])
         return queryset
 
 
@@ -791,39 +870,33 @@ class ReservationExcelRenderer(renderers.BaseRenderer):
         if renderer_context['view'].action == 'retrieve':
             return generate_reservation_xlsx([data], request=request)
         elif renderer_context['view'].action == 'list':
-            weekdays = request.GET.get('weekdays', '').split(',')
-            weekdays = [int(day) for day in weekdays if day]
+            # the reservations have already been filtered by the weekdays in ReservationFilterBackend
+            weekdays = parse_weekdays(request.query_params)
             include_block_reservations = bool(int(request.GET.get('include_block_reservations', '0')))
             reservations = data['results']
-            for reservation in reservations.copy():
-                begin = reservation['begin']
-                if weekdays and begin.weekday() not in weekdays:
-                    reservations.remove(reservation)
             return generate_reservation_xlsx(reservations, request=request, weekdays=weekdays, include_block_reservations=include_block_reservations)
         else:
             return NotAcceptable()
 
 
-class ReservationCacheMixin:
-    def _preload_permissions(self):
-        units = set()
-        resource_groups = set()
-        resources = set()
-        checker = ObjectPermissionChecker(self.request.user)
+class ReservationCSVRenderer(renderers.BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
 
-        for rv in self._page:
-            resources.add(rv.resource)
-            rv.resource._permission_checker = checker
+    def render(self, data, media_type=None, renderer_context=None):
+        # The reservations are streamed by ReservationViewSet.export, so
+        # only error messages are rendered here.
+        if not data:
+            return bytes()
+        return str(data).encode(self.charset)
 
-        for res in resources:
-            units.add(res.unit)
-            for g in res.groups.all():
-                resource_groups.add(g)
 
-        if units:
-            checker.prefetch_perms(units)
-        if resource_groups:
-            checker.prefetch_perms(resource_groups)
+class ReservationCacheMixin:
+    def _preload_permissions(self):
+        resolver = PermissionResolver.for_user(self.request.user)
+        for rv in self._page:
+            rv.resource._permission_resolver = resolver
 
     def _get_cache_context(self):
         context = {}
@@ -868,18 +941,15 @@ class ReservationBulkViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     def perform_create(self, serializer):
         instance = serializer.save(user=self.request.user)
 
-        attachments = []
+        ical_attachments = []
         for reservation in instance.reservations.all():
-            ical_file = build_reservations_ical_file([reservation])
             begin = self._strftime(reservation.begin)
             end = self._strftime(reservation.end) \
                 if reservation.begin.date() != reservation.end.date() else self._to_localtime(reservation.end).strftime('%H.%M')
-            
-            attachment = ('reservation %s - %s.ics' % (begin, end), ical_file, 'text/calendar')
-            attachments.append(attachment)
+            ical_attachments.append(('reservation %s - %s.ics' % (begin, end), [reservation]))
         instance.reservations.first().send_reservation_mail(
             NotificationType.RESERVATION_BULK_CREATED,
-            attachments=attachments,
+            ical_attachments=ical_attachments,
             extra_context=self.get_notification_context(instance.reservations)
         )
 
@@ -1040,6 +1110,53 @@ class ReservationViewSet(munigeo_api.GeoModelAPIView, viewsets.ModelViewSet, Res
             response['Content-Disposition'] = 'attachment; filename={}-{}.xlsx'.format(_('reservation'), kwargs['pk'])
         return response
 
+    def _iterate_serialized(self, queryset, chunk_size=500):
+        # iterator() streams the rows from a server-side cursor but ignores
+        # prefetch_related, so the related objects are prefetched per chunk.
+        reservations = queryset.iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(itertools.islice(reservations, chunk_size))
+            if not chunk:
+                return
+            prefetch_related_objects(chunk, *queryset._prefetch_related_lookups)
+            yield from self.get_serializer(chunk, many=True).data
+
+    @action(detail=False, methods=['get'], renderer_classes=(ReservationExcelRenderer, ReservationCSVRenderer))
+    def export(self, request, *args, **kwargs):
+        """
+        Export all the filtered reservations without pagination
+
+        The reservations are read from the database in chunks and written out
+        as they go. CSV is streamed to the client directly, xlsx is written to
+        a temporary file first.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        weekdays = parse_weekdays(request.query_params)
+        include_block_reservations = bool(int(request.query_params.get('include_block_reservations', '0')))
+        normal_reservations = self._iterate_serialized(queryset.filter(type=Reservation.TYPE_NORMAL))
+        block_reservations = []
+        if include_block_reservations:
+            block_reservations = self._iterate_serialized(queryset.filter(type=Reservation.TYPE_BLOCKED))
+
+        if request.accepted_renderer.format == 'csv':
+            response = StreamingHttpResponse(
+                generate_reservation_csv(itertools.chain(normal_reservations, block_reservations)),
+                content_type=ReservationCSVRenderer.media_type
+            )
+            response['Content-Disposition'] = 'attachment; filename={}.csv'.format(_('reservations'))
+            return response
+
+        output = tempfile.TemporaryFile()
+        write_reservation_xlsx(
+            output, normal_reservations, block_reservations, request=request,
+            weekdays=weekdays, include_block_reservations=include_block_reservations
+        )
+        output.seek(0)
+        return FileResponse(
+            output, as_attachment=True, filename='{}.xlsx'.format(_('reservations')),
+            content_type=ReservationExcelRenderer.media_type
+        )
+
     def send_modified_mail(self, new_instance, is_staff=False):
         new_instance.send_reservation_modified_mail(action_by_official=is_staff)
         if not is_staff:
@@ -39,7 +39,6 @@ from rest_framework import (
 from rest_framework.response import Response
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.decorators import action
-from guardian.core import ObjectPermissionChecker
 from munigeo import api as munigeo_api
 from resources.models import (
     AccessibilityValue, AccessibilityViewpoint, Purpose, Reservation, Resource, ResourceAccessibility,
@@ -49,10 +48,10 @@ from resources.models import (
     ResourceUniversalField, ResourceUniversalFormOption, UniversalFormFieldType, ResourcePublishDate
 )
 from resources.models.resource import determine_hours_time_range
-from payments.models import Product
+from payments.models import Product, ResourcePriceSummary
 from respa_admin.models import DisabledFieldsSet
 
-from ..auth import has_permission, is_general_admin, is_staff, has_api_permission
+from ..auth import PermissionResolver, has_permission, is_general_admin, is_staff, has_api_permission
 from .accessibility import ResourceAccessibilitySerializer
 from .base import (
     ExtraDataMixin, TranslatedModelSerializer, register_view,
@@ -233,7 +232,7 @@ class ResourceImageSerializer(TranslatedModelSerializer):
     class Meta:
         model = ResourceImage
         exclude = (
-            'image_format', 'sort_order', 'resource',
+            'image_format', 'sort_order', 'resource', 'processing_state',
             'created_at', 'modified_at', 'created_by', 'modified_by'
         )
         required_translations = (
@@ -281,9 +280,7 @@ class ResourceImageSerializer(TranslatedModelSerializer):
         serializer.is_valid()
         validated_data['image'] = serializer.content_file
         validated_data['created_by'] = user
-        instance = super().create(validated_data)
-        instance._process_image()
-        return instance
+        return super().create(validated_data)
     
     def update(self, resource, validated_data):
         remove = validated_data.pop('remove', False)
@@ -319,7 +316,6 @@ class ResourceImageSerializer(TranslatedModelSerializer):
             validated_data['created_by'] = user
             instance = super().create(validated_data)
 
-        instance._process_image()
         return instance
 
 class NestedResourceImageSerializer(TranslatedModelSerializer):
@@ -1005,6 +1001,7 @@ class ResourceFilterSet(django_filters.FilterSet):
                                               widget=django_filters.widgets.CSVWidget)
     free_of_charge = django_filters.BooleanFilter(method='filter_free_of_charge',
                                                   widget=DRFFilterBooleanWidget)
+    min_price = django_filters.NumberFilter(method='filter_min_price')
     municipality = django_filters.Filter(field_name='unit__municipality_id', lookup_expr='in',
                                          widget=django_filters.widgets.CSVWidget, distinct=True)
     keywords = django_filters.CharFilter(method='filter_keywords')
@@ -1043,11 +1040,25 @@ class ResourceFilterSet(django_filters.FilterSet):
 
     def filter_free_of_charge(self, queryset, name, value):
         qs = Q(min_price__lte=0) | Q(min_price__isnull=True)
+        if settings.RESPA_PAYMENTS_ENABLED:
+            # resources whose every rent product costs something aren't free of charge
+            qs &= ~Q(id__in=ResourcePriceSummary.objects.filter(
+                customer_group__isnull=True, min_price__gt=0).values('resource'))
         if value:
             return queryset.filter(qs)
         else:
             return queryset.exclude(qs)
 
+    def filter_min_price(self, queryset, name, value):
+        if not settings.RESPA_PAYMENTS_ENABLED:
+            return queryset.filter(min_price=value)
+        # the lowest price of the rent products, when the resource has any
+        summary_min_price = ResourcePriceSummary.objects.filter(
+            resource=OuterRef('pk'), customer_group__isnull=True
+        ).order_by('min_price').values('min_price')[:1]
+        queryset = queryset.annotate(effective_min_price=Coalesce(Subquery(summary_min_price), 'min_price'))
+        return queryset.filter(effective_min_price=value)
+
     def _deserialize_datetime(self, value):
         try:
             return arrow.get(value).datetime
@@ -1061,120 +1072,17 @@ class ResourceFilterSet(django_filters.FilterSet):
         available_start = self._deserialize_datetime(value[0])
         available_end = self._deserialize_datetime(value[1])
 
-        if available_start.date() != available_end.date():
-            raise exceptions.ParseError('available_between timestamps must be on the same day.')
-        overlapping_reservations = Reservation.objects.filter(
-            resource__in=queryset, end__gt=available_start, begin__lt=available_end
-        ).current()
+        if available_end < available_start:
+            raise exceptions.ParseError('available_between end must be after start.')
 
         if len(value) == 2:
-            return self._filter_available_between_whole_range(
-                queryset, overlapping_reservations, available_start, available_end
-            )
-        else:
-            try:
-                period = datetime.timedelta(minutes=int(value[2]))
-            except ValueError:
-                raise exceptions.ParseError('available_between period must be an integer.')
-            return self._filter_available_between_with_period(
-                queryset, overlapping_reservations, available_start, available_end, period
-            )
-
-    def _filter_available_between_whole_range(self, queryset, reservations, available_start, available_end):
-        # exclude resources that have reservation(s) overlapping with the available_between range
-        queryset = queryset.exclude(reservations__in=reservations)
-        closed_resource_ids = {
-            resource.id
-            for resource in queryset
-            if not self._is_resource_open(resource, available_start, available_end)
-        }
-
-        return queryset.exclude(id__in=closed_resource_ids)
-
-    @staticmethod
-    def _is_resource_open(resource, start, end):
-        opening_hours = resource.get_opening_hours(start, end)
-        if len(opening_hours) > 1:
-            # range spans over multiple days, assume resources aren't open all night and skip the resource
-            return False
-
-        hours = next(iter(opening_hours.values()))[0]  # assume there is only one hours obj per day
-        if not hours['opens'] and not hours['closes']:
-            return False
-
-        start_too_early = hours['opens'] and start < hours['opens']
-        end_too_late = hours['closes'] and end > hours['closes']
-        if start_too_early or end_too_late:
-            return False
-
-        return True
-
-    def _filter_available_between_with_period(self, queryset, reservations, available_start, available_end, period):
-        reservations = reservations.order_by('begin').select_related('resource')
-
-        reservations_by_resource = collections.defaultdict(list)
-        for reservation in reservations:
-            reservations_by_resource[reservation.resource_id].append(reservation)
-
-        available_resources = set()
-
-        hours_qs = ResourceDailyOpeningHours.objects.filter(
-            open_between__overlap=(available_start, available_end, '[)'))
+            return queryset.available_between(available_start, available_end)
 
-        # check the resources one by one to determine which ones have open slots
-        for resource in queryset.prefetch_related(None).prefetch_related(
-                Prefetch('opening_hours', queryset=hours_qs, to_attr='prefetched_opening_hours')):
-            reservations = reservations_by_resource[resource.id]
-
-            if self._is_resource_available(resource, available_start, available_end, reservations, period):
-                available_resources.add(resource.id)
-
-        return queryset.filter(id__in=available_resources)
-
-    @staticmethod
-    def _is_resource_available(resource, available_start, available_end, reservations, period):
-        opening_hours = resource.get_opening_hours(available_start, available_end, resource.prefetched_opening_hours)
-        hours = next(iter(opening_hours.values()))[0]  # assume there is only one hours obj per day
-
-        if not (hours['opens'] or hours['closes']):
-            return False
-
-        current = max(available_start, hours['opens']) if hours['opens'] is not None else available_start
-        end = min(available_end, hours['closes']) if hours['closes'] is not None else available_end
-
-        if current >= end:
-            # the resource is already closed
-            return False
-
-        if not reservations:
-            # the resource has no reservations, just check if the period fits in the resource's opening times
-            if end - current >= period:
-                return True
-            return False
-
-        # try to find an open slot between reservations and opening / closing times.
-        # start from period start time or opening time depending on which one is earlier.
-        for reservation in reservations:
-            if reservation.end <= current:
-                # this reservation is in the past
-                continue
-            if reservation.begin - current >= period:
-                # found an open slot before the reservation currently being examined
-                return True
-            if reservation.end > end:
-                # the reservation currently being examined ends after the period or closing time,
-                # so no free slots
-                return False
-            # did not find an open slot before the reservation currently being examined,
-            # proceed to next reservation
-            current = reservation.end
-        else:
-            # all reservations checked and no free slot found, check if there is a free slot after the last
-            # reservation
-            if end - reservation.end >= period:
-                return True
-
-        return False
+        try:
+            period = datetime.timedelta(minutes=int(value[2]))
+        except ValueError:
+            raise exceptions.ParseError('available_between period must be an integer.')
+        return queryset.available_between(available_start, available_end, period)
 
     class Meta:
         model = Resource
@@ -1229,26 +1137,24 @@ class LocationFilterBackend(filters.BaseFilterBackend):
 
 class ResourceCacheMixin:
     def _preload_opening_hours(self, times):
-        # We have to evaluate the query here to make sure all the
-        # resources are on the same timezone. In case of different
-        # time zones, we skip this optimization.
-        time_zone = None
+        # The resources on the page may belong to units in different time
+        # zones, so the time range is determined separately for each time
+        # zone and the hours of the whole page are fetched with one query.
+        resources_by_time_zone = {}
         hours_by_resource = {}
         for resource in self._page:
-            if time_zone:
-                if resource.unit.time_zone != time_zone:
-                    return None
-            else:
-                time_zone = resource.unit.time_zone
+            if not resource.unit:
+                continue
+            resources_by_time_zone.setdefault(resource.unit.time_zone, []).append(resource)
             hours_by_resource[resource.id] = []
-        if not time_zone:
-            return None
-
-        begin, end = determine_hours_time_range(times.get('start'), times.get('end'), pytz.timezone(time_zone))
-        hours = ResourceDailyOpeningHours.objects.filter(
-            resource__in=self._page, open_between__overlap=(begin, end, '[)')
-        )
-        for obj in hours:
+        if not resources_by_time_zone:
+            return hours_by_resource
+
+        query = Q()
+        for time_zone, resources in resources_by_time_zone.items():
+            begin, end = determine_hours_time_range(times.get('start'), times.get('end'), pytz.timezone(time_zone))
+            query |= Q(resource__in=resources, open_between__overlap=(begin, end, '[)'))
+        for obj in ResourceDailyOpeningHours.objects.filter(query):
             hours_by_resource[obj.resource_id].append(obj)
         return hours_by_resource
 
@@ -1262,19 +1168,9 @@ class ResourceCacheMixin:
         return reservations_by_resource
 
     def _preload_permissions(self):
-        units = set()
-        resource_groups = set()
-        checker = ObjectPermissionChecker(self.request.user)
+        resolver = PermissionResolver.for_user(self.request.user)
         for res in self._page:
-            units.add(res.unit)
-            for g in res.groups.all():
-                resource_groups.add(g)
-            res._permission_checker = checker
-
-        if units:
-            checker.prefetch_perms(units)
-        if resource_groups:
-            checker.prefetch_perms(resource_groups)
+            res._permission_resolver = resolver
 
     def _get_cache_context(self):
         context = {}
@@ -2075,7 +1971,13 @@ class ResourceListViewSet(munigeo_api.GeoModelAPIView, mixins.ListModelMixin,
     queryset = queryset.prefetch_related('favorited_by', 'resource_equipment', 'resource_equipment__equipment',
                                          'purposes', 'images', 'purposes', 'groups', 'resource_tags')
     if settings.RESPA_PAYMENTS_ENABLED:
-        queryset = queryset.prefetch_related('products')
+        queryset = queryset.prefetch_related(
+            Prefetch('products', queryset=Product.objects.prefetch_related(
+                'product_customer_groups__customer_group__only_for_login_methods',
+                'time_slot_prices__customer_group_time_slot_prices__customer_group__only_for_login_methods',
+            )),
+            'price_summaries',
+        )
     filter_backends = (filters.SearchFilter, ResourceFilterBackend, LocationFilterBackend)
     search_fields = (
                     'name_fi', 'description_fi', 'unit__name_fi', 'type__name_fi',
@@ -1,4 +1,9 @@
+import uuid
+
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
 from .enums import UnitGroupAuthorizationLevel, UnitAuthorizationLevel
 
 def is_authenticated_user(user):
@@ -117,3 +122,123 @@ def has_api_permission(user, scope, permission, **kwargs):
     return is_authenticated_user(user) and \
         has_permission(user, '{app}.{scope}:api:{permission}' \
             .format(app=kwargs.get('app', 'resources'), scope=scope, permission=permission))
+
+
+PERMISSION_CACHE_VERSION_KEY = 'resources:permission_version'
+
+
+def get_permission_cache_version():
+    version = cache.get(PERMISSION_CACHE_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(PERMISSION_CACHE_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_permission_cache():
+    """
+    Make the permissions cached by PermissionResolver stale for all users
+    """
+    cache.set(PERMISSION_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class PermissionResolver:
+    """
+    Effective unit and resource group permissions of a user
+
+    The authorization levels of the user per unit, including the units
+    administered through unit groups, and the object permissions given per
+    unit and per resource group are fetched at once, so that checking the
+    permissions of any number of resources does not hit the database. The
+    user's own flags, such as is_superuser, are always read from the user.
+
+    Instances are meant to live for one request. With
+    RESPA_PERMISSION_CACHE_TIMEOUT set, the fetched permissions are also
+    cached across requests under the current permission version, which is
+    changed whenever authorizations or object permissions change.
+    """
+
+    def __init__(self, user, permissions=None):
+        self.user = user
+        if permissions is None:
+            permissions = self._fetch_permissions(user)
+        self.unit_levels, self.unit_perms, self.resource_group_perms = permissions
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        :type user: users.models.User | AnonymousUser
+        :rtype: PermissionResolver
+        """
+        timeout = settings.RESPA_PERMISSION_CACHE_TIMEOUT
+        if not timeout or not is_authenticated_user(user):
+            return cls(user)
+
+        key = 'resources:permissions:%s:%s' % (user.pk, get_permission_cache_version())
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = cls._fetch_permissions(user)
+            cache.set(key, permissions, timeout)
+        return cls(user, permissions)
+
+    @staticmethod
+    def _fetch_permissions(user):
+        from django.contrib.contenttypes.models import ContentType
+        from guardian.utils import get_group_obj_perms_model, get_user_obj_perms_model
+        from .models import ResourceGroup, Unit, UnitAuthorization, UnitGroup
+
+        unit_levels = {}
+        unit_perms = {}
+        resource_group_perms = {}
+        if not is_authenticated_user(user):
+            return unit_levels, unit_perms, resource_group_perms
+
+        for unit_id, level in UnitAuthorization.objects.filter(authorized=user).values_list('subject', 'level'):
+            unit_levels.setdefault(unit_id, set()).add(level)
+        group_admin_units = UnitGroup.members.through.objects.filter(
+            unitgroup__authorizations__authorized=user,
+            unitgroup__authorizations__level=UnitGroupAuthorizationLevel.admin,
+        ).values_list('unit', flat=True)
+        for unit_id in group_admin_units:
+            unit_levels.setdefault(unit_id, set()).add(UnitAuthorizationLevel.admin)
+
+        # Like guardian, inactive users don't have any object permissions
+        if not user.is_active:
+            return unit_levels, unit_perms, resource_group_perms
+
+        perms_by_content_type = {
+            ContentType.objects.get_for_model(Unit).pk: unit_perms,
+            ContentType.objects.get_for_model(ResourceGroup).pk: resource_group_perms,
+        }
+        object_perms = [
+            get_user_obj_perms_model().objects.filter(user=user),
+            get_group_obj_perms_model().objects.filter(group__user=user),
+        ]
+        for queryset in object_perms:
+            rows = queryset.filter(content_type__in=perms_by_content_type.keys()).values_list(
+                'content_type', 'object_pk', 'permission__codename'
+            )
+            for content_type_id, object_pk, codename in rows:
+                perms_by_content_type[content_type_id].setdefault(object_pk, set()).add(codename)
+
+        return unit_levels, unit_perms, resource_group_perms
+
+    def is_for(self, user):
+        if not is_authenticated_user(user):
+            return not is_authenticated_user(self.user)
+        return is_authenticated_user(self.user) and self.user.pk == user.pk
+
+    def is_unit_admin(self, unit):
+        return is_general_admin(self.user) or UnitAuthorizationLevel.admin in self.unit_levels.get(unit.pk, ())
+
+    def is_unit_manager(self, unit):
+        return UnitAuthorizationLevel.manager in self.unit_levels.get(unit.pk, ())
+
+    def is_unit_viewer(self, unit):
+        return UnitAuthorizationLevel.viewer in self.unit_levels.get(unit.pk, ())
+
+    def has_unit_perm(self, unit, perm):
+        return perm in self.unit_perms.get(str(unit.pk), ())
+
+    def has_resource_group_perm(self, resource_group, perm):
+        return perm in self.resource_group_perms.get(str(resource_group.pk), ())
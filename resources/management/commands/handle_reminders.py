@@ -1,21 +1,82 @@
-from django.core.management.base import BaseCommand, CommandError
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
 from resources.models.reservation import ReservationReminder
 
-from time import time
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
     help = "Handles email notification reminders."
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Reminders sent per batch (default: 100)')
+        parser.add_argument('--workers', type=int, default=1, help='Batches sent in parallel (default: 1)')
+
+    def _send_batch(self, batch_size, now):
+        """
+        Sends one batch of due reminders and deletes them
+
+        The reminders stay locked until they are deleted, so other workers
+        and other runs of this command skip them.
+
+        :rtype: int number of reminders sent
+        """
+        with transaction.atomic():
+            reminders = ReservationReminder.objects.claim_due(batch_size, at=now)
+            if not reminders:
+                return 0
+            # the messages of a batch share one connection to the mail server
+            with get_connection() as connection:
+                for reminder in reminders:
+                    try:
+                        reminder.remind(connection=connection)
+                    except Exception:
+                        logger.exception('Sending reminder %s failed', reminder.pk)
+            ReservationReminder.objects.filter(pk__in=[reminder.pk for reminder in reminders]).delete()
+        return len(reminders)
+
+    def _send_due(self, batch_size, now, close_connection=False):
+        sent = 0
+        try:
+            while True:
+                count = self._send_batch(batch_size, now)
+                if not count:
+                    return sent
+                sent += count
+        finally:
+            if close_connection:
+                # worker threads have database connections of their own
+                connections.close_all()
+
     def handle(self, *args, **options):
-        if not ReservationReminder.objects.all():
-            print('No reminders.')
-            return
-        for reminder in ReservationReminder.objects.all():
-            if reminder.reservation.state == 'cancelled':
-                reminder.delete()
-            elif reminder.reservation.state == 'confirmed':
-                if int(time()) > reminder.get_unix_timestamp():
-                    reminder.remind()
-                    reminder.delete()
+        start = time.monotonic()
+        now = timezone.now()
+
+        deleted, _ = ReservationReminder.objects.cancelled().delete()
 
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [
+                    executor.submit(self._send_due, options['batch_size'], now, close_connection=True)
+                    for _ in range(options['workers'])
+                ]
+                sent = sum(future.result() for future in futures)
+        else:
+            sent = self._send_due(options['batch_size'], now)
+
+        elapsed = time.monotonic() - start
+        if not sent and not deleted:
+            self.stdout.write('No reminders.')
+            return
+        logger.info('Sent %d reminders in %.2f s (%.1f/s), deleted %d cancelled',
+                    sent, elapsed, sent / elapsed, deleted)
+        self.stdout.write('Sent %d reminders in %.2f s (%.1f/s), deleted %d reminders of cancelled reservations' % (
+            sent, elapsed, sent / elapsed, deleted
+        ))
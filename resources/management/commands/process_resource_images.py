@@ -0,0 +1,76 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from resources.models import ResourceImage
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Processes uploaded resource images and generates their renditions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='Images processed per batch (default: 10)')
+        parser.add_argument('--workers', type=int, default=1, help='Batches processed in parallel (default: 1)')
+
+    def _process_batch(self, batch_size):
+        """
+        Processes one batch of pending images
+
+        The images stay locked until they are processed, so other workers
+        and other runs of this command skip them. Images that cannot be
+        processed are left in the failed state.
+
+        :rtype: tuple[int, int] numbers of images processed and failed
+        """
+        with transaction.atomic():
+            images = ResourceImage.objects.claim_pending(batch_size)
+            failed = []
+            for image in images:
+                try:
+                    with transaction.atomic():
+                        image.process()
+                except Exception:
+                    logger.exception('Processing resource image %s failed', image.pk)
+                    failed.append(image.pk)
+            ResourceImage.objects.filter(pk__in=failed).update(processing_state=ResourceImage.FAILED)
+        return len(images) - len(failed), len(failed)
+
+    def _process_pending(self, batch_size, close_connection=False):
+        total_processed = total_failed = 0
+        try:
+            while True:
+                processed, failed = self._process_batch(batch_size)
+                if not processed and not failed:
+                    return total_processed, total_failed
+                total_processed += processed
+                total_failed += failed
+        finally:
+            if close_connection:
+                # worker threads have database connections of their own
+                connections.close_all()
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [
+                    executor.submit(self._process_pending, options['batch_size'], close_connection=True)
+                    for _ in range(options['workers'])
+                ]
+                results = [future.result() for future in futures]
+            processed = sum(result[0] for result in results)
+            failed = sum(result[1] for result in results)
+        else:
+            processed, failed = self._process_pending(options['batch_size'])
+
+        elapsed = time.monotonic() - start
+        # an empty queue may be checked faster than the clock ticks
+        rate = processed / elapsed if elapsed else 0.0
+        logger.info('Processed %d images in %.2f s (%.1f/s), %d failed', processed, elapsed, rate, failed)
+        self.stdout.write('Processed %d images in %.2f s (%.1f/s), %d failed' % (processed, elapsed, rate, failed))
@@ -0,0 +1,79 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from resources.models import Resource, Unit
+from resources.models.resource import update_resources_opening_hours
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily opening hours of all resources in parallel batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unit', action='append', dest='units', help='Rebuild only the given unit(s)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Resources per batch (default: 100)')
+        parser.add_argument('--workers', type=int, default=4, help='Batches processed in parallel (default: 4)')
+
+    def _rebuild_batch(self, unit, resources, close_connection=False):
+        start = time.monotonic()
+        try:
+            update_resources_opening_hours(unit, resources)
+        except Exception:
+            logger.exception('Rebuilding opening hours of unit %s failed', unit.pk)
+            return None
+        finally:
+            if close_connection:
+                # worker threads have database connections of their own
+                connections.close_all()
+        return time.monotonic() - start
+
+    def _report_batch(self, unit, resources, elapsed):
+        if elapsed is None:
+            self.stdout.write('%s: %d resources failed' % (unit.pk, len(resources)))
+        else:
+            self.stdout.write('%s: %d resources in %.2f s' % (unit.pk, len(resources), elapsed))
+
+    def handle(self, *args, **options):
+        units = Unit.objects.all()
+        if options['units']:
+            units = units.filter(pk__in=options['units'])
+
+        resources_by_unit = {}
+        for resource in Resource.objects.filter(unit__in=units).order_by('unit', 'pk'):
+            resources_by_unit.setdefault(resource.unit_id, []).append(resource)
+
+        batch_size = options['batch_size']
+        batches = []
+        for unit in units.filter(pk__in=resources_by_unit.keys()):
+            resources = resources_by_unit[unit.pk]
+            for i in range(0, len(resources), batch_size):
+                batches.append((unit, resources[i:i + batch_size]))
+
+        logger.info('Rebuilding opening hours of %d resources in %d batches...',
+                    sum(len(resources) for _, resources in batches), len(batches))
+        start = time.monotonic()
+        results = []
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = {
+                    executor.submit(self._rebuild_batch, unit, resources, close_connection=True): (unit, resources)
+                    for unit, resources in batches
+                }
+                for future in as_completed(futures):
+                    unit, resources = futures[future]
+                    results.append(future.result())
+                    self._report_batch(unit, resources, results[-1])
+        else:
+            for unit, resources in batches:
+                results.append(self._rebuild_batch(unit, resources))
+                self._report_batch(unit, resources, results[-1])
+
+        failed = results.count(None)
+        self.stdout.write('Rebuilt %d batches in %.2f s, %d failed' % (
+            len(batches) - failed, time.monotonic() - start, failed
+        ))
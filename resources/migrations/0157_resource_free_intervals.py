@@ -0,0 +1,69 @@
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+import django.db.models.deletion
+import resources.models.gistindex
+
+
+def get_free_intervals(opens, closes, reservations):
+    # a copy of resources.models.availability.get_free_intervals at the time of this migration
+    free = []
+    for begin, end in reservations:
+        if begin >= closes:
+            break
+        if end <= opens:
+            continue
+        if begin > opens:
+            free.append((opens, begin))
+        opens = end
+        if opens >= closes:
+            return free
+
+    free.append((opens, closes))
+    return free
+
+
+def create_free_intervals(apps, schema_editor):
+    ResourceDailyOpeningHours = apps.get_model('resources', 'ResourceDailyOpeningHours')
+    ResourceFreeInterval = apps.get_model('resources', 'ResourceFreeInterval')
+    Reservation = apps.get_model('resources', 'Reservation')
+
+    resource_ids = ResourceDailyOpeningHours.objects.values_list('resource_id', flat=True).distinct()
+    for resource_id in resource_ids:
+        reservations = list(
+            Reservation.objects.filter(resource_id=resource_id)
+            .exclude(state__in=('cancelled', 'denied'))
+            .order_by('begin').values_list('begin', 'end')
+        )
+        free_objs = []
+        for h in ResourceDailyOpeningHours.objects.filter(resource_id=resource_id):
+            opens, closes = h.open_between.lower, h.open_between.upper
+            overlapping = [r for r in reservations if r[0] < closes and r[1] > opens]
+            free_objs += [
+                ResourceFreeInterval(resource_id=resource_id, opening_hours=h, free_between=(begin, end, '[)'))
+                for begin, end in get_free_intervals(opens, closes, overlapping)
+            ]
+        ResourceFreeInterval.objects.bulk_create(free_objs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0156_overnight_reservation_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceFreeInterval',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('free_between', django.contrib.postgres.fields.ranges.DateTimeRangeField()),
+                ('opening_hours', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_intervals', to='resources.resourcedailyopeninghours')),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_intervals', to='resources.resource')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resourcefreeinterval',
+            index=resources.models.gistindex.GistIndex(fields=['free_between'], name='resources_r_free_be_e85788_gist'),
+        ),
+        migrations.RunPython(create_free_intervals, migrations.RunPython.noop),
+    ]
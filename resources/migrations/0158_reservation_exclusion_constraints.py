@@ -0,0 +1,33 @@
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0157_resource_free_intervals'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='reservation',
+            name='enforced_cooldown',
+            field=models.DurationField(blank=True, editable=False, null=True, verbose_name='Enforced cooldown'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='cooldown_duration',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, editable=False, null=True, verbose_name='Length of reservation with cooldown'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('enforced_cooldown__isnull', False), models.Q(('state__in', ('cancelled', 'denied')), _negated=True)), expressions=[('resource', '='), ('duration', '&&')], name='resources_reservation_no_collision'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('state__in', ('cancelled', 'denied')), _negated=True), expressions=[('resource', '='), ('cooldown_duration', '&&')], name='resources_reservation_no_cooldown_collision'),
+        ),
+    ]
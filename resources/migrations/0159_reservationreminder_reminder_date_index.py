@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0158_reservation_exclusion_constraints'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservationreminder',
+            name='reminder_date',
+            field=models.DateTimeField(db_index=True, verbose_name='Reminder date'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0159_reservationreminder_reminder_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resourceimage',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='Processing state'),
+        ),
+    ]
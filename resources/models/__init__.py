@@ -7,7 +7,7 @@ from .reservation import (
 )
 from .resource import (
     Purpose, Resource, ResourceType, ResourceImage, ResourceEquipment, ResourceGroup,
-    ResourceDailyOpeningHours, TermsOfUse, ResourceTag, ResourceUniversalField,
+    ResourceDailyOpeningHours, ResourceFreeInterval, TermsOfUse, ResourceTag, ResourceUniversalField,
     ResourceUniversalFormOption, ResourcePublishDate
 )
 from .equipment import Equipment, EquipmentAlias, EquipmentCategory
@@ -39,6 +39,7 @@ __all__ = [
     'ResourceTag',
     'ResourceAccessibility',
     'ResourceDailyOpeningHours',
+    'ResourceFreeInterval',
     'ResourceEquipment',
     'ResourceGroup',
     'ResourceImage',
@@ -1,10 +1,12 @@
 import datetime
 from collections import OrderedDict
+from functools import lru_cache
 
 import pytz
 import django.contrib.postgres.fields as pgfields
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.utils.dateformat import time_format
 from django.utils.translation import gettext_lazy as _
 from psycopg2.extras import DateRange, NumericRange
@@ -17,6 +19,9 @@ STATE_BOOLS = {
 }
 
 
+# Localizing is the most expensive part of calculating opening hours, and
+# resources of the same unit mostly share their hours, so cache the results.
+@lru_cache(maxsize=8192)
 def combine_datetime(date, time, tz):
     return tz.localize(datetime.datetime.combine(date, time))
 
@@ -29,7 +34,7 @@ def datetime_to_date(dt, tz):
     return dt.date()
 
 
-def get_opening_hours(time_zone, periods, begin, end=None):
+def get_opening_hours(time_zone, periods, begin, end=None, days=None):
     """
     Returns opening and closing times for a given date range
 
@@ -37,10 +42,13 @@ def get_opening_hours(time_zone, periods, begin, end=None):
         and values are a list of Day objects for that day's active period
         containing opening and closing hours
 
+    The days of the periods are fetched unless they are given in `days`.
+
     :rtype : dict[str, list[dict[str, datetime.datetime]]]
     :type periods: list[Period]
     :type begin: datetime.date | datetime.datetime
     :type end: datetime.date | None
+    :type days: list[Day] | None
     """
 
     tz = pytz.timezone(time_zone)
@@ -69,39 +77,167 @@ def get_opening_hours(time_zone, periods, begin, end=None):
             p.priority = 0
     periods.sort(key=lambda x: (-x.priority, x.end - x.start))
 
-    days = list(Day.objects.filter(period__in=periods))
+    if days is None:
+        days = list(Day.objects.filter(period__in=periods))
+    days_by_period = {}
+    for day in days:
+        days_by_period.setdefault(day.period_id, {})[day.weekday] = day
     for period in periods:
-        period.range_days = {day.weekday: day for day in days if day.period_id == period.id}
+        period.range_days = days_by_period.get(period.id, {})
 
-    date = begin
     dates = OrderedDict()
-    while date <= end:
+    weekday = begin.weekday()
+    for i, period in enumerate(get_active_periods(periods, begin, end)):
+        date = begin + datetime.timedelta(days=i)
         opens = None
         closes = None
-        for period in periods:
-            if period.start > date or period.end < date:
-                continue
-            # Currently the 'closed' field of periods do not
-            # always contain sensible data. Ignore it for now.
-            if False and period.closed:
-                break
-            day = period.range_days.get(date.weekday())
-            if day is None or day.closed:
-                break
+        # The 'closed' field of periods does not always contain
+        # sensible data, so only the days are looked at.
+        day = period.range_days.get((weekday + i) % 7) if period else None
+        if day is not None and not day.closed:
             opens = combine_datetime(date, day.opens, tz)
             closes = combine_datetime(date, day.closes, tz)
             if opens == closes:
                 # The interval is zero-length
                 opens = None
                 closes = None
-            break
 
         dates[date] = [{'opens': opens, 'closes': closes}]
-        date += datetime.timedelta(days=1)
 
     return dates
 
 
+def get_active_periods(periods, begin, end):
+    """
+    Returns the period in effect for each date from `begin` to `end`
+
+    The periods are laid over an array of the dates one slice at a time,
+    starting from the least important one, so the cost is one slice
+    assignment per period instead of checking every period for every date.
+    Dates no period covers are None.
+
+    :rtype : list[Period | None]
+    :type periods: list[Period] most important first
+    :type begin: datetime.date
+    :type end: datetime.date
+    """
+    count = (end - begin).days + 1
+    active = [None] * count
+    for period in reversed(periods):
+        first = max((period.start - begin).days, 0)
+        last = min((period.end - begin).days + 1, count)
+        if first < last:
+            active[first:last] = [period] * (last - first)
+    return active
+
+
+def get_resources_opening_hours(resources, begin, end):
+    """
+    Returns opening hours of many resources for a given date range
+
+    The periods and days of the resources and their units are fetched with
+    a single query each. Return value is a dict where keys are resource ids
+    and values are dicts of the dates the resource is open and their
+    (opens, closes) tuples. Resources without a unit are left out.
+
+    :rtype : dict[str, dict[datetime.date, tuple[datetime.datetime, datetime.datetime]]]
+    :type resources: iterable[Resource]
+    :type begin: datetime.date
+    :type end: datetime.date
+    """
+    from .unit import Unit
+
+    resources = [resource for resource in resources if resource.unit_id]
+    unit_ids = {resource.unit_id for resource in resources}
+    time_zones = dict(Unit.objects.filter(pk__in=unit_ids).values_list('pk', 'time_zone'))
+
+    periods = list(Period.objects.filter(
+        Q(resource__in=[resource.pk for resource in resources]) | Q(unit__in=unit_ids),
+        start__lte=end, end__gte=begin,
+    ))
+    days_by_period = {}
+    for day in Day.objects.filter(period__in=periods):
+        days_by_period.setdefault(day.period_id, []).append(day)
+
+    # Periods set for the resource always carry a higher priority than
+    # the periods of its unit.
+    unit_periods = {}
+    resource_periods = {}
+    for period in periods:
+        if period.resource_id:
+            period.priority = 1
+            resource_periods.setdefault(period.resource_id, []).append(period)
+        else:
+            period.priority = 0
+            unit_periods.setdefault(period.unit_id, []).append(period)
+
+    opening_hours = {}
+    for resource in resources:
+        all_periods = unit_periods.get(resource.unit_id, []) + resource_periods.get(resource.pk, [])
+        days = [day for period in all_periods for day in days_by_period.get(period.id, [])]
+        hours = get_opening_hours(time_zones[resource.unit_id], all_periods, begin, end, days=days)
+        opening_hours[resource.pk] = OrderedDict(
+            (date, (h['opens'], h['closes'])) for date, hours_items in hours.items()
+            for h in hours_items if h['opens']
+        )
+    return opening_hours
+
+
+def get_free_intervals(opens, closes, reservations):
+    """
+    Returns the parts of the opening hours that are not reserved
+
+    :rtype : list[tuple[datetime.datetime, datetime.datetime]]
+    :type opens: datetime.datetime
+    :type closes: datetime.datetime
+    :type reservations: iterable[tuple[datetime.datetime, datetime.datetime]]
+        (begin, end) pairs ordered by begin
+    """
+    free = []
+    for begin, end in reservations:
+        if begin >= closes:
+            break
+        if end <= opens:
+            continue
+        if begin > opens:
+            free.append((opens, begin))
+        opens = end
+        if opens >= closes:
+            return free
+
+    free.append((opens, closes))
+    return free
+
+
+def get_periods_state(periods):
+    """
+    Returns a snapshot of the periods and their days that can be compared
+    with `get_changed_dates`
+
+    :type periods: django.db.models.QuerySet
+    """
+    return {
+        period.pk: (period.start, period.end, frozenset(
+            (day.weekday, day.opens, day.closes, day.closed) for day in period.days.all()
+        ))
+        for period in periods.prefetch_related('days')
+    }
+
+
+def get_changed_dates(old_state, new_state):
+    """
+    Returns the first and the last date of the periods that were added,
+    removed or changed between two snapshots, or None if nothing changed
+
+    :rtype : tuple[datetime.date, datetime.date] | None
+    """
+    changed = [state for pk, state in old_state.items() if new_state.get(pk) != state]
+    changed += [state for pk, state in new_state.items() if old_state.get(pk) != state]
+    if not changed:
+        return None
+    return min(state[0] for state in changed), max(state[1] for state in changed)
+
+
 class Period(models.Model):
     """
     A period of time to express state of open or closed
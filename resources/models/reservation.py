@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 import datetime
+from contextlib import contextmanager
+
 import pytz
 
 from django.utils import timezone
@@ -8,11 +10,15 @@ import django.contrib.postgres.fields as pgfields
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.gis.db import models
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import RangeOperators
 from django.utils import translation
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import ExpressionWrapper, F, Func, Q, Value
+from django.utils.functional import cached_property
 from psycopg2.extras import DateTimeTZRange
 
 from notifications.models import NotificationTemplate, NotificationTemplateException, NotificationType, NotificationTemplateGroup
@@ -22,12 +28,14 @@ from resources.signals import (
 from .base import ModifiableModel, NameIdentifiedModel
 from .resource import generate_access_code, validate_access_code
 from .resource import Resource
+from .availability import datetime_to_date
 from .utils import (
-    get_dt, save_dt, is_valid_time_slot, humanize_duration, send_respa_mail, send_respa_sms,
+    get_dt, save_dt, is_valid_time_slot, humanize_duration, send_notification,
     DEFAULT_LANG, localize_datetime, format_dt_range, format_dt_range_alt, build_reservations_ical_file,
     get_order_quantity, get_order_tax_price, get_order_pretax_price, get_payment_requested_waiting_time,
     calculate_final_product_sums, calculate_final_order_sums
 )
+from ..auth import is_authenticated_user
 from ..enums import UnitAuthorizationLevel
 
 from random import sample
@@ -47,6 +55,40 @@ RESERVATION_EXTRA_FIELDS = ('reserver_name', 'reserver_phone_number', 'reserver_
                             ) + RESERVATION_BILLING_FIELDS
 
 
+RESERVATION_COLLISION_CONSTRAINT = 'resources_reservation_no_collision'
+RESERVATION_COOLDOWN_CONSTRAINT = 'resources_reservation_no_cooldown_collision'
+
+
+def reservation_collision_error():
+    return ValidationError({'period': _("The resource is already reserved for some of the period")},
+                           code='invalid_period_range')
+
+
+def reservation_cooldown_error():
+    return ValidationError({'cooldown': _("Cannot be reserved during cooldown")}, code='cooldown_collision')
+
+
+@contextmanager
+def reservation_constraint_errors():
+    """
+    Raise the validation errors of Reservation.clean for reservations that
+    violate the exclusion constraints enforcing the same rules in the database
+
+    The block is run in a savepoint so that the surrounding transaction can
+    still be used after a violation.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as exc:
+        constraint_name = getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None)
+        if constraint_name == RESERVATION_COLLISION_CONSTRAINT:
+            raise reservation_collision_error()
+        if constraint_name == RESERVATION_COOLDOWN_CONSTRAINT:
+            raise reservation_cooldown_error()
+        raise
+
+
 class ReservationQuerySet(models.QuerySet):
     def current(self):
         return self.exclude(state__in=(Reservation.CANCELLED, Reservation.DENIED))
@@ -58,6 +100,22 @@ class ReservationQuerySet(models.QuerySet):
         qs = Q(begin__lt=end) & Q(end__gt=begin)
         return self.filter(qs)
 
+    def limit_enforced_cooldown(self, cooldown):
+        """
+        Lower the cooldown enforced on the reservations to at most `cooldown`
+
+        Only the reservations whose cooldown has not passed yet are updated,
+        so the database does not reject reservations the lowered cooldown
+        of their resource allows.
+        """
+        reservations = self.current().filter(enforced_cooldown__gt=cooldown, cooldown_duration__endswith__gt=now())
+        if not cooldown:
+            return reservations.update(enforced_cooldown=cooldown, cooldown_duration=None)
+        return reservations.update(enforced_cooldown=cooldown, cooldown_duration=Func(
+            F('begin'), ExpressionWrapper(F('end') + Value(cooldown), output_field=models.DateTimeField()),
+            Value('[)'), function='tstzrange', output_field=pgfields.DateTimeRangeField(),
+        ))
+
     def for_date(self, date):
         if isinstance(date, str):
             date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
@@ -109,6 +167,150 @@ class ReservationBulk(ModifiableModel):
     def __str__(self):
         return f"{_('Recurring reservation')} <{self.created_by}>"
 
+
+class ReservationValidationContext:
+    """
+    The data needed to validate reservations of a resource, fetched once
+
+    The opening hours, the reservations around the given time range that
+    may collide, the overlapping reservations of the unit and the active
+    reservations of the user are fetched on first use, the reservations
+    with a single query, so that any number of reservations between `begin`
+    and `end` can then be validated in memory. Reservations added to the
+    context are taken into account when validating the following ones,
+    which makes overlaps within a batch of new reservations collide as well.
+    """
+
+    def __init__(self, resource, user, begin, end, exclude=None):
+        """
+        :type resource: Resource
+        :type user: users.models.User | None
+        :type begin: datetime.datetime
+        :type end: datetime.datetime
+        :type exclude: Reservation | None the reservation being modified
+        """
+        self.resource = resource
+        self.user = user
+        self.begin = begin
+        self.end = end
+        self.exclude = exclude if exclude and exclude.pk else None
+
+    @cached_property
+    def opening_hours(self):
+        # The dates are looked up both in the local time zone and in the
+        # time zone of the reservation, so include a day on both sides.
+        tz = self.resource.unit.get_tz()
+        return self.resource.get_opening_hours(
+            datetime_to_date(self.begin, tz) - datetime.timedelta(days=1),
+            datetime_to_date(self.end, tz) + datetime.timedelta(days=1),
+        )
+
+    @cached_property
+    def check_unit_overlaps(self):
+        return bool(
+            self.resource.unit.disallow_overlapping_reservations and not
+            self.resource.can_create_overlapping_reservations(self.user) and not
+            isinstance(self.user, AnonymousUser)
+        )
+
+    @cached_property
+    def auth_level(self):
+        """
+        The highest authorization level of the user in the unit of the resource
+
+        :rtype: UnitAuthorizationLevel | None
+        """
+        return self.resource.unit.get_highest_authorization_level_for_user(self.user)
+
+    @cached_property
+    def _reservation_rows(self):
+        resource = self.resource
+        cooldown = resource.cooldown or datetime.timedelta(0)
+        querysets = {
+            'resource': resource.reservations.filter(
+                end__gt=self.begin - cooldown, begin__lt=self.end + cooldown
+            ).active(),
+        }
+        if self.check_unit_overlaps:
+            unit = resource.unit
+            unit_reservations = Reservation.objects.filter(
+                resource__unit=unit, end__gte=self.begin, begin__lte=self.end
+            ).exclude(state=Reservation.CANCELLED)
+            if unit.disallow_overlapping_reservations_per_user:
+                unit_reservations = unit_reservations.filter(user=self.user)
+            querysets['unit'] = unit_reservations
+        if self.exclude:
+            querysets = {key: queryset.exclude(pk=self.exclude.pk) for key, queryset in querysets.items()}
+        if resource.max_reservations_per_user is not None and is_authenticated_user(self.user):
+            querysets['user'] = resource.reservations.filter(user=self.user).active()
+
+        querysets = [
+            queryset.order_by().values_list('begin', 'end', 'type', Value(key, output_field=models.CharField()))
+            for key, queryset in querysets.items()
+        ]
+        rows = {'resource': [], 'unit': [], 'user': []}
+        for begin, end, reservation_type, key in querysets[0].union(*querysets[1:], all=True):
+            rows[key].append((begin, end, reservation_type))
+        return rows
+
+    @cached_property
+    def reservations(self):
+        """
+        (begin, end, type) of the active reservations of the resource that
+        end or begin within the cooldown of the time range
+        """
+        return list(self._reservation_rows['resource'])
+
+    @cached_property
+    def unit_reservations(self):
+        """
+        (begin, end) of the reservations of the unit that overlap the time
+        range, if the unit does not allow overlapping reservations
+        """
+        return [(begin, end) for begin, end, _ in self._reservation_rows['unit']]
+
+    @cached_property
+    def active_reservation_count(self):
+        """
+        The number of active reservations of the user for the resource, if
+        the resource limits the number
+        """
+        return len(self._reservation_rows['user'])
+
+    def add(self, reservation):
+        """
+        Take a validated reservation into account when validating the rest
+        """
+        self.reservations.append((reservation.begin, reservation.end, reservation.type))
+        if self.check_unit_overlaps:
+            self.unit_reservations.append((reservation.begin, reservation.end))
+
+    def has_collision(self, begin, end):
+        return any(r_end > begin and r_begin < end for r_begin, r_end, _ in self.reservations)
+
+    def has_cooldown_collision(self, begin, end):
+        cooldown_start = begin - self.resource.cooldown
+        cooldown_end = end + self.resource.cooldown
+        return any(
+            r_type != Reservation.TYPE_BLOCKED and (
+                cooldown_start < r_begin < cooldown_end or
+                cooldown_start < r_end < cooldown_end or
+                (r_begin < cooldown_start and r_end > begin) or
+                (r_begin < end and r_end > cooldown_end)
+            )
+            for r_begin, r_end, r_type in self.reservations
+        )
+
+    def has_unit_overlap(self, begin, end):
+        return any(
+            begin < r_begin < end or
+            (r_begin < begin and r_end > begin) or
+            (r_begin >= begin and r_end <= end) or
+            (r_begin <= begin and r_end > end)
+            for r_begin, r_end in self.unit_reservations
+        )
+
+
 class Reservation(ModifiableModel):
     CREATED = 'created'
     CANCELLED = 'cancelled'
@@ -142,6 +344,13 @@ class Reservation(ModifiableModel):
     end = models.DateTimeField(verbose_name=_('End time'))
     duration = pgfields.DateTimeRangeField(verbose_name=_('Length of reservation'), null=True,
                                            blank=True, db_index=True)
+    # Set when the reservation has been validated against the others. Only
+    # those reservations are covered by the exclusion constraints, which
+    # leaves out the ones synchronized from external calendars.
+    enforced_cooldown = models.DurationField(verbose_name=_('Enforced cooldown'), null=True, blank=True,
+                                             editable=False)
+    cooldown_duration = pgfields.DateTimeRangeField(verbose_name=_('Length of reservation with cooldown'),
+                                                    null=True, blank=True, editable=False)
     comments = models.TextField(null=True, blank=True, verbose_name=_('Comments'))
     user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('User'), null=True,
                              blank=True, db_index=True, on_delete=models.PROTECT)
@@ -217,6 +426,18 @@ class Reservation(ModifiableModel):
         verbose_name = _("reservation")
         verbose_name_plural = _("reservations")
         ordering = ('id',)
+        constraints = [
+            ExclusionConstraint(
+                name=RESERVATION_COLLISION_CONSTRAINT,
+                expressions=[('resource', RangeOperators.EQUAL), ('duration', RangeOperators.OVERLAPS)],
+                condition=Q(enforced_cooldown__isnull=False) & ~Q(state__in=('cancelled', 'denied')),
+            ),
+            ExclusionConstraint(
+                name=RESERVATION_COOLDOWN_CONSTRAINT,
+                expressions=[('resource', RangeOperators.EQUAL), ('cooldown_duration', RangeOperators.OVERLAPS)],
+                condition=~Q(state__in=('cancelled', 'denied')),
+            ),
+        ]
 
     def _save_dt(self, attr, dt):
         """
@@ -422,6 +643,25 @@ class Reservation(ModifiableModel):
         reminder.save()
         self.reminder = reminder
 
+    @staticmethod
+    def create_reminders(reservations):
+        """
+        Create the reminders of many reservations with one query each for
+        the reminders and the reservations
+        """
+        reminders = []
+        for reservation in reservations:
+            r_date = reservation.begin - datetime.timedelta(hours=int(reservation.resource.unit.sms_reminder_delay))
+            reservation.reminder = ReservationReminder(reservation=reservation, reminder_date=r_date)
+            reminders.append(reservation.reminder)
+        if not reminders:
+            return
+        ReservationReminder.objects.bulk_create(reminders)
+        for reservation in reservations:
+            # re-assign to pick up the primary key of the reminder
+            reservation.reminder = reservation.reminder
+        Reservation.objects.bulk_update(reservations, ['reminder'])
+
     def modify_reminder(self):
         if not self.reminder:
             return
@@ -443,6 +683,9 @@ class Reservation(ModifiableModel):
         If this reservation isn't yet saved and it will modify an existing reservation,
         the original reservation need to be provided in kwargs as 'original_reservation', so
         that it can be excluded when checking if the resource is available.
+
+        When validating many reservations at once, a ReservationValidationContext
+        covering all of them can be given in kwargs as 'context'.
         """
 
         if 'user' in kwargs:
@@ -455,8 +698,15 @@ class Reservation(ModifiableModel):
         if self.end <= self.begin:
             raise ValidationError(_("You must end the reservation after it has begun"))
 
+        original_reservation = self if self.pk else kwargs.get('original_reservation', None)
+        context = kwargs.get('context')
+        if context is None:
+            context = ReservationValidationContext(
+                self.resource, user, self.begin, self.end, exclude=original_reservation
+            )
+
         # Check that begin and end times are on valid time slots.
-        opening_hours = self.resource.get_opening_hours(self.begin.date(), self.end.date())
+        opening_hours = context.opening_hours
         for dt in (self.begin, self.end):
             days = opening_hours.get(dt.date(), [])
             day = next((day for day in days if day['opens'] is not None and day['opens'] <= dt <= day['closes']), None)
@@ -464,45 +714,29 @@ class Reservation(ModifiableModel):
                 raise ValidationError(_("Begin and end time must match time slots"), code='invalid_time_slot')
 
         # Check if Unit has disallow_overlapping_reservations value of True
-        if (
-            self.resource.unit.disallow_overlapping_reservations and not
-            self.resource.can_create_overlapping_reservations(user) and not
-            isinstance(user, AnonymousUser)
-        ):
-            if self.resource.unit.disallow_overlapping_reservations_per_user:
-                reservations_for_same_unit = Reservation.objects.filter(user=user, resource__unit=self.resource.unit)
-            else:
-                reservations_for_same_unit = Reservation.objects.filter(resource__unit=self.resource.unit)
-
-            original = kwargs.get('original_reservation', None)
-            if original:
-                reservations_for_same_unit = reservations_for_same_unit.exclude(id=original.id)
-
-            valid_reservations_for_same_unit = reservations_for_same_unit.exclude(state=Reservation.CANCELLED)
-            user_has_conflicting_reservations = valid_reservations_for_same_unit.filter(
-                Q(begin__gt=self.begin, begin__lt=self.end)
-                | Q(begin__lt=self.begin, end__gt=self.begin)
-                | Q(begin__gte=self.begin, end__lte=self.end)
-                | Q(begin__lte=self.begin, end__gt=self.end)
+        if context.check_unit_overlaps and context.has_unit_overlap(self.begin, self.end):
+            raise ValidationError(
+                _('This unit does not allow overlapping reservations for its resources'),
+                code='conflicting_reservation'
             )
 
-            if user_has_conflicting_reservations:
-                raise ValidationError(
-                    _('This unit does not allow overlapping reservations for its resources'),
-                    code='conflicting_reservation'
-                )
+        if context.has_collision(self.begin, self.end):
+            raise reservation_collision_error()
 
-        original_reservation = self if self.pk else kwargs.get('original_reservation', None)
-        if self.resource.check_reservation_collision(self.begin, self.end, original_reservation):
-            raise ValidationError({'period': _("The resource is already reserved for some of the period")}, code='invalid_period_range')
 
-
-        user_unit_auth_level = self.resource.unit.get_highest_authorization_level_for_user(user)
+        user_unit_auth_level = context.auth_level if self.resource.cooldown else None
         is_at_least_viewer = user_unit_auth_level >= UnitAuthorizationLevel.viewer if user_unit_auth_level else None
         
         if self.resource.cooldown:
-            if not is_at_least_viewer and self.resource.check_cooldown_collision(self.begin, self.end, original_reservation):
-                raise ValidationError({ 'cooldown': _("Cannot be reserved during cooldown") }, code='cooldown_collision')
+            if not is_at_least_viewer and context.has_cooldown_collision(self.begin, self.end):
+                raise reservation_cooldown_error()
+
+        # The database enforces the same collision and cooldown rules on
+        # saving, which closes the race between concurrent reservations.
+        if self.resource.cooldown and not is_at_least_viewer and self.type != Reservation.TYPE_BLOCKED:
+            self.enforced_cooldown = self.resource.cooldown
+        else:
+            self.enforced_cooldown = datetime.timedelta(0)
 
         if not user_is_admin:
             if (self.end - self.begin) < self.resource.min_period:
@@ -757,13 +991,60 @@ class Reservation(ModifiableModel):
     def send_reservation_mail(self, notification_type,
                               user=None, attachments=None,
                               staff_email=None,
-                              extra_context={}, is_reminder = False):
+                              extra_context={}, ical_attachments=None):
+        """
+        Send a notification about the reservation
+
+        With RESPA_NOTIFICATION_OUTBOX_ENABLED the notification is queued in
+        the current transaction and sent later by the send_notifications
+        command. The queued notification keeps its template, render context,
+        recipients and attachments, so it is sent even if the reservation is
+        deleted before that.
+
+        :type ical_attachments: list[tuple[str, list[Reservation]]] | None
+            filenames and reservations of the calendar files to attach
+        """
         if self.type == Reservation.TYPE_BLOCKED:
             return
 
+        if settings.RESPA_NOTIFICATION_OUTBOX_ENABLED:
+            from notifications.models import QueuedNotification, dump_attachments, dump_context
+
+            if self.user and not user:
+                user = self.user
+            mail = self.get_reservation_mail(notification_type, user=user, staff_email=staff_email,
+                                             extra_context=extra_context)
+            if not mail:
+                return
+            with translation.override(mail['language']):
+                context = dump_context(mail['context'])
+            return QueuedNotification.objects.create(
+                reservation=self, type=notification_type, user=user, template=mail['template'],
+                language=mail['language'], context=context,
+                email_address=mail['email_address'] or '', phone_number=mail['phone_number'] or '',
+                attachments=dump_attachments(attachments), ical_attachments=[
+                    [filename, [reservation.pk for reservation in reservations]]
+                    for filename, reservations in ical_attachments or ()
+                ]
+            )
+        return self.deliver_reservation_mail(
+            notification_type, user=user, attachments=attachments, staff_email=staff_email,
+            extra_context=extra_context, ical_attachments=ical_attachments
+        )
+
+    def get_reservation_mail(self, notification_type, user=None, staff_email=None, extra_context={},
+                             is_reminder=False):
+        """
+        Resolve the template, language, render context and recipients of a notification
+
+        :return: None when there is no template for the notification
+        :rtype: dict | None
+        """
         notification_template = self.get_notification_template(notification_type)
-        if self.user and not user: # If user isn't given use self.user.
-            user = self.user
+        if not notification_template:
+            exc = NotificationTemplateException("Failed to get template from %s" % notification_type)
+            logger.error(exc, extra={'user': user.uuid if user else None})
+            return None
 
         # Use reservation's preferred_language if it exists
         # else if user is defined and user.is_staff or staff_email is given, use default lang
@@ -772,38 +1053,53 @@ class Reservation(ModifiableModel):
                 else getattr(self, 'preferred_language', DEFAULT_LANG)
 
         context = self.get_notification_context(language, notification_type=notification_type, extra_context=extra_context)
-        try:
-            if not notification_template:
-                raise NotificationTemplateException("Failed to get template from %s" % notification_type)
-            rendered_notification = notification_template.render(context, language)
-        except NotificationTemplateException as exc:
-            return logger.error(exc, exc_info=True, extra={ 'user': user.uuid if user else None })
 
+        email_address = phone_number = None
         if is_reminder:
-            return send_respa_sms(self.reserver_phone_number,
-                rendered_notification['subject'], rendered_notification['short_message'])
-
-
-        # Use staff email if given, else get the provided email address
-        email_address = staff_email if staff_email \
-            else self.get_email_address(user)
-
-        if email_address:
-            return send_respa_mail(email_address, rendered_notification['subject'],
-                rendered_notification['body'], rendered_notification['html_body'], attachments)
-
-        if self.reserver_phone_number:
-            if self.resource.send_sms_notification and not staff_email: # Don't send sms when notifying staff.
-                return send_respa_sms(self.reserver_phone_number,
-                    rendered_notification['subject'], rendered_notification['short_message'])
+            phone_number = self.reserver_phone_number
+        else:
+            # Use staff email if given, else get the provided email address
+            email_address = staff_email if staff_email \
+                else self.get_email_address(user)
+            # Don't send sms when notifying staff.
+            if not email_address and self.resource.send_sms_notification and not staff_email:
+                phone_number = self.reserver_phone_number
+        return {
+            'template': notification_template, 'language': language, 'context': context,
+            'email_address': email_address, 'phone_number': phone_number,
+        }
+
+    def deliver_reservation_mail(self, notification_type,
+                                 user=None, attachments=None,
+                                 staff_email=None,
+                                 extra_context={}, is_reminder=False, ical_attachments=None,
+                                 connection=None, fail_silently=True):
+        if self.type == Reservation.TYPE_BLOCKED:
+            return
 
+        if self.user and not user: # If user isn't given use self.user.
+            user = self.user
 
+        mail = self.get_reservation_mail(notification_type, user=user, staff_email=staff_email,
+                                         extra_context=extra_context, is_reminder=is_reminder)
+        if not mail:
+            return
+        if mail['email_address']:
+            attachments = list(attachments or []) + [
+                (filename, build_reservations_ical_file(reservations), 'text/calendar')
+                for filename, reservations in ical_attachments or ()
+            ]
+        try:
+            return send_notification(**mail, attachments=attachments,
+                                     connection=connection, fail_silently=fail_silently)
+        except NotificationTemplateException as exc:
+            return logger.error(exc, exc_info=True, extra={ 'user': user.uuid if user else None })
 
     def notify_staff_about_reservation(self, notification):
         if self.resource.resource_staff_emails:
-            attachment = ('reservation.ics', build_reservations_ical_file([self]), 'text/calendar')
             for email in self.resource.resource_staff_emails:
-                self.send_reservation_mail(notification, staff_email=email, attachments=[attachment])
+                self.send_reservation_mail(notification, staff_email=email,
+                                           ical_attachments=[('reservation.ics', [self])])
         else:
             notify_users = self.resource.get_users_with_perm('can_approve_reservation')
             if len(notify_users) > 100:
@@ -827,9 +1123,8 @@ class Reservation(ModifiableModel):
         self.send_reservation_mail(NotificationType.RESERVATION_DENIED)
 
     def send_reservation_confirmed_mail(self):
-        attachment = 'reservation.ics', build_reservations_ical_file([self]), 'text/calendar'
         self.send_reservation_mail(NotificationType.RESERVATION_CONFIRMED,
-                                   attachments=[attachment])
+                                   ical_attachments=[('reservation.ics', [self])])
 
     def send_reservation_cancelled_mail(self, action_by_official=False):
         notification = NotificationType.RESERVATION_CANCELLED_BY_OFFICIAL \
@@ -837,18 +1132,16 @@ class Reservation(ModifiableModel):
         self.send_reservation_mail(notification)
 
     def send_reservation_created_mail(self, action_by_official=False):
-        attachment = 'reservation.ics', build_reservations_ical_file([self]), 'text/calendar'
         notification = NotificationType.RESERVATION_CREATED_BY_OFFICIAL \
             if action_by_official else NotificationType.RESERVATION_CREATED
         self.send_reservation_mail(notification,
-                                   attachments=[attachment])
+                                   ical_attachments=[('reservation.ics', [self])])
 
     def send_reservation_created_with_access_code_mail(self, action_by_official=False):
-        attachment = 'reservation.ics', build_reservations_ical_file([self]), 'text/calendar'
         notification = NotificationType.RESERVATION_CREATED_WITH_ACCESS_CODE_OFFICIAL_BY_OFFICIAL \
             if action_by_official else NotificationType.RESERVATION_CREATED_WITH_ACCESS_CODE
         self.send_reservation_mail(notification,
-                                   attachments=[attachment])
+                                   ical_attachments=[('reservation.ics', [self])])
 
     def send_reservation_waiting_for_payment_mail(self):
         self.send_reservation_mail(NotificationType.RESERVATION_WAITING_FOR_PAYMENT,
@@ -857,14 +1150,28 @@ class Reservation(ModifiableModel):
     def send_access_code_created_mail(self):
         self.send_reservation_mail(NotificationType.RESERVATION_ACCESS_CODE_CREATED)
 
-    def save(self, *args, **kwargs):
+    def set_computed_fields(self):
+        """
+        Fill in the fields derived from the others, as is done when saving
+
+        Reservations created with bulk_create need this to be called first.
+        """
         self.duration = DateTimeTZRange(self.begin, self.end, '[)')
+        # Each reservation is padded by the cooldown at its end only, so two
+        # padded reservations overlap exactly when one is within the
+        # cooldown of the other.
+        if self.enforced_cooldown:
+            self.cooldown_duration = DateTimeTZRange(self.begin, self.end + self.enforced_cooldown, '[)')
+        else:
+            self.cooldown_duration = None
 
         if not self.access_code:
             access_code_type = self.resource.access_code_type
             if self.resource.is_access_code_enabled() and self.resource.generate_access_codes:
                 self.access_code = generate_access_code(access_code_type)
 
+    def save(self, *args, **kwargs):
+        self.set_computed_fields()
         return super().save(*args, **kwargs)
 
 
@@ -999,12 +1306,36 @@ class ReservationHomeMunicipalitySet(ModifiableModel):
             return ["Example1", "Example2"]
         return sample(items, 2)
 class ReservationReminderQuerySet(models.QuerySet):
-    pass
+    def due(self, at=None):
+        """
+        Reminders of confirmed reservations that should have been sent by `at`
+        """
+        return self.filter(reminder_date__lt=at or timezone.now(), reservation__state=Reservation.CONFIRMED)
+
+    def cancelled(self):
+        return self.filter(reservation__state=Reservation.CANCELLED)
+
+    def claim_due(self, count, at=None):
+        """
+        Lock and return at most `count` due reminders
+
+        Reminders locked by another transaction are skipped, so several
+        workers can send reminders at the same time without sending any
+        twice. Must be called in a transaction, which holds the locks.
+
+        :rtype: list[ReservationReminder]
+        """
+        return list(
+            self.due(at).select_for_update(skip_locked=True, of=('self',))
+            .select_related('reservation__resource__unit', 'reservation__user')
+            .order_by('reminder_date')[:count]
+        )
+
 
 class ReservationReminder(models.Model):
     reservation = models.ForeignKey('Reservation', verbose_name=_('Reservation'), db_index=True, related_name='Reservations',
                                  on_delete=models.CASCADE)
-    reminder_date = models.DateTimeField(verbose_name=_('Reminder date'))
+    reminder_date = models.DateTimeField(verbose_name=_('Reminder date'), db_index=True)
 
 
     objects = ReservationReminderQuerySet.as_manager()
@@ -1013,17 +1344,12 @@ class ReservationReminder(models.Model):
         verbose_name = _('Reservation reminder')
         verbose_name_plural = _('Reservation reminders')
 
-    def get_unix_timestamp(self):
-        unix_epoch = datetime.datetime(year=1970, month=1, day=1, hour=0, minute=0, second=0)
-        time_diff = self.reminder_date.replace(tzinfo=pytz.timezone('Europe/Helsinki')) - unix_epoch.replace(tzinfo=pytz.timezone('Europe/Helsinki'))
-        return int(time_diff.total_seconds())
-
-
-    def remind(self):
-        self.reservation.send_reservation_mail(
+    def remind(self, connection=None):
+        self.reservation.deliver_reservation_mail(
             notification_type = NotificationType.RESERVATION_REMINDER,
             user = self.reservation.user,
-            is_reminder = True
+            is_reminder = True,
+            connection=connection
         )
 
     def __str__(self):
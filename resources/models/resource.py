@@ -1,3 +1,4 @@
+import bisect
 import datetime
 import os
 import re
@@ -8,18 +9,21 @@ from decimal import Decimal
 
 import arrow
 import django.db.models as dbm
-from django.db.models import Q
+from django.db.models import Exists, ExpressionWrapper, F, OuterRef, Q, Value
+from django.db.models.functions import Greatest, Least
 from django.apps import apps
 from django.conf import settings
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.core.validators import FileExtensionValidator, MinValueValidator
+from django.db import transaction
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.functional import cached_property
 from six import BytesIO
+from psycopg2.extras import DateTimeTZRange
 from django.utils.text import format_lazy
 from django.utils.translation import pgettext_lazy, gettext_lazy as _
 from django.contrib.postgres.fields import DateTimeRangeField
@@ -27,6 +31,7 @@ from multi_email_field.fields import MultiEmailField
 from .gistindex import GistIndex
 from image_cropping import ImageRatioField
 from PIL import Image
+from easy_thumbnails.files import get_thumbnailer
 from guardian.shortcuts import get_objects_for_user, get_users_with_perms
 from guardian.core import ObjectPermissionChecker
 
@@ -51,7 +56,7 @@ from .utils import create_datetime_days_from_now, generate_id, get_translated, g
 from .equipment import Equipment
 from .resource_field import UniversalFormFieldType
 from .unit import Unit
-from .availability import get_opening_hours
+from .availability import Day, Period, get_free_intervals, get_opening_hours
 from .permissions import RESOURCE_GROUP_PERMISSIONS, UNIT_ROLE_PERMISSIONS
 from ..enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
 
@@ -201,6 +206,42 @@ class ResourceQuerySet(models.QuerySet):
     def external(self):
         return self.filter(is_external=True)
 
+    def available_between(self, begin, end, period=None):
+        """
+        Filter resources that are available between `begin` and `end`.
+
+        Without `period` the resource must be open and free for the whole
+        range. With `period` the resource must have at least one free slot
+        of `period` length inside its opening hours within the range. The
+        range may span multiple days.
+
+        Free time is read from the free intervals maintained for each
+        resource, so the resources are not loaded or iterated in Python.
+
+        :type begin: datetime.datetime
+        :type end: datetime.datetime
+        :type period: datetime.timedelta | None
+        """
+        free = ResourceFreeInterval.objects.filter(
+            resource=OuterRef('pk'), free_between__overlap=DateTimeTZRange(begin, end, '[)')
+        )
+
+        if period is None:
+            # free intervals ending before `end` must continue in an adjacent
+            # free interval, otherwise the resource is closed or reserved in between
+            gaps = free.filter(free_between__endswith__lt=end).exclude(Exists(ResourceFreeInterval.objects.filter(
+                resource=OuterRef('resource'), free_between__contains=OuterRef('free_between__endswith')
+            )))
+            return self.filter(Exists(free.filter(free_between__contains=begin))).exclude(Exists(gaps))
+
+        free_slots = free.annotate(
+            slot_begin=Greatest(F('free_between__startswith'), Value(begin, output_field=models.DateTimeField())),
+            slot_end=Least(F('free_between__endswith'), Value(end, output_field=models.DateTimeField())),
+        ).filter(
+            slot_end__gte=ExpressionWrapper(F('slot_begin') + period, output_field=models.DateTimeField())
+        )
+        return self.filter(Exists(free_slots))
+
     def delete(self, *args, **kwargs):
         hard_delete = kwargs.pop('hard_delete', False)
         if hard_delete:
@@ -424,7 +465,16 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
     def save(self, *args, **kwargs):
         if getattr(self, '_clean_func_lock', False):
             return
-        return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (update_fields is not None and 'cooldown' not in update_fields):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            ret = super().save(*args, **kwargs)
+            # the database constraint pads the reservations by the cooldown
+            # they were made with, which must not exceed the current one
+            cooldown = self._meta.get_field('cooldown').to_python(self.cooldown) or datetime.timedelta(0)
+            self.reservations.limit_enforced_cooldown(cooldown)
+        return ret
 
     @property
     def public(self):
@@ -460,7 +510,7 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
                 or self.unit.get_disabled_fields()
         return disabled_fields
 
-    def validate_reservation_period(self, reservation, user, data=None):
+    def validate_reservation_period(self, reservation, user, data=None, context=None):
         """
         Check that given reservation if valid for given user.
 
@@ -475,9 +525,12 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
         Normal users cannot make multi day reservations or reservations
         outside opening hours.
 
+        The opening hours are taken from `context` if one is given.
+
         :type reservation: Reservation
         :type user: User
         :type data: dict[str, Object]
+        :type context: ReservationValidationContext | None
         """
 
         # no restrictions for staff
@@ -519,7 +572,10 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
                 raise ValidationError(_("Reservation start and end must match the given overnight reservation start and end values"))
 
         if not self.can_ignore_opening_hours(user):
-            opening_hours = self.get_opening_hours(begin.date(), end.date())
+            if context is not None:
+                opening_hours = context.opening_hours
+            else:
+                opening_hours = self.get_opening_hours(begin.date(), end.date())
             days = opening_hours.get(begin.date(), None)
             if not is_multiday_reservation and (days is None or not any(day['opens'] and begin >= day['opens'] and end <= day['closes'] for day in days)):
                 raise ValidationError(_("You must start and end the reservation during opening hours"))
@@ -528,49 +584,30 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
             raise ValidationError(_("The maximum reservation length is %(max_period)s") %
                                   {'max_period': humanize_duration(self.max_period)})
 
-    def validate_max_reservations_per_user(self, user):
+    def validate_max_reservations_per_user(self, user, context=None):
         """
         Check maximum number of active reservations per user per resource.
         If the user has too many reservations raises ValidationError.
 
         Staff members have no reservation limits.
 
+        The reservations are counted by `context` if one is given.
+
         :type user: User
+        :type context: ReservationValidationContext | None
         """
         if self.can_ignore_max_reservations_per_user(user):
             return
 
         max_count = self.max_reservations_per_user
         if max_count is not None:
-            reservation_count = self.reservations.filter(user=user).active().count()
+            if context is not None:
+                reservation_count = context.active_reservation_count
+            else:
+                reservation_count = self.reservations.filter(user=user).active().count()
             if reservation_count >= max_count:
                 raise ValidationError(_("Maximum number of active reservations for this resource exceeded."))
 
-    def check_reservation_collision(self, begin, end, reservation):
-        overlapping = self.reservations.filter(end__gt=begin, begin__lt=end).active()
-        if reservation:
-            overlapping = overlapping.exclude(pk=reservation.pk)
-        return overlapping.exists()
-
-    def check_cooldown_collision(self, begin, end, reservation) -> bool:
-        from .reservation import Reservation
-        cooldown_start = begin - self.cooldown
-        cooldown_end = end + self.cooldown
-        query = (
-            Q(begin__gt=cooldown_start, begin__lt=cooldown_end) |
-            Q(end__gt=cooldown_start, end__lt=cooldown_end) |
-            Q(begin__lt=cooldown_start, end__gt=begin) |
-            Q(begin__lt=end, end__gt=cooldown_end)
-        )
-
-        query &= ~Q(type=Reservation.TYPE_BLOCKED)
-
-        if reservation:
-            query &= ~Q(pk=reservation.pk)
-
-        cooldown_collisions = self.reservations.filter(query).active()
-        return cooldown_collisions.exists()
-
     def get_available_hours(self, start=None, end=None, duration=None, reservation=None, during_closing=False):
         """
         Returns hours that the resource is not reserved for a given date range
@@ -602,6 +639,22 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
             start = tz.localize(start)
             end = tz.localize(end)
 
+        if not during_closing and reservation is None:
+            """
+            Free time inside open hours is already maintained in the free intervals
+            """
+            hours_list = []
+            intervals = self.free_intervals.filter(
+                free_between__overlap=(start, end, '[)')
+            ).order_by('free_between')
+            for interval in intervals:
+                starts = max(interval.free_between.lower, start)
+                ends = min(interval.free_between.upper, end)
+                if duration and ends - starts < duration:
+                    continue
+                hours_list.append({'starts': timezone.localtime(starts), 'ends': timezone.localtime(ends)})
+            return hours_list
+
         if not during_closing:
             """
             Check open hours only
@@ -691,62 +744,42 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
 
         return opening_hours
 
-    def update_opening_hours(self):
-        hours = self.opening_hours.order_by('open_between')
-        existing_hours = {}
-        for h in hours:
-            assert h.open_between.lower not in existing_hours
-            existing_hours[h.open_between.lower] = h.open_between.upper
-
-        unit_periods = list(self.unit.periods.all())
-        resource_periods = list(self.periods.all())
-
-        # Periods set for the resource always carry a higher priority. If
-        # nothing is defined for the resource for a given day, use the
-        # periods configured for the unit.
-        for period in unit_periods:
-            period.priority = 0
-        for period in resource_periods:
-            period.priority = 1
-
-        earliest_date = None
-        latest_date = None
-        all_periods = unit_periods + resource_periods
-        for period in all_periods:
-            if earliest_date is None or period.start < earliest_date:
-                earliest_date = period.start
-            if latest_date is None or period.end > latest_date:
-                latest_date = period.end
-
-        # Assume we delete everything, but remove items from the delete
-        # list if the hours are identical.
-        to_delete = existing_hours
-        to_add = {}
-        if all_periods:
-            hours = get_opening_hours(self.unit.time_zone, all_periods,
-                                      earliest_date, latest_date)
-            for hours_items in hours.values():
-                for h in hours_items:
-                    if not h['opens'] or not h['closes']:
-                        continue
-                    if h['opens'] in to_delete and h['closes'] == to_delete[h['opens']]:
-                            del to_delete[h['opens']]
-                            continue
-                    to_add[h['opens']] = h['closes']
+    def update_opening_hours(self, begin=None, end=None):
+        """
+        Recalculate the daily opening hours from the periods of the resource and its unit
 
-        if to_delete:
-            ret = ResourceDailyOpeningHours.objects.filter(
-                open_between__in=[(opens, closes, '[)') for opens, closes in to_delete.items()],
-                resource=self
-            ).delete()
-            assert ret[0] == len(to_delete)
-
-        add_objs = [
-            ResourceDailyOpeningHours(resource=self, open_between=(opens, closes, '[)'))
-            for opens, closes in to_add.items()
-        ]
-        if add_objs:
-            ResourceDailyOpeningHours.objects.bulk_create(add_objs)
+        If `begin` and `end` are given, only the dates between them are recalculated.
+
+        :type begin: datetime.date | None
+        :type end: datetime.date | None
+        """
+        update_resources_opening_hours(self.unit, [self], begin, end)
+
+    def update_free_intervals(self, begin=None, end=None):
+        """
+        Recalculate the free intervals of opening hours overlapping `begin` - `end`
+
+        Without `begin` and `end` the free intervals of all opening hours are
+        recalculated.
+
+        :type begin: datetime.datetime | None
+        :type end: datetime.datetime | None
+        """
+        hours = self.opening_hours.all()
+        if begin is not None and end is not None:
+            hours = hours.filter(open_between__overlap=(begin, end, '[)'))
+
+        with transaction.atomic():
+            # concurrent rebuilds would each miss the reservations the other
+            # has not committed yet, so they are done one at a time. The base
+            # manager locks soft deleted resources too, without refreshing
+            # the publish date states of every resource.
+            Resource._base_manager.select_for_update().get(pk=self.pk)
+            hours = list(hours)
+            if not hours:
+                return
+            ResourceFreeInterval.objects.filter(opening_hours__in=hours).delete()
+            create_free_intervals(hours)
 
     def is_admin(self, user):
         """
@@ -759,6 +792,9 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
         # so if this is changed those need to be changed as well.
         if not self.unit:
             return is_general_admin(user)
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_unit_admin(self.unit)
         return self.unit.is_admin(user)
 
     def is_manager(self, user):
@@ -770,6 +806,9 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
         """
         if not self.unit:
             return False
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_unit_manager(self.unit)
         return self.unit.is_manager(user)
 
     def is_viewer(self, user):
@@ -781,8 +820,23 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
         """
         if not self.unit:
             return False
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_unit_viewer(self.unit)
         return self.unit.is_viewer(user)
 
+    def _get_permission_resolver(self, user):
+        """
+        Return the PermissionResolver set for the user by the API views, if any
+
+        :type user: users.models.User
+        :rtype: resources.auth.PermissionResolver | None
+        """
+        resolver = getattr(self, '_permission_resolver', None)
+        if resolver and resolver.is_for(user):
+            return resolver
+        return None
+
     def _has_perm(self, user, perm, allow_admin=True):
         if not is_authenticated_user(user):
             return False
@@ -796,16 +850,19 @@ class Resource(ModifiableModel, AutoIdentifiedModel, ValidatedIdentifier):
         if self.max_age and is_overage(user, self.max_age):
             return False
 
-        if self.unit.is_manager(user) or self.unit.is_admin(user):
+        if self.is_manager(user) or self.is_admin(user):
             return True
 
         return self._has_role_perm(user, perm) or self._has_explicit_perm(user, perm, allow_admin)
 
     def _has_explicit_perm(self, user, perm, allow_admin=True):
-        if hasattr(self, '_permission_checker'):
-            checker = self._permission_checker
-        else:
-            checker = ObjectPermissionChecker(user)
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.has_unit_perm(self.unit, 'unit:%s' % perm) or any(
+                resolver.has_resource_group_perm(rg, 'group:%s' % perm) for rg in self.groups.all()
+            )
+
+        checker = ObjectPermissionChecker(user)
 
         # Permissions can be given per-unit
         if checker.has_perm('unit:%s' % perm, self.unit):
@@ -1173,6 +1230,23 @@ class ResourcePublishDate(models.Model):
             """
         )
 
+class ResourceImageQuerySet(models.QuerySet):
+    def claim_pending(self, count):
+        """
+        Lock and return at most `count` images waiting to be processed
+
+        Images locked by another transaction are skipped, so several workers
+        can process images at the same time. Must be called in a transaction,
+        which holds the locks.
+
+        :rtype: list[ResourceImage]
+        """
+        return list(
+            self.filter(processing_state=ResourceImage.PENDING)
+            .select_for_update(skip_locked=True, of=('self',)).order_by('pk')[:count]
+        )
+
+
 class ResourceImage(ModifiableModel):
     TYPES = (
         ('main', _('Main photo')),
@@ -1180,6 +1254,14 @@ class ResourceImage(ModifiableModel):
         ('map', _('Map')),
         ('other', _('Other')),
     )
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    PROCESSING_STATES = (
+        (PENDING, _('pending')),
+        (READY, _('ready')),
+        (FAILED, _('failed')),
+    )
     resource = models.ForeignKey('Resource', verbose_name=_('Resource'), db_index=True,
                                  related_name='images', on_delete=models.CASCADE)
     type = models.CharField(max_length=20, verbose_name=_('Type'), choices=TYPES)
@@ -1190,9 +1272,18 @@ class ResourceImage(ModifiableModel):
     cropping = ImageRatioField('image', '800x800', verbose_name=_('Cropping'))
     sort_order = models.PositiveSmallIntegerField(verbose_name=_('Sort order'))
     stamp = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    processing_state = models.CharField(verbose_name=_('Processing state'), max_length=16,
+                                        choices=PROCESSING_STATES, default=PENDING)
+
+    objects = ResourceImageQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
-        self._process_image()
+        self._prepare_image()
+        if self.pk and self.processing_state == ResourceImage.READY:
+            # renditions of the changed image or cropping are generated again
+            saved = ResourceImage.objects.filter(pk=self.pk).values_list('image', 'cropping').first()
+            if saved and (saved[0], saved[1] or '') != (self.image.name, self.cropping or ''):
+                self.processing_state = ResourceImage.PENDING
         if self.sort_order is None:
             other_images = self.resource.images.order_by('-sort_order')
             if not other_images:
@@ -1212,11 +1303,14 @@ class ResourceImage(ModifiableModel):
             while ResourceImage.objects.filter(stamp=stamp).exists():
                 stamp = generate_id()
             self.stamp = stamp
-        return super(ResourceImage, self).save(*args, **kwargs)
+        ret = super(ResourceImage, self).save(*args, **kwargs)
+        if self.processing_state == ResourceImage.PENDING and not settings.RESPA_IMAGE_QUEUE_ENABLED:
+            self.generate_renditions()
+        return ret
 
     def full_clean(self, exclude=(), validate_unique=True):
         if "image" not in exclude:
-            self._process_image()
+            self._prepare_image()
         return super(ResourceImage, self).full_clean(exclude, validate_unique)
 
     def _get_io_stream(self, img, **kwargs):
@@ -1227,9 +1321,38 @@ class ResourceImage(ModifiableModel):
     def _get_content_file(self, img, **kwargs):
         return ContentFile(
             self._get_io_stream(img, **kwargs).getvalue(),
-            name=os.path.splitext(self.image.name)[0] + ".%s" % self.image_format.lower()
+            name=os.path.splitext(os.path.basename(self.image.name))[0] + ".%s" % self.image_format.lower()
         )
 
+    def _prepare_image(self):
+        """
+        Prepare a newly uploaded image file for saving, once.
+
+        The image is processed right away, or with RESPA_IMAGE_QUEUE_ENABLED
+        only validated and left for the process_resource_images command.
+
+        :raises InvalidImage: Exception raised if the uploaded file is not valid.
+        """
+        if not self.image or self.image._committed or self.image is getattr(self, '_prepared_image', None):
+            return
+        if settings.RESPA_IMAGE_QUEUE_ENABLED:
+            self._validate_image()
+        else:
+            self._process_image()
+        self.processing_state = ResourceImage.PENDING
+
+    def _validate_image(self):
+        """
+        Check the size of the image without decoding it.
+
+        :raises InvalidImage: Exception raised if the uploaded file is not valid.
+        """
+        with Image.open(self.image) as img:
+            if img.size < (128, 128):
+                raise InvalidImage("Image %s not valid (Image is too small)" % self.image)
+            self.image_format = img.format
+        self._prepared_image = self.image
+
     def _process_image(self):
         """
         Preprocess the uploaded image file, if required.
@@ -1262,6 +1385,60 @@ class ResourceImage(ModifiableModel):
 
             if getattr(self, '_processing_required', False):
                 self.image = self._get_content_file(img, **save_kwargs)
+        self._prepared_image = self.image
+
+    def process(self):
+        """
+        Process a queued image and generate its renditions.
+
+        The processed image replaces the uploaded file in the storage.
+        """
+        uploaded_name = self.image.name
+        self._process_image()
+        if self.image.name != uploaded_name:
+            self.save()
+        self.generate_renditions()
+        if self.image.name != uploaded_name:
+            self.image.storage.delete(uploaded_name)
+
+    @classmethod
+    def get_rendition_sizes(cls):
+        """
+        :rtype: list[tuple[int, int]]
+        """
+        return [tuple(int(d) for d in size.split('x')) for size in settings.RESPA_IMAGE_RENDITION_SIZES]
+
+    @classmethod
+    def get_nearest_rendition_size(cls, width, height):
+        return min(cls.get_rendition_sizes(), key=lambda size: (size[0] - width) ** 2 + (size[1] - height) ** 2)
+
+    def get_rendition(self, size, webp=False, generate=True):
+        """
+        Get a cropped rendition of the image, generating it if it does not exist yet.
+
+        :type size: tuple[int, int]
+        :rtype: easy_thumbnails.files.ThumbnailFile
+        """
+        thumbnailer = get_thumbnailer(self.image)
+        if webp:
+            thumbnailer.thumbnail_extension = thumbnailer.thumbnail_transparency_extension = 'webp'
+            thumbnailer.thumbnail_preserve_extensions = None
+        return thumbnailer.get_thumbnail({
+            'size': size,
+            'box': self.cropping,
+            'crop': True,
+            'detail': True,
+        }, generate=generate)
+
+    def generate_renditions(self):
+        """
+        Generate the renditions of RESPA_IMAGE_RENDITION_SIZES and their WebP variants.
+        """
+        for size in self.get_rendition_sizes():
+            self.get_rendition(size)
+            self.get_rendition(size, webp=True)
+        ResourceImage.objects.filter(pk=self.pk).update(processing_state=ResourceImage.READY)
+        self.processing_state = ResourceImage.READY
 
     def get_full_url(self):
         base_url = getattr(settings, 'RESPA_IMAGE_BASE_URL', None)
@@ -1384,3 +1561,157 @@ class ResourceDailyOpeningHours(models.Model):
             lower = self.open_between.lower
             upper = self.open_between.upper
         return "%s: %s -> %s" % (self.resource, lower, upper)
+
+
+class ResourceFreeInterval(models.Model):
+    """
+    Free time inside the daily opening hours of a resource
+
+    Maintained from the opening hours and the current reservations of the
+    resource by `Resource.update_free_intervals`.
+    """
+    resource = models.ForeignKey(
+        Resource, related_name='free_intervals', on_delete=models.CASCADE, db_index=True
+    )
+    opening_hours = models.ForeignKey(
+        ResourceDailyOpeningHours, related_name='free_intervals', on_delete=models.CASCADE
+    )
+    free_between = DateTimeRangeField()
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['free_between'])
+        ]
+
+    def __str__(self):
+        if isinstance(self.free_between, tuple):
+            lower = self.free_between[0]
+            upper = self.free_between[1]
+        else:
+            lower = self.free_between.lower
+            upper = self.free_between.upper
+        return "%s: %s -> %s" % (self.resource, lower, upper)
+
+
+def update_resources_opening_hours(unit, resources, begin=None, end=None):
+    """
+    Recalculate the daily opening hours of `resources` belonging to `unit`
+
+    The periods, days and existing opening hours of all the resources are
+    fetched with a single query each, and the changes are written in bulk.
+    If `begin` and `end` are given, only the dates between them are
+    recalculated, otherwise the whole span of the periods.
+
+    :type unit: Unit
+    :type resources: list[Resource]
+    :type begin: datetime.date | None
+    :type end: datetime.date | None
+    """
+    resources = list(resources)
+    if not resources:
+        return
+
+    unit_periods = list(unit.periods.all())
+    resource_periods = list(Period.objects.filter(resource__in=resources))
+    days_by_period = {}
+    for day in Day.objects.filter(period__in=unit_periods + resource_periods):
+        days_by_period.setdefault(day.period_id, []).append(day)
+
+    # Periods set for the resource always carry a higher priority. If
+    # nothing is defined for the resource for a given day, use the
+    # periods configured for the unit.
+    for period in unit_periods:
+        period.priority = 0
+    periods_by_resource = {}
+    for period in resource_periods:
+        period.priority = 1
+        periods_by_resource.setdefault(period.resource_id, []).append(period)
+
+    hours = ResourceDailyOpeningHours.objects.filter(resource__in=resources)
+    if begin is not None and end is not None:
+        range_begin, range_end = determine_hours_time_range(begin, end, pytz.timezone(unit.time_zone))
+        hours = hours.filter(open_between__startswith__gte=range_begin, open_between__startswith__lt=range_end)
+    existing_hours = {}
+    for h in hours:
+        key = (h.resource_id, h.open_between.lower)
+        assert key not in existing_hours
+        existing_hours[key] = (h.pk, h.open_between.upper)
+
+    # Assume we delete everything, but remove items from the delete
+    # list if the hours are identical.
+    to_delete = existing_hours
+    to_add = []
+    for resource in resources:
+        all_periods = unit_periods + periods_by_resource.get(resource.pk, [])
+        if not all_periods:
+            continue
+        if begin is not None and end is not None:
+            earliest_date, latest_date = begin, end
+        else:
+            earliest_date = min(period.start for period in all_periods)
+            latest_date = max(period.end for period in all_periods)
+
+        days = [day for period in all_periods for day in days_by_period.get(period.id, [])]
+        opening_hours = get_opening_hours(unit.time_zone, all_periods, earliest_date, latest_date, days=days)
+        for hours_items in opening_hours.values():
+            for h in hours_items:
+                if not h['opens'] or not h['closes']:
+                    continue
+                key = (resource.pk, h['opens'])
+                if key in to_delete and h['closes'] == to_delete[key][1]:
+                    del to_delete[key]
+                    continue
+                to_add.append(
+                    ResourceDailyOpeningHours(resource=resource, open_between=DateTimeTZRange(h['opens'], h['closes'], '[)'))
+                )
+
+    with transaction.atomic():
+        if to_delete:
+            # free intervals of removed opening hours are dropped by cascade
+            ResourceDailyOpeningHours.objects.filter(pk__in=[pk for pk, closes in to_delete.values()]).delete()
+        if to_add:
+            ResourceDailyOpeningHours.objects.bulk_create(to_add)
+            create_free_intervals(to_add)
+
+
+def create_free_intervals(hours):
+    """
+    Create the free intervals of daily opening hours that have none yet
+
+    Reservations of all the resources involved are fetched with a single query.
+
+    :type hours: list[ResourceDailyOpeningHours]
+    """
+    from .reservation import Reservation
+
+    hours_by_resource = {}
+    for h in sorted(hours, key=lambda h: h.open_between.lower):
+        hours_by_resource.setdefault(h.resource_id, []).append(h)
+
+    span_begin = min(h.open_between.lower for h in hours)
+    span_end = max(h.open_between.upper for h in hours)
+    reservations_by_resource = {}
+    reservations = Reservation.objects.current().filter(
+        resource__in=hours_by_resource.keys()
+    ).overlaps(span_begin, span_end).order_by('begin').values_list('resource_id', 'begin', 'end')
+    for resource_id, begin, end in reservations:
+        reservations_by_resource.setdefault(resource_id, []).append((begin, end))
+
+    free_objs = []
+    for resource_id, resource_hours in hours_by_resource.items():
+        reservations = reservations_by_resource.get(resource_id, [])
+        reservation_begins = [r[0] for r in reservations]
+        first = 0
+        for h in resource_hours:
+            opens, closes = h.open_between.lower, h.open_between.upper
+            # opening hours are ordered, so reservations ending before
+            # these opening hours can be skipped for the rest of them too
+            while first < len(reservations) and reservations[first][1] <= opens:
+                first += 1
+            last = bisect.bisect_left(reservation_begins, closes)
+            free_objs += [
+                ResourceFreeInterval(resource_id=resource_id, opening_hours=h, free_between=(free_begin, free_end, '[)'))
+                for free_begin, free_end in get_free_intervals(opens, closes, reservations[first:last])
+            ]
+
+    ResourceFreeInterval.objects.bulk_create(free_objs)
@@ -168,9 +168,17 @@ class Unit(ModifiableModel, AutoIdentifiedModel):
         """
         return get_opening_hours(self.time_zone, list(self.periods.all()), begin, end)
 
-    def update_opening_hours(self):
-        for res in self.resources.all():
-            res.update_opening_hours()
+    def update_opening_hours(self, begin=None, end=None):
+        """
+        Recalculate the daily opening hours of all the resources of the unit
+
+        If `begin` and `end` are given, only the dates between them are recalculated.
+
+        :type begin: datetime.date | None
+        :type end: datetime.date | None
+        """
+        from .resource import update_resources_opening_hours
+        update_resources_opening_hours(self, self.resources.all(), begin, end)
 
     def get_tz(self):
         return pytz.timezone(self.time_zone)
@@ -1,4 +1,5 @@
 import base64
+import csv
 import datetime
 from decimal import Decimal, ROUND_HALF_UP
 import struct
@@ -113,7 +114,8 @@ def humanize_duration(duration):
 notification_logger = logging.getLogger('respa.notifications')
 
 
-def send_respa_mail(email_address, subject, body, html_body=None, attachments=None) -> RespaNotificationAction:
+def send_respa_mail(email_address, subject, body, html_body=None, attachments=None,
+                    connection=None, fail_silently=True) -> RespaNotificationAction:
     if not getattr(settings, 'RESPA_MAILS_ENABLED', False):
         notification_logger.info('Respa mail is not enabled.')
     try:
@@ -121,26 +123,98 @@ def send_respa_mail(email_address, subject, body, html_body=None, attachments=No
                         'noreply@%s' % Site.objects.get_current().domain)
 
         text_content = body
-        msg = EmailMultiAlternatives(subject, text_content, from_address, [email_address], attachments=attachments)
+        msg = EmailMultiAlternatives(subject, text_content, from_address, [email_address], attachments=attachments,
+                                     connection=connection)
         if html_body:
             msg.attach_alternative(html_body, 'text/html')
         msg.send()
         return RespaNotificationAction.EMAIL
     except Exception as exc:
         notification_logger.error('Respa mail error %s', exc)
+        if not fail_silently:
+            raise
 
 
-def send_respa_sms(phone_number, subject, short_message) -> RespaNotificationAction:
+def send_respa_sms(phone_number, subject, short_message, connection=None,
+                   fail_silently=True) -> RespaNotificationAction:
     if not getattr(settings, 'RESPA_SMS_ENABLED', False):
         notification_logger.info('Respa SMS is not enabled.')
     try:
         from_address = (getattr(settings, 'RESPA_MAILS_FROM_ADDRESS', None) or
                         'noreply@%s' % Site.objects.get_current().domain)
-        sms = EmailMultiAlternatives(subject, short_message, from_address, [f'{phone_number}@{settings.GSM_NOTIFICATION_ADDRESS}'])
+        sms = EmailMultiAlternatives(subject, short_message, from_address, [f'{phone_number}@{settings.GSM_NOTIFICATION_ADDRESS}'],
+                                     connection=connection)
         sms.send()
         return RespaNotificationAction.SMS
     except Exception as exc:
         notification_logger.error('Respa SMS error %s', exc)
+        if not fail_silently:
+            raise
+
+
+def send_notification(template, language, context, email_address=None, phone_number=None, attachments=None,
+                      connection=None, fail_silently=True) -> RespaNotificationAction:
+    """
+    Render a notification template and send it by mail, or by SMS when there is no email address
+
+    :type template: notifications.models.NotificationTemplate
+    :raises NotificationTemplateException: if the template cannot be rendered
+    """
+    rendered_notification = template.render(context, language)
+    if email_address:
+        return send_respa_mail(email_address, rendered_notification['subject'],
+            rendered_notification['body'], rendered_notification['html_body'], attachments,
+            connection=connection, fail_silently=fail_silently)
+    if phone_number:
+        return send_respa_sms(phone_number,
+            rendered_notification['subject'], rendered_notification['short_message'],
+            connection=connection, fail_silently=fail_silently)
+
+
+def _clean_export_value(string):
+    if not string:
+        return ''
+
+    if isinstance(string, dict):
+        string = next(iter(string.items()))[1]
+
+    if not isinstance(string, str):
+        return string
+
+    unallowed_characters = ['=', '+', '-', '"', '@']
+    if string[0] in unallowed_characters:
+        string = string[1:]
+    return string
+
+
+def _get_export_row(reservation):
+    """
+    Return the values of the exported columns of a serialized reservation
+
+    Unit, resource, begin, end, creation time, user, comments and staff event
+    are followed by RESERVATION_EXTRA_FIELDS. The columns the requester is
+    not allowed to see are None.
+    """
+    from resources.models import RESERVATION_EXTRA_FIELDS
+
+    for key in reservation:
+        reservation[key] = _clean_export_value(reservation[key])
+    row = [
+        reservation['unit'],
+        reservation['resource'],
+        localtime(reservation['begin']).replace(tzinfo=None),
+        localtime(reservation['end']).replace(tzinfo=None),
+        localtime(reservation['created_at']).replace(tzinfo=None),
+        reservation.get('user'),
+        reservation.get('comments'),
+        reservation['staff_event'],
+    ]
+    for field in RESERVATION_EXTRA_FIELDS:
+        value = reservation.get(field)
+        if isinstance(value, dict):
+            value = next(iter(value.values()), None)
+        row.append(value)
+    return row
 
 
 def generate_reservation_xlsx(reservations, **kwargs):
@@ -150,6 +224,7 @@ def generate_reservation_xlsx(reservations, **kwargs):
     The parameter is expected to be a list of dicts with fields:
       * unit: unit name str
       * resource: resource name str
+      * resource_id: resource id str
       * begin: begin time datetime
       * end: end time datetime
       * staff_event: is staff event bool
@@ -159,27 +234,37 @@ def generate_reservation_xlsx(reservations, **kwargs):
 
     :rtype: bytes
     """
-    from resources.models import Resource, Reservation, RESERVATION_EXTRA_FIELDS
-    def clean(string):
-        if not string:
-            return ''
+    from resources.models import Reservation
+
+    output = io.BytesIO()
+    write_reservation_xlsx(
+        output,
+        [reservation for reservation in reservations if reservation['type'] == Reservation.TYPE_NORMAL],
+        [reservation for reservation in reservations if reservation['type'] == Reservation.TYPE_BLOCKED],
+        **kwargs
+    )
+    return output.getvalue()
+
 
-        if isinstance(string, dict):
-            string = next(iter(string.items()))[1]
+def write_reservation_xlsx(output, normal_reservations, block_reservations, **kwargs):
+    """
+    Write reservations in Excel xlsx format to a file
 
-        if not isinstance(string, str):
-            return string
+    The reservations are iterated only once and the rows are written out as
+    they go, so the reservations can be generated lazily from the database
+    and the memory use does not grow with their number. See
+    generate_reservation_xlsx for the fields of the reservations.
 
-        unallowed_characters = ['=', '+', '-', '"', '@']
-        if string[0] in unallowed_characters:
-            string = string[1:]
-        return string
+    :type output: file
+    :type normal_reservations: iterable[dict]
+    :type block_reservations: iterable[dict]
+    """
+    from resources.models import Resource, Reservation, RESERVATION_EXTRA_FIELDS
 
     request = kwargs.get('request', None)
     weekdays = kwargs.get('weekdays', None)
     include_block_reservations = kwargs.get('include_block_reservations', False)
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
     sheet_name = format_lazy('{} {}', _('Reservation'), _('Reports'))
     worksheet = workbook.add_worksheet(str(sheet_name).capitalize())
 
@@ -241,7 +326,7 @@ def generate_reservation_xlsx(reservations, **kwargs):
 
         opening_hours = {
             resource:resource.get_opening_hours(query_start, query_end) \
-            for resource in Resource.objects.filter(id__in=resources)
+            for resource in Resource.objects.filter(id__in=resources).select_related('unit')
         }
 
     for resource in opening_hours:
@@ -254,98 +339,48 @@ def generate_reservation_xlsx(reservations, **kwargs):
                 if weekdays and opens[1].weekday() not in weekdays:
                     continue
 
-                if resource not in resource_usage_info:
-                    resource_usage_info[resource] = {'total_opening_hours': 0, 'total_normal_reservation_hours': 0, 'total_block_reservation_hours': 0}
-                resource_usage_info[resource]['total_opening_hours'] += (closes[1] - opens[1]).total_seconds() / 3600
+                if resource.pk not in resource_usage_info:
+                    resource_usage_info[resource.pk] = {
+                        'resource': resource, 'total_opening_hours': 0,
+                        'total_normal_reservation_hours': 0, 'total_block_reservation_hours': 0
+                    }
+                resource_usage_info[resource.pk]['total_opening_hours'] += (closes[1] - opens[1]).total_seconds() / 3600
 
     date_format = workbook.add_format({'num_format': 'dd.mm.yyyy hh:mm', 'align': 'left'})
-    total_normal_reservation_hours = 0
-    total_block_reservation_hours = 0
-
-    normal_reservations = [
-        reservation for reservation in reservations \
-            if reservation['type'] == Reservation.TYPE_NORMAL
-    ]
-    block_reservations = [
-        reservation for reservation in reservations \
-            if reservation['type'] == Reservation.TYPE_BLOCKED
-    ]
 
-    if normal_reservations:
-        set_title(gettext('Normal reservations'))
-        for row, reservation in enumerate(normal_reservations, row_cursor):
-            for key in reservation: reservation[key] = clean(reservation[key])
-            obj = Reservation.objects.get(pk=reservation['id'])
-            usage_info = resource_usage_info.get(obj.resource, None)
-            begin = localtime(reservation['begin']).replace(tzinfo=None)
-            end = localtime(reservation['end']).replace(tzinfo=None)
-            worksheet.write(row, 0, reservation['unit'])
-            worksheet.write(row, 1, reservation['resource'])
-            worksheet.write(row, 2, begin, date_format)
-            worksheet.write(row, 3, end, date_format)
-            worksheet.write(row, 4, localtime(reservation['created_at']).replace(tzinfo=None), date_format)
-            if 'user' in reservation:
-                worksheet.write(row, 5, reservation['user'])
-            if 'comments' in reservation:
-                worksheet.write(row, 6, reservation['comments'])
-            worksheet.write(row, 7, reservation['staff_event'])
-            for i, field in enumerate(RESERVATION_EXTRA_FIELDS, 8):
-                if field in reservation:
-                    if isinstance(reservation[field], dict):
-                        try:
-                            reservation[field] = next(iter(reservation[field].items()))[1]
-                        except:
-                            continue
-                    worksheet.write(row, i, reservation[field])
-            total_normal_reservation_hours += (end-begin).total_seconds() # Overall total
+    sections = [(gettext('Normal reservations'), normal_reservations, 'total_normal_reservation_hours',
+                 gettext('Normal reservation hours total'))]
+    if include_block_reservations:
+        sections.append((gettext('Block reservations'), block_reservations, 'total_block_reservation_hours',
+                         gettext('Block reservation hours total')))
+
+    for title, reservations, hours_key, total_title in sections:
+        total_seconds = 0
+        has_reservations = False
+        for reservation in reservations:
+            if not has_reservations:
+                set_title(title)
+                has_reservations = True
+            usage_info = resource_usage_info.get(reservation.get('resource_id'), None)
+            row = _get_export_row(reservation)
+            for col, value in enumerate(row):
+                if col in (2, 3, 4):
+                    worksheet.write(row_cursor, col, value, date_format)
+                elif value is not None:
+                    worksheet.write(row_cursor, col, value)
+            begin, end = row[2], row[3]
+            total_seconds += (end-begin).total_seconds() # Overall total
             if usage_info:
-                usage_info['total_normal_reservation_hours'] += (end-begin).total_seconds() / 3600 # Resource specific total
+                usage_info[hours_key] += (end-begin).total_seconds() / 3600 # Resource specific total
             row_cursor += 1
 
-        row_cursor += 1
-        col_format = workbook.add_format({'color': 'red'})
-        col_format.set_bold()
-        worksheet.write(row_cursor, 0, gettext('Normal reservation hours total'), col_format)
-        worksheet.write(row_cursor, 1, gettext('%(hours)s hours') % ({'hours': int((total_normal_reservation_hours / 60) / 60)}), col_format)
-        row_cursor += 2
-
-    if block_reservations and include_block_reservations:
-        set_title(gettext('Block reservations'))
-        for row, reservation in enumerate(block_reservations, row_cursor):
-            for key in reservation: reservation[key] = clean(reservation[key])
-            obj = Reservation.objects.get(pk=reservation['id'])
-            usage_info = resource_usage_info.get(obj.resource, None)
-            begin = localtime(reservation['begin']).replace(tzinfo=None)
-            end = localtime(reservation['end']).replace(tzinfo=None)
-            worksheet.write(row, 0, reservation['unit'])
-            worksheet.write(row, 1, reservation['resource'])
-            worksheet.write(row, 2, begin, date_format)
-            worksheet.write(row, 3, end, date_format)
-            worksheet.write(row, 4, localtime(reservation['created_at']).replace(tzinfo=None), date_format)
-            if 'user' in reservation:
-                worksheet.write(row, 5, reservation['user'])
-            if 'comments' in reservation:
-                worksheet.write(row, 6, reservation['comments'])
-            worksheet.write(row, 7, reservation['staff_event'])
-            for i, field in enumerate(RESERVATION_EXTRA_FIELDS, 8):
-                if field in reservation:
-                    if isinstance(reservation[field], dict):
-                        try:
-                            reservation[field] = next(iter(reservation[field].items()))[1]
-                        except:
-                            continue
-                    worksheet.write(row, i, reservation[field])
-            total_block_reservation_hours += (end-begin).total_seconds() # Overall total
-            if usage_info:
-                usage_info['total_block_reservation_hours'] += (end-begin).total_seconds() / 3600 # Resource specific total
+        if has_reservations:
             row_cursor += 1
-
-        row_cursor += 1
-        col_format = workbook.add_format({'color': 'red'})
-        col_format.set_bold()
-        worksheet.write(row_cursor, 0, gettext('Block reservation hours total'), col_format)
-        worksheet.write(row_cursor, 1, gettext('%(hours)s hours') % ({'hours': int((total_block_reservation_hours / 60) / 60)}), col_format)
-        row_cursor += 2
+            col_format = workbook.add_format({'color': 'red'})
+            col_format.set_bold()
+            worksheet.write(row_cursor, 0, total_title, col_format)
+            worksheet.write(row_cursor, 1, gettext('%(hours)s hours') % ({'hours': int((total_seconds / 60) / 60)}), col_format)
+            row_cursor += 2
 
 
     row_cursor += 2
@@ -366,8 +401,8 @@ def generate_reservation_xlsx(reservations, **kwargs):
     else:
         set_title(gettext('Resource utilization'), headers=headers, use_extra_fields=False)
 
-    for row, resource_info in enumerate(resource_usage_info.items(), row_cursor):
-        resource, info = resource_info
+    for row, info in enumerate(resource_usage_info.values(), row_cursor):
+        resource = info['resource']
         resource_utilization = float((info.get('total_normal_reservation_hours') / info.get('total_opening_hours')) * 100)
         worksheet.write(row, 0, resource.unit.name) # Column: Unit
         worksheet.write(row, 1, resource.name) # Column: Resource
@@ -376,7 +411,37 @@ def generate_reservation_xlsx(reservations, **kwargs):
         worksheet.write(row, 4, "%sh" % info.get('total_normal_reservation_hours')) # Column: Normal reservation hours total
         worksheet.write(row, 5, "%sh" % info.get('total_block_reservation_hours')) # Column: Block reservation hours total
     workbook.close()
-    return output.getvalue()
+
+
+def generate_reservation_csv(reservations):
+    """
+    Generate reservations in CSV format line by line
+
+    The columns are the same as in the xlsx export, preceded by the
+    reservation type. See generate_reservation_xlsx for the fields of the
+    reservations.
+
+    :type reservations: iterable[dict]
+    :rtype: iterable[str]
+    """
+    from resources.models import Reservation, RESERVATION_EXTRA_FIELDS
+
+    class Echo:
+        def write(self, value):
+            return value
+
+    writer = csv.writer(Echo())
+    headers = [
+        'Type', 'Unit', 'Resource', 'Begin time', 'End time', 'Created at', 'User', 'Comments', 'Staff event',
+    ]
+    yield writer.writerow([str(_(header)) for header in headers] + [
+        str(Reservation._meta.get_field(field).verbose_name) for field in RESERVATION_EXTRA_FIELDS
+    ])
+    for reservation in reservations:
+        row = _get_export_row(reservation)
+        for col in (2, 3, 4):
+            row[col] = row[col].strftime('%d.%m.%Y %H:%M')
+        yield writer.writerow([reservation['type']] + ['' if value is None else value for value in row])
 
 def _build_weekday_string(weekdays):
     from resources.models import Day
@@ -469,35 +534,63 @@ def format_dt_range_alt(language: str, begin, end) -> str:
     return res
 
 
+def _build_ical_event(pk, begin, end, created_at, summary, email_address, name):
+    event = Event()
+    begin_utc = timezone.localtime(begin, timezone.utc)
+    end_utc = timezone.localtime(end, timezone.utc)
+    event['uid'] = 'respa_reservation_{}'.format(pk)
+    event['dtstart'] = vDatetime(begin_utc)
+    event['dtend'] = vDatetime(end_utc)
+    if created_at:
+        event['dtstamp'] = vDatetime(created_at)
+
+    event['summary'] = vText(summary)
+
+    if email_address:
+        attendee = vCalAddress(f'MAILTO:{email_address}')
+        attendee.params['cn'] = vText(name)
+        event.add('attendee', attendee, encode=0)
+    return event
+
+
+def _build_calendar():
+    cal = Calendar()
+    cal.add('prodid', '-//Varaamo Turku//')
+    cal.add('version', '2.0')
+    return cal
+
+
 def build_reservations_ical_file(reservations):
     """
     Return iCalendar file containing given reservations
     """
 
-    cal = Calendar()
-    cal.add('prodid', '-//Varaamo Turku//')
-    cal.add('version', '2.0')
+    cal = _build_calendar()
     for reservation in reservations:
-        event = Event()
-        begin_utc = timezone.localtime(reservation.begin, timezone.utc)
-        end_utc = timezone.localtime(reservation.end, timezone.utc)
-        event['uid'] = 'respa_reservation_{}'.format(reservation.id)
-        event['dtstart'] = vDatetime(begin_utc)
-        event['dtend'] = vDatetime(end_utc)
-        if reservation.created_at:
-            event['dtstamp'] = vDatetime(reservation.created_at)
-
-        event['summary'] = vText(reservation.resource.name)
-
-        if reservation.reserver_email_address:
-            attendee = vCalAddress(f'MAILTO:{reservation.reserver_email_address}')
-            attendee.params['cn'] = vText(reservation.reserver_name)
-            event.add('attendee', attendee, encode=0)
-
-        cal.add_component(event)
+        cal.add_component(_build_ical_event(
+            reservation.id, reservation.begin, reservation.end, reservation.created_at,
+            reservation.resource.name, reservation.reserver_email_address, reservation.reserver_name
+        ))
     return cal.to_ical()
 
 
+ICAL_ROW_FIELDS = ('id', 'begin', 'end', 'created_at', 'resource__name', 'reserver_email_address', 'reserver_name')
+
+
+def generate_reservations_ical(rows):
+    """
+    Generate an iCalendar file of reservations one event at a time
+
+    :type rows: iterable[tuple] values of ICAL_ROW_FIELDS of each reservation
+    :rtype: iterator[bytes]
+    """
+    footer = b'END:VCALENDAR\r\n'
+    yield _build_calendar().to_ical()[:-len(footer)]
+    for row in rows:
+        yield _build_ical_event(*row).to_ical()
+    yield footer
+
+
 def build_ical_feed_url(ical_token, request):
     """
     Return iCal feed url for given token without query parameters
@@ -1,9 +1,13 @@
 import django.dispatch
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 reservation_confirmed = django.dispatch.Signal(['instance', 'user'])
 reservation_modified = django.dispatch.Signal(['instance', 'user'])
 reservation_cancelled = django.dispatch.Signal(['instance', 'user'])
+# Sent once for reservations that are confirmed together, e.g. a recurring reservation
+reservations_confirmed = django.dispatch.Signal(['instances', 'user'])
 
 
 
@@ -18,6 +22,20 @@ def handle_reservation_confirmed(sender, instance, user, **kwargs):
         instance.resource.configuration.handle_create(instance)
 
 
+@receiver(reservations_confirmed)
+def handle_reservations_confirmed(sender, instances, user, **kwargs):
+    from .models import Reservation
+
+    Reservation.create_reminders([
+        instance for instance in instances
+        if instance.resource.unit.sms_reminder and instance.reserver_phone_number
+    ])
+
+    for instance in instances:
+        if instance.resource.configuration:
+            instance.resource.configuration.handle_create(instance)
+
+
 @receiver(reservation_modified)
 def handle_reservation_modified(sender, instance, user, **kwargs):
     if instance.resource.unit.sms_reminder and instance.reserver_phone_number:
@@ -25,3 +43,55 @@ def handle_reservation_modified(sender, instance, user, **kwargs):
 
     if instance.resource.configuration:
         instance.resource.configuration.handle_modify(instance)
+
+
+@receiver(pre_save, sender='resources.Reservation')
+def store_reservation_previous_time(sender, instance, **kwargs):
+    """
+    Remember where the reservation was, so that the free intervals
+    it used to occupy can be released after it has been moved.
+    """
+    if not instance.pk:
+        instance._previous_time = None
+        return
+    instance._previous_time = sender.objects.filter(pk=instance.pk).values_list(
+        'resource_id', 'begin', 'end'
+    ).first()
+
+
+@receiver(post_save, sender='resources.Reservation')
+def update_free_intervals_on_reservation_save(sender, instance, **kwargs):
+    from .models import Resource
+
+    if getattr(instance, '_free_intervals_updated', False):
+        return
+    previous = getattr(instance, '_previous_time', None)
+    if previous and previous != (instance.resource_id, instance.begin, instance.end):
+        resource_id, previous_begin, previous_end = previous
+        if resource_id == instance.resource_id:
+            previous_resource = instance.resource
+        else:
+            previous_resource = Resource.objects.with_soft_deleted.get(pk=resource_id)
+        previous_resource.update_free_intervals(previous_begin, previous_end)
+    instance.resource.update_free_intervals(instance.begin, instance.end)
+
+
+@receiver(post_delete, sender='resources.Reservation')
+def update_free_intervals_on_reservation_delete(sender, instance, **kwargs):
+    instance.resource.update_free_intervals(instance.begin, instance.end)
+
+
+@receiver(post_save, sender='resources.UnitAuthorization')
+@receiver(post_delete, sender='resources.UnitAuthorization')
+@receiver(post_save, sender='resources.UnitGroupAuthorization')
+@receiver(post_delete, sender='resources.UnitGroupAuthorization')
+@receiver(m2m_changed, sender='resources.UnitGroup_members')
+@receiver(post_save, sender='guardian.UserObjectPermission')
+@receiver(post_delete, sender='guardian.UserObjectPermission')
+@receiver(post_save, sender='guardian.GroupObjectPermission')
+@receiver(post_delete, sender='guardian.GroupObjectPermission')
+@receiver(m2m_changed, sender=settings.AUTH_USER_MODEL + '_groups')
+def invalidate_permission_cache_on_change(sender, **kwargs):
+    from .auth import invalidate_permission_cache
+
+    invalidate_permission_cache()
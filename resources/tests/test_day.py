@@ -1,8 +1,11 @@
 import datetime
 from datetime import date
+from io import StringIO
 import pytest
+from django.core.management import call_command
 
-from resources.models import Period, Day
+from resources.models import Period, Day, Resource
+from resources.models.availability import get_resources_opening_hours
 from .utils import assert_hours
 
 
@@ -95,3 +98,80 @@ def test_opening_hours(resource_in_unit):
     assert_hours(tz, hours, date(2015, 1, 1), '10:00', '14:00')
     assert_hours(tz, hours, date(2015, 1, 2), '10:00', '14:00')
     assert_hours(tz, hours, date(2015, 1, 3), None)
+
+
+@pytest.mark.django_db
+def test_opening_hours_update_date_range(resource_in_unit):
+    unit = resource_in_unit.unit
+    tz = unit.get_tz()
+
+    p1 = Period.objects.create(start=date(2015, 1, 1), end=date(2015, 12, 31),
+                               unit=unit, name='regular hours')
+    for weekday in range(0, 7):
+        Day.objects.create(period=p1, weekday=weekday,
+                           opens=datetime.time(8, 0),
+                           closes=datetime.time(18, 0))
+    unit.update_opening_hours()
+
+    p2 = Period.objects.create(start=date(2015, 6, 1), end=date(2015, 6, 7),
+                               resource=resource_in_unit, name='short week')
+    for weekday in range(0, 7):
+        Day.objects.create(period=p2, weekday=weekday,
+                           opens=datetime.time(10, 0),
+                           closes=datetime.time(12, 0))
+    Day.objects.filter(period=p1, weekday=0).update(opens=datetime.time(9, 0))
+
+    # only the dates of the changed resource period are recalculated
+    resource_in_unit.update_opening_hours(date(2015, 6, 1), date(2015, 6, 7))
+    begin = tz.localize(datetime.datetime(2015, 5, 31))
+    hours = resource_in_unit.get_opening_hours(begin, begin + datetime.timedelta(days=9))
+    assert_hours(tz, hours, date(2015, 5, 31), '08:00', '18:00')
+    assert_hours(tz, hours, date(2015, 6, 1), '10:00', '12:00')
+    assert_hours(tz, hours, date(2015, 6, 7), '10:00', '12:00')
+    assert_hours(tz, hours, date(2015, 6, 8), '08:00', '18:00')
+
+    p2.delete()
+    unit.update_opening_hours(date(2015, 6, 1), date(2015, 6, 7))
+    hours = resource_in_unit.get_opening_hours(begin, begin + datetime.timedelta(days=9))
+    assert_hours(tz, hours, date(2015, 6, 1), '09:00', '18:00')
+    assert_hours(tz, hours, date(2015, 6, 2), '08:00', '18:00')
+    assert_hours(tz, hours, date(2015, 6, 8), '08:00', '18:00')
+
+
+@pytest.mark.django_db
+def test_rebuild_opening_hours_command(resource_in_unit, resource_in_unit2):
+    for resource in (resource_in_unit, resource_in_unit2):
+        p1 = Period.objects.create(start=date(2015, 1, 1), end=date(2015, 1, 31), unit=resource.unit)
+        Day.objects.create(period=p1, weekday=0, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+
+    out = StringIO()
+    call_command('rebuild_opening_hours', '--workers=1', stdout=out)
+
+    assert 'Rebuilt 2 batches' in out.getvalue()
+    for resource in (resource_in_unit, resource_in_unit2):
+        assert resource.opening_hours.count() == 4
+        assert resource.free_intervals.count() == 4
+
+
+@pytest.mark.django_db
+def test_resources_opening_hours(resource_in_unit, resource_in_unit2):
+    unit = resource_in_unit.unit
+    tz = unit.get_tz()
+
+    p1 = Period.objects.create(start=date(2015, 1, 1), end=date(2015, 12, 31), unit=unit)
+    for weekday in range(0, 5):
+        Day.objects.create(period=p1, weekday=weekday, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    p2 = Period.objects.create(start=date(2015, 6, 6), end=date(2015, 6, 6), resource=resource_in_unit)
+    Day.objects.create(period=p2, weekday=5, opens=datetime.time(10, 0), closes=datetime.time(12, 0))
+
+    hours = get_resources_opening_hours(
+        Resource.objects.filter(pk__in=(resource_in_unit.pk, resource_in_unit2.pk)), date(2015, 6, 5), date(2015, 6, 8)
+    )
+
+    assert list(hours[resource_in_unit.pk].items()) == [
+        (date(2015, 6, 5), (tz.localize(datetime.datetime(2015, 6, 5, 8)), tz.localize(datetime.datetime(2015, 6, 5, 16)))),
+        (date(2015, 6, 6), (tz.localize(datetime.datetime(2015, 6, 6, 10)), tz.localize(datetime.datetime(2015, 6, 6, 12)))),
+        (date(2015, 6, 8), (tz.localize(datetime.datetime(2015, 6, 8, 8)), tz.localize(datetime.datetime(2015, 6, 8, 16)))),
+    ]
+    # the second resource is in another unit without periods
+    assert hours[resource_in_unit2.pk] == {}
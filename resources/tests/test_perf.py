@@ -1,10 +1,21 @@
+import json
+import time
+import tracemalloc
 from datetime import datetime
+from urllib.parse import urlencode
 
 import arrow
 import pytest
 from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-from resources.models import Day, Period, Reservation, Resource, ResourceType, Unit
+from resources.enums import UnitAuthorizationLevel
+from resources.models import Day, Period, Reservation, Resource, ResourceType, Unit, UnitAuthorization
+from resources.models.resource import update_resources_opening_hours
+from .utils import MAX_QUERIES
 
 TEST_PERFORMANCE = bool(getattr(settings, "TEST_PERFORMANCE", False))
 
@@ -87,3 +98,197 @@ def test_avail_resource_scalability(client):
         response = client.get('/test/availability?start_date=2015-06-01&end_date=2015-06-30')
         end = datetime.now()
         perf_res_list.write(str(n) + ', ' + str(end - start) + '\n')
+
+
+# The API benchmark suite below is run against a realistically sized
+# dataset. Every endpoint and parameter combination is requested as each
+# type of user, and the query count, wall time and peak memory of the
+# request are recorded into a JSON report (settings.TEST_PERFORMANCE_REPORT).
+# A test fails if a request makes more queries than its budget or, when
+# a previous report is given as settings.TEST_PERFORMANCE_BASELINE, takes
+# more than LATENCY_TOLERANCE times as long as in the baseline.
+
+BENCHMARK_UNITS = 20
+BENCHMARK_RESOURCES = 2000
+BENCHMARK_RESERVATIONS_PER_RESOURCE = 10
+LATENCY_TOLERANCE = 1.5
+
+BENCHMARK_START = '2115-04-06T08:00:00+03:00'
+BENCHMARK_END = '2115-04-06T20:00:00+03:00'
+
+BENCHMARK_CASES = {
+    'resource': ('/v1/resource/', [
+        {},
+        {'start': BENCHMARK_START, 'end': BENCHMARK_END},
+        {'available_between': '{},{}'.format(BENCHMARK_START, BENCHMARK_END)},
+        {'available_between': '{},{},60'.format(BENCHMARK_START, BENCHMARK_END)},
+        {'lat': '60.45', 'lon': '22.27', 'distance': '5000'},
+        {'include': 'unit_detail'},
+        {'start': BENCHMARK_START, 'end': BENCHMARK_END, 'include': 'unit_detail'},
+    ]),
+    'reservation': ('/v1/reservation/', [
+        {},
+        {'start': BENCHMARK_START, 'end': BENCHMARK_END},
+        {'start': BENCHMARK_START, 'end': BENCHMARK_END, 'include': 'resource_detail'},
+    ]),
+    'unit': ('/v1/unit/', [
+        {},
+        {'unit_has_resource': 'true'},
+        {'include': 'accessibility_summaries'},
+    ]),
+    'search': ('/v1/search/', [
+        {'input': 'bench'},
+        {'input': 'bench', 'types': 'resource'},
+        {'input': 'bench', 'full': 'true'},
+    ]),
+}
+
+# The query count of a request must not depend on the amount of data, so
+# the same budget is used as for the regular tests unless overridden here.
+QUERY_BUDGETS = {}
+
+
+@pytest.fixture(scope='session')
+def benchmark_report():
+    results = []
+    yield results
+    if not results:
+        return
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'dataset': {
+            'units': BENCHMARK_UNITS,
+            'resources': BENCHMARK_RESOURCES,
+            'reservations': BENCHMARK_RESOURCES * BENCHMARK_RESERVATIONS_PER_RESOURCE,
+        },
+        'results': results,
+    }
+    with open(getattr(settings, 'TEST_PERFORMANCE_REPORT', 'perf_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+@pytest.fixture(scope='session')
+def benchmark_baseline():
+    path = getattr(settings, 'TEST_PERFORMANCE_BASELINE', None)
+    if not path:
+        return {}
+    with open(path) as f:
+        return {result['case']: result for result in json.load(f)['results']}
+
+
+@pytest.fixture
+def benchmark_data(space_resource_type, user, staff_user, unit_manager_user):
+    """
+    Create units in two time zones with thousands of resources, their
+    opening hours and tens of thousands of reservations
+
+    The unit manager is authorized to every other unit.
+    """
+    units = []
+    for i in range(BENCHMARK_UNITS):
+        unit = Unit.objects.create(
+            id='bench-unit-%d' % i, name='Bench unit %d' % i,
+            time_zone='Europe/Helsinki' if i % 2 else 'Europe/Stockholm',
+            location=Point(22.27 + i * 0.01, 60.45, srid=4326),
+        )
+        period = Period.objects.create(start='2115-04-01', end='2115-04-30', unit=unit, name='')
+        Day.objects.bulk_create([
+            Day(period=period, weekday=weekday, opens='08:00', closes='20:00') for weekday in range(7)
+        ])
+        if i % 2:
+            UnitAuthorization.objects.create(
+                subject=unit, level=UnitAuthorizationLevel.manager, authorized=unit_manager_user
+            )
+        units.append(unit)
+
+    resources = Resource.objects.bulk_create([
+        Resource(
+            id='bench-resource-%d' % i, name='Bench resource %d' % i, type=space_resource_type,
+            unit=units[i % BENCHMARK_UNITS], reservable=True, _public=bool(i % 10),
+        )
+        for i in range(BENCHMARK_RESOURCES)
+    ])
+
+    reservations = []
+    first_day = arrow.get('2115-04-01T06:00:00Z')
+    for i, resource in enumerate(resources):
+        for j in range(BENCHMARK_RESERVATIONS_PER_RESOURCE):
+            begin = first_day.shift(days=j % 10, hours=(i + j) % 10)
+            reservations.append(Reservation(
+                resource=resource, begin=begin.datetime, end=begin.shift(hours=1).datetime,
+                user=(user, staff_user, unit_manager_user)[(i + j) % 3],
+                state=Reservation.CONFIRMED,
+            ))
+    Reservation.objects.bulk_create(reservations, batch_size=1000)
+
+    for unit in units:
+        update_resources_opening_hours(unit, [r for r in resources if r.unit_id == unit.id])
+
+    return units, resources
+
+
+@pytest.fixture
+def benchmark_clients(user, staff_user, unit_manager_user):
+    clients = {'anonymous': APIClient()}
+    for name, client_user in (('user', user), ('unit_manager', unit_manager_user), ('staff', staff_user)):
+        clients[name] = APIClient()
+        clients[name].force_authenticate(user=client_user)
+    return clients
+
+
+def measure_request(client, url, params):
+    """
+    Request the url and return its response, query count, wall time and peak memory
+
+    The request is made once beforehand to fill the caches and the memory is
+    traced during a separate request, so it does not distort the timing.
+    """
+    client.get(url, params)
+
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        response = client.get(url, params)
+        wall_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        client.get(url, params)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return response, len(context.captured_queries), wall_time, peak_memory
+
+
+@pytest.mark.skipif(not TEST_PERFORMANCE, reason="TEST_PERFORMANCE not enabled")
+@pytest.mark.parametrize('endpoint', BENCHMARK_CASES.keys())
+@pytest.mark.django_db
+def test_api_benchmark(endpoint, benchmark_data, benchmark_clients, benchmark_report, benchmark_baseline):
+    url, params_list = BENCHMARK_CASES[endpoint]
+    failures = []
+    for params in params_list:
+        for client_name, client in benchmark_clients.items():
+            case = '%s?%s [%s]' % (url, urlencode(params), client_name)
+            response, queries, wall_time, peak_memory = measure_request(client, url, params)
+            budget = QUERY_BUDGETS.get((endpoint, urlencode(params)), MAX_QUERIES)
+            benchmark_report.append({
+                'case': case,
+                'endpoint': endpoint,
+                'params': params,
+                'client': client_name,
+                'status_code': response.status_code,
+                'queries': queries,
+                'query_budget': budget,
+                'wall_time': wall_time,
+                'peak_memory': peak_memory,
+            })
+
+            if response.status_code != 200:
+                failures.append('%s: status code %d' % (case, response.status_code))
+            if queries > budget:
+                failures.append('%s: %d queries, budget %d' % (case, queries, budget))
+            baseline = benchmark_baseline.get(case)
+            if baseline and wall_time > baseline['wall_time'] * LATENCY_TOLERANCE:
+                failures.append('%s: %.3f s, baseline %.3f s' % (case, wall_time, baseline['wall_time']))
+
+    assert not failures, '\n'.join(failures)
@@ -2,13 +2,18 @@ import datetime
 import pytest
 
 import arrow
+from io import StringIO
+from django.core import mail
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection as db_connection
 from django.utils.translation import activate
 from django.test import TestCase
 from django.utils import timezone
 from freezegun import freeze_time
 
 from resources.enums import UnitAuthorizationLevel
+from notifications.models import NotificationTemplate, NotificationType, QueuedNotification
 from resources.models import (
     Day,
     Period,
@@ -21,6 +26,7 @@ from resources.models import (
     ReservationHomeMunicipalityField,
     ReservationHomeMunicipalitySet,
 )
+from resources.models.reservation import ReservationReminder, ReservationValidationContext
 
 
 class ReservationTestCase(TestCase):
@@ -188,6 +194,187 @@ def test_admin_may_bypass_min_period(resource_with_opening_hours, user):
         reservation.clean()
     assert error.value.code == 'invalid_time_slot'
 
+@freeze_time('2115-04-02')
+@pytest.mark.django_db
+def test_validation_context_fetches_reservations_at_once(resource_with_opening_hours, user, django_assert_num_queries):
+    """
+    The reservations of the resource and the unit and the active reservations
+    of the user should be fetched with one query
+    """
+    resource = resource_with_opening_hours
+    resource.cooldown = datetime.timedelta(hours=1)
+    resource.max_reservations_per_user = 5
+    resource.save()
+    resource.unit.disallow_overlapping_reservations = True
+    resource.unit.save()
+    other_resource = Resource.objects.create(name='other', unit=resource.unit, type=resource.type)
+
+    tz = timezone.get_current_timezone()
+    begin = tz.localize(datetime.datetime(2115, 6, 1, 10, 0, 0))
+    Reservation.objects.create(resource=resource, begin=begin - datetime.timedelta(hours=2),
+                               end=begin - datetime.timedelta(minutes=30), user=user)
+    Reservation.objects.create(resource=resource, begin=begin + datetime.timedelta(days=1),
+                               end=begin + datetime.timedelta(days=1, hours=1), user=user)
+    Reservation.objects.create(resource=other_resource, begin=begin, end=begin + datetime.timedelta(hours=1))
+
+    context = ReservationValidationContext(resource, user, begin, begin + datetime.timedelta(hours=1))
+    assert context.check_unit_overlaps
+    with django_assert_num_queries(1):
+        assert len(context.reservations) == 1
+        assert len(context.unit_reservations) == 1
+        assert context.active_reservation_count == 2
+
+    assert context.has_cooldown_collision(begin, begin + datetime.timedelta(hours=1))
+    assert not context.has_collision(begin, begin + datetime.timedelta(hours=1))
+    assert context.has_unit_overlap(begin, begin + datetime.timedelta(hours=1))
+
+
+@freeze_time('2115-06-01 12:00:00')
+@pytest.mark.django_db
+def test_handle_reminders_sends_due_reminders(resource_in_unit, user, settings):
+    settings.GSM_NOTIFICATION_ADDRESS = 'sms.example.com'
+    NotificationTemplate.objects.create(
+        type=NotificationType.RESERVATION_REMINDER, is_default_template=True,
+        short_message='Reminder', subject='Reminder', body='Reminder',
+    )
+    now = timezone.now()
+    reminders = {}
+    for name, state, reminder_date in (
+        ('due', Reservation.CONFIRMED, now - datetime.timedelta(hours=1)),
+        ('future', Reservation.CONFIRMED, now + datetime.timedelta(hours=1)),
+        ('cancelled', Reservation.CANCELLED, now - datetime.timedelta(hours=1)),
+    ):
+        begin = now + datetime.timedelta(days=1 + len(reminders))
+        reservation = Reservation.objects.create(
+            resource=resource_in_unit, begin=begin, end=begin + datetime.timedelta(hours=1),
+            user=user, state=state, reserver_phone_number='0401234567',
+        )
+        reminders[name] = ReservationReminder.objects.create(reservation=reservation, reminder_date=reminder_date)
+
+    out = StringIO()
+    call_command('handle_reminders', '--batch-size=1', stdout=out)
+
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == ['0401234567@sms.example.com']
+    assert set(ReservationReminder.objects.values_list('pk', flat=True)) == {reminders['future'].pk}
+    assert 'Sent 1 reminders' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_queued_notifications_are_sent_by_command(resource_in_unit, user, settings, monkeypatch):
+    settings.RESPA_NOTIFICATION_OUTBOX_ENABLED = True
+    settings.RESPA_NOTIFICATION_MAX_ATTEMPTS = 2
+    NotificationTemplate.objects.create(
+        type=NotificationType.RESERVATION_CREATED, is_default_template=True,
+        short_message='Created', subject='Created', body='Created',
+    )
+    begin = timezone.now() + datetime.timedelta(days=1)
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit, begin=begin, end=begin + datetime.timedelta(hours=1),
+        user=user, reserver_email_address='reserver@example.com',
+    )
+
+    reservation.send_reservation_created_mail()
+    assert len(mail.outbox) == 0
+    notification = QueuedNotification.objects.get()
+    assert notification.ical_attachments == [['reservation.ics', [reservation.pk]]]
+
+    def fail(self, connection=None):
+        raise ConnectionError('mail server is down')
+
+    with monkeypatch.context() as m:
+        m.setattr(QueuedNotification, 'send', fail)
+        call_command('send_notifications', stdout=StringIO())
+        notification.refresh_from_db()
+        assert notification.state == QueuedNotification.PENDING
+        assert notification.attempts == 1
+        assert notification.send_after > timezone.now()
+
+        # not due yet
+        call_command('send_notifications', stdout=StringIO())
+        notification.refresh_from_db()
+        assert notification.attempts == 1
+
+    QueuedNotification.objects.update(send_after=timezone.now())
+    out = StringIO()
+    call_command('send_notifications', stdout=out)
+    assert 'Sent 1 notifications' in out.getvalue()
+    assert not QueuedNotification.objects.exists()
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == ['reserver@example.com']
+    assert mail.outbox[0].attachments[0][0] == 'reservation.ics'
+
+    reservation.send_reservation_created_mail()
+    with monkeypatch.context() as m:
+        m.setattr(QueuedNotification, 'send', fail)
+        QueuedNotification.objects.update(attempts=1)
+        call_command('send_notifications', stdout=StringIO())
+    notification = QueuedNotification.objects.get()
+    assert notification.state == QueuedNotification.FAILED
+    assert notification.last_error == 'mail server is down'
+
+
+@pytest.mark.django_db
+def test_queued_notification_database_error_fails_only_it(resource_in_unit, user, settings, monkeypatch):
+    settings.RESPA_NOTIFICATION_OUTBOX_ENABLED = True
+    NotificationTemplate.objects.create(
+        type=NotificationType.RESERVATION_CREATED, is_default_template=True,
+        short_message='Created', subject='Created', body='Created',
+    )
+    begin = timezone.now() + datetime.timedelta(days=1)
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit, begin=begin, end=begin + datetime.timedelta(hours=1),
+        user=user, reserver_email_address='reserver@example.com',
+    )
+    reservation.send_reservation_created_mail()
+    reservation.send_reservation_created_mail()
+    broken, working = QueuedNotification.objects.order_by('pk')
+    send = QueuedNotification.send
+
+    def send_or_break(self, connection=None):
+        if self.pk == broken.pk:
+            with db_connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM no_such_table')
+        return send(self, connection=connection)
+
+    monkeypatch.setattr(QueuedNotification, 'send', send_or_break)
+    call_command('send_notifications', stdout=StringIO())
+
+    # the other notification of the batch is sent and not sent again
+    assert len(mail.outbox) == 1
+    assert list(QueuedNotification.objects.values_list('pk', flat=True)) == [broken.pk]
+    broken.refresh_from_db()
+    assert broken.attempts == 1
+
+
+@pytest.mark.django_db
+def test_queued_notifications_outlive_their_reservation(resource_in_unit, user, settings):
+    settings.RESPA_NOTIFICATION_OUTBOX_ENABLED = True
+    NotificationTemplate.objects.create(
+        type=NotificationType.RESERVATION_CANCELLED, is_default_template=True,
+        short_message='Cancelled', subject='Cancelled', body='{{ resource }} {{ begin_dt|format_datetime }}',
+    )
+    begin = timezone.now() + datetime.timedelta(days=1)
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit, begin=begin, end=begin + datetime.timedelta(hours=1),
+        user=user, reserver_email_address='reserver@example.com',
+    )
+    reservation.send_reservation_mail(
+        NotificationType.RESERVATION_CANCELLED, attachments=[('terms.txt', 'Terms of use', 'text/plain')],
+        ical_attachments=[('reservation.ics', [reservation])]
+    )
+    reservation.delete()
+
+    call_command('send_notifications', stdout=StringIO())
+    assert not QueuedNotification.objects.exists()
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == ['reserver@example.com']
+    # the dates of the context are still dates for the template filters
+    assert mail.outbox[0].body.startswith(resource_in_unit.name)
+    # the calendar file of the deleted reservation is left out
+    assert mail.outbox[0].attachments == [('terms.txt', 'Terms of use', 'text/plain')]
+
+
 @pytest.mark.django_db
 def test_reservation_home_municipality_field_str():
     home_municipality_field = ReservationHomeMunicipalityField.objects.create(name='test municipality')
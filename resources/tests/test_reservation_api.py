@@ -20,6 +20,7 @@ from resources.models import (
     Resource, ResourceGroup, ReservationMetadataField,
     ReservationMetadataSet, UnitAuthorization, ReservationReminder
 )
+from resources.models.reservation import ReservationValidationContext
 from resources.models.utils import build_reservations_ical_file, RespaNotificationAction
 from notifications.models import NotificationTemplate, NotificationType
 from notifications.tests.utils import check_received_mail_exists
@@ -1171,6 +1172,75 @@ def test_reservation_excels(staff_api_client, list_url, detail_url, reservation,
     assert len(response.content) > 0
 
 
+@pytest.mark.django_db
+def test_reservation_export(staff_api_client, list_url, reservation):
+    """
+    Tests that all the filtered reservations are streamed as .xlsx and .csv files
+    """
+    export_url = list_url + 'export/'
+    response = staff_api_client.get(export_url, data={'format': 'xlsx'}, HTTP_ACCEPT_LANGUAGE='en')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename="reservations.xlsx"'
+    assert len(b''.join(response.streaming_content)) > 0
+
+    response = staff_api_client.get(export_url, data={'format': 'csv'}, HTTP_ACCEPT_LANGUAGE='en')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=reservations.csv'
+    rows = b''.join(response.streaming_content).decode('utf-8').splitlines()
+    assert len(rows) == 2
+    assert reservation.resource.name in rows[1]
+
+    # the reservation begins on a thursday
+    response = staff_api_client.get(export_url, data={'format': 'csv', 'weekdays': '0,1'}, HTTP_ACCEPT_LANGUAGE='en')
+    assert response.status_code == 200
+    assert len(b''.join(response.streaming_content).decode('utf-8').splitlines()) == 1
+
+    response = staff_api_client.get(export_url, data={'format': 'csv', 'weekdays': 'x'})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_reservation_list_ignores_weekdays(staff_api_client, list_url, reservation):
+    """
+    Tests that the weekdays filter of the reports does not apply to the JSON list
+    """
+    # the reservation begins on a thursday
+    response = staff_api_client.get(list_url, data={'weekdays': '0,1'})
+    assert response.status_code == 200
+    assert [result['id'] for result in response.data['results']] == [reservation.id]
+
+
+@pytest.mark.django_db
+def test_reservation_ical_feed(api_client, resource_in_unit, user, reservation):
+    """
+    Tests that the feed streams the reservations of the coming year and
+    answers 304 until they change
+    """
+    begin = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    upcoming = Reservation.objects.create(
+        resource=resource_in_unit, begin=begin, end=begin + datetime.timedelta(hours=1), user=user,
+        reserver_name='martta', reserver_email_address='martta@example.com', state=Reservation.CONFIRMED
+    )
+    url = reverse('ical-feed', kwargs={'ical_token': user.get_or_create_ical_token()})
+
+    response = api_client.get(url)
+    assert response.status_code == 200
+    calendar = Calendar.from_ical(b''.join(response.streaming_content))
+    events = calendar.walk('vevent')
+    # the fixture reservation is over 365 days away
+    assert [str(event['uid']) for event in events] == ['respa_reservation_%s' % upcoming.pk]
+    assert events[0].decoded('dtstart') == begin
+    etag = response['ETag']
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    upcoming.set_state(Reservation.CANCELLED, user)
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert not Calendar.from_ical(b''.join(response.streaming_content)).walk('vevent')
+
+
 @pytest.mark.parametrize('need_manual_confirmation, expected_state', [
     (False, Reservation.CONFIRMED),
     (True, Reservation.REQUESTED)
@@ -3561,6 +3631,38 @@ def test_recurring_reservation_too_many_reservations_at_once(
     assert response.status_code == 406
 
 
+@pytest.mark.django_db
+def test_recurring_reservation_max_size_setting(
+    resource_in_unit4_1, recurring_reservation_data,
+    staff_api_client, staff_user, recurring_url):
+    UnitAuthorization.objects.create(subject=resource_in_unit4_1.unit,
+                                     level=UnitAuthorizationLevel.manager, authorized=staff_user)
+
+    with override_settings(RESPA_RESERVATION_BULK_MAX_SIZE=2):
+        response = staff_api_client.post(recurring_url, data=recurring_reservation_data, format='json')
+    assert response.status_code == 406
+
+    with override_settings(RESPA_RESERVATION_BULK_MAX_SIZE=3):
+        response = staff_api_client.post(recurring_url, data=recurring_reservation_data, format='json')
+    assert response.status_code == 201
+
+
+@pytest.mark.django_db
+def test_recurring_reservation_overlapping_stack(
+    resource_in_unit4_1, recurring_reservation_data,
+    staff_api_client, staff_user, recurring_url):
+    UnitAuthorization.objects.create(subject=resource_in_unit4_1.unit,
+                                     level=UnitAuthorizationLevel.manager, authorized=staff_user)
+
+    recurring_reservation_data['reservation_stack'].append({
+        'begin': '2115-04-05T11:30:00+02:00',
+        'end': '2115-04-05T12:30:00+02:00',
+    })
+    response = staff_api_client.post(recurring_url, data=recurring_reservation_data, format='json')
+    assert response.status_code == 400
+    assert Reservation.objects.count() == 0
+
+
 @pytest.mark.django_db
 def test_recurring_reservation_bad_period(
     resource_in_unit4_1, recurring_reservation_data,
@@ -3684,6 +3786,63 @@ def test_reservation_cooldown_not_in_use_for_type_blocked_reservation(
     assert response.status_code == 201
 
 
+@pytest.mark.django_db
+@freeze_time('2115-04-04')
+def test_reservation_collisions_enforced_by_database(
+        resource_with_cooldown, reservation_data, api_client, user, list_url, monkeypatch):
+    """
+    Tests that the reservations that slip through validation concurrently are
+    rejected by the database constraints with the usual validation errors
+    """
+    reservation_data['resource'] = resource_with_cooldown.pk
+    api_client.force_authenticate(user=user)
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 201
+    reservation = Reservation.objects.get()
+    assert reservation.enforced_cooldown == datetime.timedelta(hours=4)
+    assert reservation.cooldown_duration.upper == reservation.end + datetime.timedelta(hours=4)
+
+    # a concurrent request does not see the reservation when validating
+    monkeypatch.setattr(ReservationValidationContext, 'has_collision', lambda *args: False)
+    monkeypatch.setattr(ReservationValidationContext, 'has_cooldown_collision', lambda *args: False)
+
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 400
+    assert_translated_response_contains(response, 'period', 'The resource is already reserved for some of the period')
+
+    reservation_data['begin'] = '2115-04-04T12:00:00+02:00'
+    reservation_data['end'] = '2115-04-04T13:00:00+02:00'
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 400
+    assert_translated_response_contains(response, 'cooldown', 'Cannot be reserved during cooldown')
+    assert Reservation.objects.count() == 1
+
+
+@pytest.mark.django_db
+@freeze_time('2115-04-04')
+def test_lowered_cooldown_is_enforced_by_database(resource_with_cooldown, reservation_data, api_client, user, list_url):
+    """
+    Tests that lowering the cooldown of a resource lowers the cooldown the
+    database enforces on its existing reservations
+    """
+    reservation_data['resource'] = resource_with_cooldown.pk
+    api_client.force_authenticate(user=user)
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 201
+
+    resource_with_cooldown.cooldown = datetime.timedelta(hours=1)
+    resource_with_cooldown.save()
+    reservation = Reservation.objects.get()
+    assert reservation.enforced_cooldown == datetime.timedelta(hours=1)
+    assert reservation.cooldown_duration.upper == reservation.end + datetime.timedelta(hours=1)
+
+    reservation_data['begin'] = '2115-04-04T13:00:00+02:00'
+    reservation_data['end'] = '2115-04-04T14:00:00+02:00'
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 201
+    assert Reservation.objects.count() == 2
+
+
 @pytest.mark.django_db
 def test_overnight_reservation(
     resource_with_overnight_reservations,
@@ -4,12 +4,15 @@ import pytest
 import datetime
 from django.core.files.base import ContentFile
 from django.core.exceptions import ValidationError
+from django.test.utils import override_settings
 from django.utils.translation import activate
+from guardian.shortcuts import assign_perm, remove_perm
 from PIL import Image, UnidentifiedImageError
 
+from resources.auth import PermissionResolver
 from resources.enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
 from resources.errors import InvalidImage
-from resources.models import ResourceImage, Resource
+from resources.models import Day, Period, Reservation, ResourceImage, Resource, UnitGroup
 from resources.tests.utils import create_resource_image, get_test_image_data, get_field_errors
 
 
@@ -194,6 +197,64 @@ def test_queryset_with_perm(resource_in_unit, user):
     assert resource_in_unit in resources
 
 
+@pytest.mark.django_db
+def test_permission_resolver(resource_in_unit, user, group):
+    """
+    Tests that the permissions resolved at once match the ones checked per resource
+    """
+    unit_group = UnitGroup.objects.create(name='unit group')
+    unit_group.members.add(resource_in_unit.unit)
+    resource_group = resource_in_unit.groups.create(name='rg1')
+    user.groups.add(group)
+
+    def check_permissions(**expected):
+        resolved_resource = Resource.objects.get(pk=resource_in_unit.pk)
+        resolved_resource._permission_resolver = PermissionResolver.for_user(user)
+        for name, value in expected.items():
+            assert getattr(resolved_resource, name)(user) is value
+            assert getattr(Resource.objects.get(pk=resource_in_unit.pk), name)(user) is value
+
+    check_permissions(is_admin=False, is_manager=False, can_ignore_opening_hours=False, can_bypass_payment=False)
+
+    assign_perm('unit:can_ignore_opening_hours', user, resource_in_unit.unit)
+    assign_perm('group:can_bypass_payment', group, resource_group)
+    check_permissions(is_admin=False, can_ignore_opening_hours=True, can_bypass_payment=True)
+
+    user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=resource_in_unit.unit)
+    check_permissions(is_admin=False, is_manager=True, can_modify_paid_reservations=True)
+
+    user.unit_group_authorizations.create(level=UnitGroupAuthorizationLevel.admin, subject=unit_group)
+    check_permissions(is_admin=True, is_manager=True)
+
+    user.is_active = False
+    user.save()
+    user.unit_authorizations.all().delete()
+    user.unit_group_authorizations.all().delete()
+    check_permissions(is_admin=False, can_ignore_opening_hours=False, can_bypass_payment=False)
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_PERMISSION_CACHE_TIMEOUT=60)
+def test_permission_resolver_cache_invalidation(resource_in_unit, user, django_assert_num_queries):
+    """
+    Tests that cached permissions are reused until authorizations change
+    """
+    resolver = PermissionResolver.for_user(user)
+    assert not resolver.is_unit_manager(resource_in_unit.unit)
+
+    with django_assert_num_queries(0):
+        PermissionResolver.for_user(user)
+
+    user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=resource_in_unit.unit)
+    assert PermissionResolver.for_user(user).is_unit_manager(resource_in_unit.unit)
+
+    assign_perm('unit:can_ignore_opening_hours', user, resource_in_unit.unit)
+    assert PermissionResolver.for_user(user).has_unit_perm(resource_in_unit.unit, 'unit:can_ignore_opening_hours')
+
+    remove_perm('unit:can_ignore_opening_hours', user, resource_in_unit.unit)
+    assert not PermissionResolver.for_user(user).has_unit_perm(resource_in_unit.unit, 'unit:can_ignore_opening_hours')
+
+
 @pytest.mark.django_db
 def test_soft_delete_and_restore_resource(resource_in_unit):
     pk = resource_in_unit.pk
@@ -202,3 +263,60 @@ def test_soft_delete_and_restore_resource(resource_in_unit):
     assert Resource.objects.with_soft_deleted.filter(pk=pk).count() == 1
     resource_in_unit.restore()
     assert Resource.objects.filter(pk=pk).count() == 1
+
+
+def get_free_intervals(resource, date):
+    begin = datetime.datetime.combine(date, datetime.time(0, 0), tzinfo=datetime.timezone.utc)
+    intervals = resource.free_intervals.filter(
+        free_between__overlap=(begin, begin + datetime.timedelta(days=1), '[)')
+    ).order_by('free_between')
+    return [(i.free_between.lower.time(), i.free_between.upper.time()) for i in intervals]
+
+
+@pytest.mark.django_db
+def test_free_intervals_follow_reservations(resource_in_unit, user):
+    resource_in_unit.unit.time_zone = 'UTC'
+    resource_in_unit.unit.save()
+    period = Period.objects.create(start=datetime.date(2115, 4, 1), end=datetime.date(2115, 4, 30),
+                                   resource=resource_in_unit)
+    for weekday in range(0, 7):
+        Day.objects.create(period=period, weekday=weekday, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    resource_in_unit.update_opening_hours()
+
+    date = datetime.date(2115, 4, 8)
+    assert get_free_intervals(resource_in_unit, date) == [(datetime.time(8), datetime.time(16))]
+
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit,
+        begin=datetime.datetime(2115, 4, 8, 10, tzinfo=datetime.timezone.utc),
+        end=datetime.datetime(2115, 4, 8, 12, tzinfo=datetime.timezone.utc),
+        user=user,
+    )
+    assert get_free_intervals(resource_in_unit, date) == [
+        (datetime.time(8), datetime.time(10)), (datetime.time(12), datetime.time(16))
+    ]
+
+    # moving the reservation releases its old time
+    reservation.begin = datetime.datetime(2115, 4, 9, 8, tzinfo=datetime.timezone.utc)
+    reservation.end = datetime.datetime(2115, 4, 9, 9, tzinfo=datetime.timezone.utc)
+    reservation.save()
+    assert get_free_intervals(resource_in_unit, date) == [(datetime.time(8), datetime.time(16))]
+    assert get_free_intervals(resource_in_unit, date + datetime.timedelta(days=1)) == [
+        (datetime.time(9), datetime.time(16))
+    ]
+
+    reservation.set_state(Reservation.CANCELLED, user)
+    assert get_free_intervals(resource_in_unit, date + datetime.timedelta(days=1)) == [
+        (datetime.time(8), datetime.time(16))
+    ]
+
+    reservation.state = Reservation.CONFIRMED
+    reservation.save()
+    assert get_free_intervals(resource_in_unit, date + datetime.timedelta(days=1)) == [
+        (datetime.time(9), datetime.time(16))
+    ]
+
+    reservation.delete()
+    assert get_free_intervals(resource_in_unit, date + datetime.timedelta(days=1)) == [
+        (datetime.time(8), datetime.time(16))
+    ]
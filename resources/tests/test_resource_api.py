@@ -745,16 +745,10 @@ def test_resource_available_between_filter_constraints(user_api_client, list_url
     assert 'available_between takes two or three comma-separated values.' in str(response.data)
 
     response = user_api_client.get(list_url, {
-        'available_between': '2115-04-08T00:00:00+02:00,2115-04-09T00:00:00+02:00'
+        'available_between': '2115-04-09T00:00:00+02:00,2115-04-08T00:00:00+02:00'
     })
     assert response.status_code == 400
-    assert 'available_between timestamps must be on the same day.' in str(response.data)
-
-    response = user_api_client.get(list_url, {
-        'available_between': '2115-04-08T00:00:00+02:00,2115-04-09T00:00:00+02:00,60'
-    })
-    assert response.status_code == 400
-    assert 'available_between timestamps must be on the same day.' in str(response.data)
+    assert 'available_between end must be after start.' in str(response.data)
 
     response = user_api_client.get(list_url, {
         'available_between': '2115-04-08T00:00:00+02:00,2115-04-08T00:00:00+02:00,xyz'
@@ -763,6 +757,38 @@ def test_resource_available_between_filter_constraints(user_api_client, list_url
     assert 'available_between period must be an integer.' in str(response.data)
 
 
+@pytest.mark.parametrize('filtering, expected_resource_indexes', (
+    ({'available_between': '2115-04-07T08:00:00+02:00,2115-04-08T16:00:00+02:00'}, []),
+    ({'available_between': '2115-04-07T15:00:00+02:00,2115-04-08T09:00:00+02:00,60'}, [0, 1]),
+    ({'available_between': '2115-04-07T15:00:00+02:00,2115-04-08T10:00:00+02:00,90'}, [1]),
+    ({'available_between': '2115-04-07T20:00:00+02:00,2115-04-08T13:00:00+02:00,60'}, [1]),
+))
+@pytest.mark.django_db
+def test_resource_available_between_filter_multiple_days(user_api_client, list_url, user, resource_in_unit,
+                                                         resource_in_unit2, filtering, expected_resource_indexes):
+    resources = (resource_in_unit, resource_in_unit2)
+    for resource in resources:
+        p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
+                                   end=datetime.date(2115, 4, 30),
+                                   resource=resource)
+        for weekday in range(0, 7):
+            Day.objects.create(period=p1, weekday=weekday,
+                               opens=datetime.time(8, 0),
+                               closes=datetime.time(16, 0))
+        resource.update_opening_hours()
+
+    Reservation.objects.create(
+        resource=resource_in_unit,
+        begin='2115-04-08T08:30:00+02:00',
+        end='2115-04-08T16:00:00+02:00',
+        user=user,
+    )
+
+    response = user_api_client.get(list_url, filtering)
+    assert response.status_code == 200
+    assert_response_objects(response, [resources[index] for index in expected_resource_indexes])
+
+
 @pytest.mark.django_db
 def test_resource_available_between_considers_inactive_reservations(user_api_client, user, list_url, resource_in_unit):
     p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
@@ -878,6 +904,32 @@ def test_available_between_with_period(list_url, resource_in_unit, resource_in_u
     assert_response_objects(response, expected_resources)
 
 
+@pytest.mark.django_db
+def test_opening_hours_of_units_in_different_time_zones(list_url, resource_in_unit, resource_in_unit2,
+                                                        user_api_client):
+    resource_in_unit2.unit.time_zone = 'America/New_York'
+    resource_in_unit2.unit.save()
+    for resource, opens, closes in ((resource_in_unit, datetime.time(8, 0), datetime.time(16, 0)),
+                                    (resource_in_unit2, datetime.time(18, 0), datetime.time(20, 0))):
+        period = Period.objects.create(start=datetime.date(2115, 4, 1), end=datetime.date(2115, 4, 8),
+                                       resource=resource)
+        for weekday in range(0, 7):
+            Day.objects.create(period=period, weekday=weekday, opens=opens, closes=closes)
+        resource.update_opening_hours()
+
+    response = user_api_client.get(list_url, {
+        'start': '2115-04-08T09:00:00Z', 'end': '2115-04-08T10:00:00Z'
+    })
+    assert response.status_code == 200
+    hours = {r['id']: r['opening_hours'] for r in response.data['results']}
+
+    # each resource gets the hours of the date in its own time zone only
+    assert len(hours[resource_in_unit.id]) == 1
+    assert hours[resource_in_unit.id][0]['opens'] == dateparse.parse_datetime('2115-04-08T08:00:00+03:00')
+    assert len(hours[resource_in_unit2.id]) == 1
+    assert hours[resource_in_unit2.id][0]['opens'] == dateparse.parse_datetime('2115-04-08T18:00:00-04:00')
+
+
 @pytest.mark.django_db
 def test_filtering_free_of_charge(list_url, api_client, resource_in_unit,
                                   resource_in_unit2, resource_in_unit3):
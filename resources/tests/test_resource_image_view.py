@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 import pytest
+from django.core.management import call_command
+from django.test.utils import override_settings
 from django.urls import reverse
 from six import BytesIO
 from PIL import Image
 
+from resources.models import ResourceImage
 from resources.tests.utils import create_resource_image
 from resources.views.images import parse_dimension_string
 
@@ -25,12 +28,65 @@ def test_resource_image_view_thumbing(client, space_resource):
     resp = client.get(reverse("resource-image-view", kwargs={"pk": png.pk}), data={"dim": "50x50"})
     assert resp["Content-Type"] == "image/jpeg"  # Thumbnails should be PNG even if source data isn't
     img_data = resp.getvalue()
-    assert Image.open(BytesIO(img_data)).size == (50, 50)
+    # the nearest pre-generated size is served
+    assert Image.open(BytesIO(img_data)).size == (150, 150)
 
     # Rudimentary checking of invalid `dim`s -- better testing in `test_dimension_string_parsing`
     assert client.get(reverse("resource-image-view", kwargs={"pk": png.pk}), data={"dim": "-x3"}).status_code == 400
 
 
+@pytest.mark.django_db
+@override_settings(RESPA_IMAGE_RENDITION_SIZES=['100x100', '200x100'])
+def test_resource_image_view_webp_and_caching(client, space_resource):
+    image = create_resource_image(space_resource, size=(300, 300), format="JPEG")
+    assert image.processing_state == ResourceImage.READY
+    url = reverse("resource-image-view", kwargs={"pk": image.pk})
+
+    resp = client.get(url, data={"dim": "180x90"}, HTTP_ACCEPT="image/webp,*/*")
+    assert resp["Content-Type"] == "image/webp"
+    assert Image.open(BytesIO(resp.getvalue())).size == (200, 100)
+    assert "max-age=" in resp["Cache-Control"]
+    assert "Accept" in resp["Vary"]
+
+    # any dimensions snapping to the same rendition are not modified
+    assert client.get(url, data={"dim": "210x110"}, HTTP_ACCEPT="image/webp",
+                      HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+    # the JPEG rendition has a tag of its own
+    resp = client.get(url, data={"dim": "210x110"}, HTTP_IF_NONE_MATCH=resp["ETag"])
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "image/jpeg"
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_IMAGE_QUEUE_ENABLED=True, RESPA_IMAGE_RENDITION_SIZES=['100x100'])
+def test_queued_resource_image_processing(client, space_resource):
+    image = create_resource_image(space_resource, size=(300, 300), format="BMP")
+    # the upload is validated but processed only by the command
+    assert image.processing_state == ResourceImage.PENDING
+    assert image.image_format == "BMP"
+
+    call_command("process_resource_images")
+
+    image.refresh_from_db()
+    assert image.processing_state == ResourceImage.READY
+    assert image.image_format == "JPEG"
+    assert Image.open(image.image).format == "JPEG"
+    assert image.get_rendition((100, 100), generate=False)
+    assert image.get_rendition((100, 100), webp=True, generate=False)
+
+    # a new cropping needs new renditions
+    image.cropping = '0,0,200,200'
+    image.save()
+    assert image.processing_state == ResourceImage.PENDING
+    assert not image.get_rendition((100, 100), generate=False)
+
+    call_command("process_resource_images")
+
+    image.refresh_from_db()
+    assert image.processing_state == ResourceImage.READY
+    assert image.get_rendition((100, 100), generate=False)
+
+
 def test_dimension_string_parsing():
     with pytest.raises(ValueError):
         parse_dimension_string("3x8x2")
@@ -3,7 +3,6 @@ from collections import namedtuple
 from itertools import groupby
 
 import arrow
-import django.db.models as djdbm
 import pytz
 from django.db.models import Prefetch
 from django.utils import timezone
@@ -11,6 +10,7 @@ from django.utils.dateformat import format
 from psycopg2.extras import DateRange, DateTimeTZRange
 
 from .models import Day, Period, Reservation, Resource, ResourceType, Unit
+from .models.availability import get_resources_opening_hours
 
 OpenHours = namedtuple("OpenHours", ['opens', 'closes'])
 FreeTime = namedtuple("FreeTime", ['begin', 'end', 'duration'])
@@ -229,16 +229,9 @@ def get_opening_hours(begin, end, resources=None):
 
     If resources is None, finds opening hours for all resources.
 
-    This version goes through all regular periods and then all
-    exception periods that are found overlapping the given
-    time range. It builds a dict of days that has dict of
-    resources with their active hours.
-
-    TODO: There is couple optimization avenues worth exploring
-    with prefetch or select_related for Periods'
-    relational fields Unit, Resource and Day. This way all
-    relevant information could be requested with one or two
-    queries from the db.
+    The periods of all the resources and their units are resolved
+    at once with `get_resources_opening_hours`. It builds a dict of
+    days that has dict of resources with their active hours.
     """
     if not resources:
         resources = Resource.objects.all()
@@ -246,46 +239,17 @@ def get_opening_hours(begin, end, resources=None):
     if not begin < end:
         end = begin + datetime.timedelta(days=1)
 
-    d_range = DateRange(begin, end)
-
-    periods = Period.objects.filter(
-        djdbm.Q(resource__in=resources) | djdbm.Q(unit__in=resources.values("unit__pk")),
-        duration__overlap=d_range).order_by('exception')
-
-    begin_dt = datetime.datetime.combine(begin, datetime.time(0, 0))
-    end_dt = datetime.datetime.combine(end, datetime.time(0, 0))
-
-    # Generates a dict of time range's days as keys and values as active period's days
+    resources = list(resources)
+    opening_hours = get_resources_opening_hours(resources, begin, end)
 
     # all requested dates are assumed closed
-    dates = {r.date(): False for r in arrow.Arrow.range('day', begin_dt, end_dt)}
-
-    for period in periods:
-
-        if period.start < begin:
-            start = begin_dt
-        else:
-            start = arrow.get(period.start)
-        if period.end > end:
-            end = end_dt
-        else:
-            end = arrow.get(period.end)
-
-        if period.resource:
-            period_resources = [period.resource]
-        else:
-            period_resources = period.unit.resources.filter(pk__in=resources)
-
-        for res in period_resources:
+    dates = {begin + datetime.timedelta(days=n): False for n in range((end - begin).days + 1)}
 
-            for r in arrow.Arrow.range('day', start, end):
-                for day in period.days.all():
-                    if day.weekday is r.weekday():
-                        if not dates.get(r.date(), None):
-                            dates[r.date] = {}
-                        dates[r.date()].setdefault(
-                            res, []).append(
-                            OpenHours(day.opens, day.closes))
+    for res in resources:
+        for date, (opens, closes) in opening_hours.get(res.pk, {}).items():
+            if not dates[date]:
+                dates[date] = {}
+            dates[date].setdefault(res, []).append(OpenHours(opens, closes))
 
     return dates
 
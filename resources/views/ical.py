@@ -1,11 +1,18 @@
+import datetime
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied
-from rest_framework.response import Response
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.views import APIView
 from rest_framework import renderers
 
 from resources.models import Reservation
-from resources.models.utils import build_reservations_ical_file
+from resources.models.utils import ICAL_ROW_FIELDS, generate_reservations_ical
 
 
 class ICalRenderer(renderers.BaseRenderer):
@@ -19,6 +26,11 @@ class ICalRenderer(renderers.BaseRenderer):
 class ICalFeedView(APIView):
     """
     Fetch a user's reservations in iCalendar format
+
+    The feed contains the active reservations of the next
+    RESPA_ICAL_FEED_DAYS days. Its ETag and Last-Modified are derived from
+    the reservations with one aggregate query, so polling an unchanged feed
+    is answered with 304 Not Modified without building it.
     """
 
     renderer_classes = (ICalRenderer, )
@@ -29,7 +41,21 @@ class ICalFeedView(APIView):
             user = User.objects.get(ical_token=ical_token)
         except User.DoesNotExist:
             raise PermissionDenied
-        reservations = Reservation.objects.filter(user=user).active()
-        ical_file = build_reservations_ical_file(reservations)
-        response = Response(ical_file)
+        reservations = Reservation.objects.filter(
+            user=user, begin__lt=timezone.now() + datetime.timedelta(days=settings.RESPA_ICAL_FEED_DAYS)
+        ).active()
+
+        # cancelled and past reservations leave the feed, which the count notices
+        state = reservations.aggregate(count=Count('pk'), modified_at=Max('modified_at'))
+        last_modified = state['modified_at'] and int(state['modified_at'].timestamp())
+        etag = quote_etag('%s-%s' % (state['count'], last_modified or 0))
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            rows = reservations.order_by('begin').values_list(*ICAL_ROW_FIELDS).iterator()
+            response = StreamingHttpResponse(
+                generate_reservations_ical(rows), content_type='%s; charset=utf-8' % ICalRenderer.media_type
+            )
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
         return response
@@ -1,9 +1,11 @@
 import os
 from mimetypes import guess_type
 
+from django.conf import settings
 from django.http.response import FileResponse, HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from django.views.generic import DetailView
-from easy_thumbnails.files import get_thumbnailer
 
 from resources.models import ResourceImage
 
@@ -33,6 +35,14 @@ def parse_dimension_string(dim):
 
 
 class ResourceImageView(DetailView):
+    """
+    Serve a resource image, or a cropped rendition of it with `dim`
+
+    Requested dimensions snap to the nearest of RESPA_IMAGE_RENDITION_SIZES,
+    whose renditions are generated when the image is processed. WebP
+    renditions are served to clients accepting them. Responses can be cached
+    for RESPA_IMAGE_CACHE_MAX_AGE seconds and revalidated with their ETags.
+    """
     model = ResourceImage
 
     def get(self, request, *args, **kwargs):
@@ -44,26 +54,37 @@ class ResourceImageView(DetailView):
                 width, height = parse_dimension_string(dim)
             except ValueError as verr:
                 return HttpResponseBadRequest(str(verr))
+            width, height = ResourceImage.get_nearest_rendition_size(width, height)
+            webp = 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+            variant = '%dx%d%s' % (width, height, '-webp' if webp else '')
         else:
             width = height = None
+            variant = 'original'
 
-        if not width:
-            out_image = image.image
-            filename = image.image.name
-        else:
-            try:
-                out_image = get_thumbnailer(image.image).get_thumbnail({
-                    'size': (width, height),
-                    'box': image.cropping,
-                    'crop': True,
-                    'detail': True,
-                })
-                filename = "%s-%dx%d%s" % (image.image.name, width, height, os.path.splitext(out_image.name)[1])
-            except:
-                return HttpResponseBadRequest()
+        last_modified = int(image.modified_at.timestamp())
+        etag = quote_etag('%s-%s-%s' % (image.stamp, last_modified, variant))
+        resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if resp is None:
+            if not width:
+                out_image = image.image
+                filename = image.image.name
+            else:
+                try:
+                    out_image = image.get_rendition((width, height), webp=webp)
+                    filename = "%s-%dx%d%s" % (
+                        image.image.name, width, height, os.path.splitext(out_image.name)[1]
+                    )
+                except:
+                    return HttpResponseBadRequest()
 
-        # FIXME: Use SendFile headers instead of Django output when not in debug mode
-        out_image.seek(0)
-        resp = FileResponse(out_image, content_type=guess_type(filename, False)[0])
-        resp["Content-Disposition"] = "attachment; filename=%s" % os.path.basename(filename)
+            # FIXME: Use SendFile headers instead of Django output when not in debug mode
+            out_image.seek(0)
+            content_type = 'image/webp' if filename.endswith('.webp') else guess_type(filename, False)[0]
+            resp = FileResponse(out_image, content_type=content_type)
+            resp["Content-Disposition"] = "attachment; filename=%s" % os.path.basename(filename)
+        resp['ETag'] = etag
+        resp['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(resp, public=True, max_age=settings.RESPA_IMAGE_CACHE_MAX_AGE)
+        if dim:
+            patch_vary_headers(resp, ('Accept',))
         return resp
@@ -39,6 +39,9 @@ env = environ.Env(
     MAIL_MAILGUN_API=(str, ''),
     USE_DJANGO_DEFAULT_EMAIL=(bool, False),
     RESPA_IMAGE_BASE_URL=(str, ''),
+    RESPA_IMAGE_QUEUE_ENABLED=(bool, False),
+    RESPA_IMAGE_RENDITION_SIZES=(list, ['150x150', '300x200', '600x400', '1200x800']),
+    RESPA_IMAGE_CACHE_MAX_AGE=(int, 7 * 24 * 60 * 60),
     ACCESSIBILITY_API_BASE_URL=(str, 'https://asiointi.hel.fi/kapaesteettomyys/'),
     ACCESSIBILITY_API_SYSTEM_ID=(str, ''),
     ACCESSIBILITY_API_SECRET=(str, ''),
@@ -50,6 +53,12 @@ env = environ.Env(
     RESPA_ADMIN_LOGO=(str, ''),
     RESPA_ADMIN_KORO_STYLE=(str, ''),
     RESPA_PAYMENTS_ENABLED=(bool, False),
+    RESPA_RESERVATION_BULK_MAX_SIZE=(int, 100),
+    RESPA_PERMISSION_CACHE_TIMEOUT=(int, 0),
+    RESPA_NOTIFICATION_OUTBOX_ENABLED=(bool, False),
+    RESPA_ICAL_FEED_DAYS=(int, 365),
+    RESPA_NOTIFICATION_MAX_ATTEMPTS=(int, 5),
+    RESPA_NOTIFICATION_RETRY_DELAY=(int, 60),
     RESPA_PAYMENTS_PROVIDER_CLASS=(str, ''),
     RESPA_PAYMENTS_PAYMENT_WAITING_TIME=(int, 15),
     RESPA_PAYMENTS_PAYMENT_REQUESTED_WAITING_TIME=(int, 24),
@@ -109,12 +118,21 @@ env = environ.Env(
     QUALITYTOOL_SFTP_HOST=(str, ''),
     QUALITYTOOL_SFTP_PORT=(int, 22),
     QUALITYTOOL_SFTP_USERNAME=(str, ''),
-    QUALITYTOOL_SFTP_PASSWORD=(str, '')
+    QUALITYTOOL_SFTP_PASSWORD=(str, ''),
+    TEST_PERFORMANCE=(bool, False),
+    TEST_PERFORMANCE_REPORT=(str, 'perf_report.json'),
+    TEST_PERFORMANCE_BASELINE=(str, ''),
 )
 environ.Env.read_env()
 # used for generating links to images, when no request context is available
 # reservation confirmation emails use this
 RESPA_IMAGE_BASE_URL = env('RESPA_IMAGE_BASE_URL')
+# process uploaded resource images with the process_resource_images command instead of when saving them
+RESPA_IMAGE_QUEUE_ENABLED = env('RESPA_IMAGE_QUEUE_ENABLED')
+# "<width>x<height>" sizes of the renditions generated of resource images, requested sizes snap to these
+RESPA_IMAGE_RENDITION_SIZES = env('RESPA_IMAGE_RENDITION_SIZES')
+# seconds browsers may cache resource images before checking their ETags
+RESPA_IMAGE_CACHE_MAX_AGE = env('RESPA_IMAGE_CACHE_MAX_AGE')
 BASE_DIR = root()
 DEBUG_TOOLBAR_CONFIG = {
     'RESULTS_CACHE_SIZE': 100,
@@ -302,7 +320,10 @@ TEMPLATES = [
 WSGI_APPLICATION = 'respa.wsgi.application'
 
 TEST_RUNNER = 'respa.test_runner.PyTestShimRunner'
-TEST_PERFORMANCE = False
+TEST_PERFORMANCE = env('TEST_PERFORMANCE')
+# API benchmark report and the previous report to compare the latencies against
+TEST_PERFORMANCE_REPORT = env('TEST_PERFORMANCE_REPORT')
+TEST_PERFORMANCE_BASELINE = env('TEST_PERFORMANCE_BASELINE')
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -470,6 +491,17 @@ RESPA_MAILS_FROM_ADDRESS = env('MAIL_DEFAULT_FROM')
 RESPA_CATERINGS_ENABLED = False
 RESPA_COMMENTS_ENABLED = False
 RESPA_DOCX_TEMPLATE = os.path.join(BASE_DIR, 'reports', 'data', 'default.docx')
+# maximum number of reservations in one recurring reservation
+RESPA_RESERVATION_BULK_MAX_SIZE = env('RESPA_RESERVATION_BULK_MAX_SIZE')
+# seconds to cache the unit and resource group permissions of users across requests, 0 disables
+RESPA_PERMISSION_CACHE_TIMEOUT = env('RESPA_PERMISSION_CACHE_TIMEOUT')
+# queue reservation notifications to be sent by the send_notifications command
+RESPA_NOTIFICATION_OUTBOX_ENABLED = env('RESPA_NOTIFICATION_OUTBOX_ENABLED')
+# times a queued notification is tried before it is left failed, and seconds before the first retry
+RESPA_NOTIFICATION_MAX_ATTEMPTS = env('RESPA_NOTIFICATION_MAX_ATTEMPTS')
+RESPA_NOTIFICATION_RETRY_DELAY = env('RESPA_NOTIFICATION_RETRY_DELAY')
+# how many days ahead the reservations of the users' iCal feeds reach
+RESPA_ICAL_FEED_DAYS = env('RESPA_ICAL_FEED_DAYS')
 
 RESPA_ACCESSIBILITY_API_BASE_URL = env('ACCESSIBILITY_API_BASE_URL')
 RESPA_ACCESSIBILITY_API_SYSTEM_ID = env('ACCESSIBILITY_API_SYSTEM_ID')
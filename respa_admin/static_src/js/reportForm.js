@@ -57,10 +57,10 @@ function setDefaultDate() {
     $("#begin-date").attr('value', date.toISOString().substr(0, 10));
 }
 
-function buildUrl(resources, start, end, selectedDays, page_size = 50000, format = 'xlsx') {
-    return `${window.location.origin}/v1/reservation/` +
+function buildUrl(resources, start, end, selectedDays, format = 'xlsx') {
+    return `${window.location.origin}/v1/reservation/export/` +
         `?format=${format}&resource=${resources.join()}` +
-        `&start=${start}&end=${end}&page_size=${page_size}` +
+        `&start=${start}&end=${end}` +
         `&weekdays=${selectedDays.join()}&state=confirmed&include_block_reservations=1`;
 }
 
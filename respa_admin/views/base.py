@@ -3,6 +3,7 @@ from django.core import exceptions
 from django.contrib.staticfiles.storage import staticfiles_storage
 from resources.auth import is_any_admin, is_any_manager
 from resources.models import Day, Period
+from resources.models.availability import get_changed_dates, get_periods_state
 from respa_admin.forms import get_period_formset
 
 
@@ -43,12 +44,23 @@ class PeriodMixin():
             parent_class=self.model,
         )
 
-    def save_period_formset(self, period_formset):
+    def save_period_formset(self, period_formset, only_changed_dates=False):
+        """
+        Save the periods and update the opening hours. With `only_changed_dates`
+        the opening hours are recalculated only for the dates of the periods that
+        were changed.
+        """
         try:
+            periods_state = get_periods_state(self.object.periods.all())
             self._delete_extra_periods_days(period_formset)
             period_formset.instance = self.object
             period_formset.save()
-            self.object.update_opening_hours()
+            if not only_changed_dates:
+                self.object.update_opening_hours()
+                return
+            changed_dates = get_changed_dates(periods_state, get_periods_state(self.object.periods.all()))
+            if changed_dates:
+                self.object.update_opening_hours(*changed_dates)
         except exceptions.ValidationError as exc:
             period_formset.errors.extend(exc.messages)
             raise
@@ -555,7 +555,9 @@ class SaveResourceView(ExtraContextMixin, PeriodMixin, CreateView):
         if not df_set or \
             (df_set and 'periods' not in df_set) or \
             (df_set and 'periods' in df_set and not is_edit):
-                self.save_period_formset(period_formset_with_days)
+                self.save_period_formset(
+                    period_formset_with_days, only_changed_dates=is_edit and 'unit' not in form.changed_data
+                )
         if not df_set or \
             (df_set and 'publish_date' not in df_set) or \
             (df_set and 'publish_date' in df_set and not is_edit):
@@ -132,7 +132,7 @@ class UnitEditView(ExtraContextMixin, PeriodMixin, CreateView):
 
         try:
             self.object = form.save()
-            self.save_period_formset(period_formset_with_days)
+            self.save_period_formset(period_formset_with_days, only_changed_dates=not is_creating_new)
 
             if is_creating_new:
                 UnitAuthorization.objects.create(
@@ -6,15 +6,18 @@ import logging
 import iso8601
 
 from lxml import etree
+from django.db.models.functions import Upper
+from django.db.models.signals import post_save
 from django.db.transaction import atomic
 from django.utils.timezone import now
 
 from sentry_sdk import configure_scope, push_scope, capture_message
 
 from resources.models.reservation import Reservation
-from respa_exchange.ews.calendar import GetCalendarItemsRequest, FindCalendarItemsRequest
+from respa_exchange.ews.calendar import GetCalendarItemsRequest, FindCalendarItemsRequest, SyncCalendarItemsRequest
 from respa_exchange.ews.user import ResolveNamesRequest
 from respa_exchange.ews.objs import ItemID
+from respa_exchange.ews.session import SoapFault
 from respa_exchange.ews.xml import NAMESPACES
 from respa_exchange.models import ExchangeReservation, ExchangeUser, \
     ExchangeUserX500Address, ExchangeResource
@@ -70,86 +73,231 @@ def _populate_reservation(reservation, ex_resource, item_props, ex_reservation=N
     reservation.comments = comment_text
 
 
-def _update_reservation_from_exchange(item_id, ex_reservation, ex_resource, item_props):
-    reservation = ex_reservation.reservation
-    _populate_reservation(reservation, ex_resource, item_props, ex_reservation)
-    reservation.save()
-    ex_reservation.item_id = item_id
-    if not ex_reservation.managed_in_exchange:
-        ex_reservation.organizer = item_props.get("organizer")
-    ex_reservation.save()
+# Rows per query when saving reservations in bulk
+BULK_BATCH_SIZE = 500
 
-    log.info("Updated: %s", ex_reservation)
 
+def _update_reservations_from_exchange(ex_resource, items):
+    """
+    Update the reservations of changed calendar items in bulk
+
+    Returns the times of the reservations before the update.
 
-def _create_reservation_from_exchange(item_id, ex_resource, item_props):
-    reservation = Reservation(resource=ex_resource.resource)
-    _populate_reservation(reservation, ex_resource, item_props)
-    reservation.save()
-    ex_reservation = ExchangeReservation(
-        exchange=ex_resource.exchange,
-        principal_email=ex_resource.principal_email,
-        reservation=reservation,
-        managed_in_exchange=True,
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :type items: list[tuple[respa_exchange.ews.objs.ItemID, respa_exchange.models.ExchangeReservation, dict]]
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    """
+    modified_at = now()
+    previous_times = []
+    for item_id, ex_reservation, item_props in items:
+        reservation = ex_reservation.reservation
+        previous_times.append((reservation.begin, reservation.end))
+        _populate_reservation(reservation, ex_resource, item_props, ex_reservation)
+        # The times come from Exchange unvalidated, so leave the reservation
+        # out of the collision constraints.
+        reservation.enforced_cooldown = None
+        reservation.set_computed_fields()
+        reservation.modified_at = modified_at
+        ex_reservation.item_id = item_id
+        if not ex_reservation.managed_in_exchange:
+            ex_reservation.organizer = item_props.get("organizer")
+
+    Reservation.objects.bulk_update(
+        [ex_reservation.reservation for _, ex_reservation, _ in items],
+        ['begin', 'end', 'duration', 'enforced_cooldown', 'cooldown_duration', 'access_code', 'event_subject',
+         'reserver_name', 'reserver_email_address', 'host_name', 'comments', 'modified_at'],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    ExchangeReservation.objects.bulk_update(
+        [ex_reservation for _, ex_reservation, _ in items],
+        ['_item_id', '_change_key', 'item_id_hash', 'organizer'],
+        batch_size=BULK_BATCH_SIZE,
     )
-    ex_reservation.item_id = item_id
-    ex_reservation.organizer = item_props.get("organizer")
-    ex_reservation.save()
+    for _, ex_reservation, _ in items:
+        log.info("Updated: %s", ex_reservation)
+    return previous_times
 
-    log.info("Created: %s", ex_reservation)
-    return ex_reservation
 
+def _create_reservations_from_exchange(ex_resource, items):
+    """
+    Create the reservations of new calendar items in bulk
 
-def _find_exchange_user_by_mailbox(ex_resource, mailbox, last_updated_at=None):
-    """Try to find the ExchangeUser entry matching the organizer XML element
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :type items: list[tuple[respa_exchange.ews.objs.ItemID, dict]]
+    :rtype: list[resources.models.Reservation]
+    """
+    reservations = []
+    ex_reservations = []
+    for item_id, item_props in items:
+        reservation = Reservation(resource=ex_resource.resource)
+        _populate_reservation(reservation, ex_resource, item_props)
+        reservation.set_computed_fields()
+        ex_reservation = ExchangeReservation(
+            exchange=ex_resource.exchange,
+            principal_email=ex_resource.principal_email,
+            managed_in_exchange=True,
+            organizer=item_props.get("organizer"),
+        )
+        ex_reservation.item_id = item_id
+        reservations.append(reservation)
+        ex_reservations.append(ex_reservation)
 
-    Matching is attempted based on the organizer's email address and
-    their X500 addresses. If a match can't be found, a ResolveNamesRequest
-    is sent and the ExchangeUser model is updated based on the response.
+    Reservation.objects.bulk_create(reservations, batch_size=BULK_BATCH_SIZE)
+    # The reservations have primary keys only now
+    for reservation, ex_reservation in zip(reservations, ex_reservations):
+        ex_reservation.reservation = reservation
+    ExchangeReservation.objects.bulk_create(ex_reservations, batch_size=BULK_BATCH_SIZE)
+    for ex_reservation in ex_reservations:
+        log.info("Created: %s", ex_reservation)
+    return reservations
+
+
+def _send_reservations_saved(resource, created, updated, previous_times):
+    """
+    Update the free intervals of the resource and send post_save for
+    reservations saved in bulk
+
+    bulk_create and bulk_update send no signals, and the other calendar
+    integrations listen to post_save.
+
+    :type resource: resources.models.Resource
+    :type created: list[resources.models.Reservation]
+    :type updated: list[resources.models.Reservation]
+    :type previous_times: list[tuple[datetime.datetime, datetime.datetime]]
     """
+    times = previous_times + [(reservation.begin, reservation.end) for reservation in created + updated]
+    if not times:
+        return
+    resource.update_free_intervals(min(begin for begin, _ in times), max(end for _, end in times))
+    for reservations, is_created in ((created, True), (updated, False)):
+        for reservation in reservations:
+            reservation._free_intervals_updated = True
+            post_save.send(sender=Reservation, instance=reservation, created=is_created,
+                           update_fields=None, raw=False, using=reservation._state.db)
+
+
+def _get_mailbox_key(mailbox):
+    """
+    Return the routing type, the identifier and the name of a mailbox element
+
+    SMTP addresses are lowercased and X500 addresses uppercased, as they are
+    stored.
 
+    :rtype: tuple[str, str, str|None]
+    """
     routing_type = mailbox.find("t:RoutingType", namespaces=NAMESPACES).text
     user_identifier = mailbox.find("t:EmailAddress", namespaces=NAMESPACES).text
     user_name = mailbox.find("t:Name", namespaces=NAMESPACES)
     if user_name is not None:
         user_name = user_name.text
     if routing_type == "SMTP":
-        id_search_field = 'email_address'
         user_identifier = user_identifier.lower()
     elif routing_type == "EX":
-        id_search_field = 'x500_addresses__address__iexact'
-    else:
-        with push_scope() as scope:
-            scope.level = 'warning'
-            scope.set_extra('mailbox', element_to_string(mailbox))
-            capture_message('Unknown mailbox routing type')
-        return None
+        user_identifier = user_identifier.upper()
+    return routing_type, user_identifier, user_name
 
-    search_args = {id_search_field: user_identifier, 'exchange': ex_resource.exchange}
-    try:
-        ex_user = ExchangeUser.objects.get(**search_args)
-    except ExchangeUser.DoesNotExist:
-        ex_user = None
-
-    # If the user name remains the same, all other info is probably okay as well.
-    # If not, we might need to refresh the user info from EWS.
-    if ex_user is not None:
-        if user_name == ex_user.name:
-            return ex_user
-
-        # If the user name does not match, but we have updated
-        # the user info after the calendar item was created,
-        # everything is fine.
-        if last_updated_at and ex_user.updated_at:
-            if ex_user.updated_at > last_updated_at:
-                return ex_user
 
+class ExchangeUserCache:
+    """
+    Find the ExchangeUser entries matching the mailboxes of calendar items
+
+    The users of a batch of mailboxes are fetched with `prefetch`, and each
+    distinct mailbox is resolved with a ResolveNamesRequest at most once.
+    A cache lives for one sync.
+    """
+
+    def __init__(self, ex_resource):
+        self.ex_resource = ex_resource
+        self._by_email = {}
+        self._by_x500_address = {}
+        self._found = {}
+
+    def prefetch(self, mailboxes):
+        """
+        Fetch the users of the mailboxes not seen before with one query per routing type
+
+        :type mailboxes: iterable[lxml.etree.Element]
+        """
+        emails = set()
+        x500_addresses = set()
+        for mailbox in mailboxes:
+            routing_type, user_identifier, _ = _get_mailbox_key(mailbox)
+            if routing_type == "SMTP" and user_identifier not in self._by_email:
+                emails.add(user_identifier)
+            elif routing_type == "EX" and user_identifier not in self._by_x500_address:
+                x500_addresses.add(user_identifier)
+
+        exchange = self.ex_resource.exchange
+        if emails:
+            self._by_email.update(dict.fromkeys(emails))
+            for ex_user in ExchangeUser.objects.filter(exchange=exchange, email_address__in=emails):
+                self._by_email[ex_user.email_address] = ex_user
+        if x500_addresses:
+            self._by_x500_address.update(dict.fromkeys(x500_addresses))
+            found = ExchangeUserX500Address.objects.select_related('user') \
+                .annotate(upper_address=Upper('address')) \
+                .filter(exchange=exchange, upper_address__in=x500_addresses)
+            for x500_address in found:
+                self._by_x500_address[x500_address.upper_address] = x500_address.user
+
+    def get(self, mailbox, last_updated_at=None):
+        """
+        Find the ExchangeUser entry matching the mailbox XML element
+
+        Matching is attempted based on the email address or the X500
+        address of the mailbox. If a match can't be found, or its name
+        differs, a ResolveNamesRequest is sent and the ExchangeUser model is
+        updated based on the response.
+
+        :rtype: respa_exchange.models.ExchangeUser|None
+        """
+        key = _get_mailbox_key(mailbox)
+        if key in self._found:
+            return self._found[key]
+        routing_type, user_identifier, user_name = key
+        if routing_type not in ("SMTP", "EX"):
+            with push_scope() as scope:
+                scope.level = 'warning'
+                scope.set_extra('mailbox', element_to_string(mailbox))
+                capture_message('Unknown mailbox routing type')
+            return None
+
+        self.prefetch([mailbox])
+        if routing_type == "SMTP":
+            ex_user = self._by_email[user_identifier]
+        else:
+            ex_user = self._by_x500_address[user_identifier]
+
+        # If the user name remains the same, all other info is probably okay as well.
+        # If not, we might need to refresh the user info from EWS, unless
+        # we have updated the user info after the calendar item was created.
+        if ex_user is None or (user_name != ex_user.name and not (
+            last_updated_at and ex_user.updated_at and ex_user.updated_at > last_updated_at
+        )):
+            ex_user, x500_addresses = _resolve_exchange_user(self.ex_resource, routing_type, user_identifier, ex_user)
+            if ex_user is not None:
+                self._by_email[ex_user.email_address] = ex_user
+                self._by_x500_address.update(dict.fromkeys(x500_addresses, ex_user))
+
+        self._found[key] = ex_user
+        return ex_user
+
+
+def _resolve_exchange_user(ex_resource, routing_type, user_identifier, ex_user=None):
+    """
+    Update or create the ExchangeUser of an address with a ResolveNamesRequest
+
+    Returns the user and its X500 addresses, or None and an empty list if
+    the address can't be resolved.
+
+    :rtype: tuple[respa_exchange.models.ExchangeUser|None, list[str]]
+    """
     req = ResolveNamesRequest([user_identifier], principal=ex_resource.principal_email)
     resolutions = req.send(ex_resource.exchange.get_ews_session())
 
     x500_addresses = []
     if routing_type == 'EX':
-        x500_addresses.append(user_identifier.upper())
+        x500_addresses.append(user_identifier)
 
     for res in resolutions:
         mb = res.find("t:Mailbox", namespaces=NAMESPACES)
@@ -167,7 +315,7 @@ def _find_exchange_user_by_mailbox(ex_resource, mailbox, last_updated_at=None):
         contact = res.find("t:Contact", namespaces=NAMESPACES)
         if routing_type != "SMTP" or email is None or contact is None:
             log.error("Invalid response to ResolveNamesRequest (%s)" % user_identifier)
-            return None
+            return None, []
 
         for x in contact.xpath('t:EmailAddresses/t:Entry', namespaces=NAMESPACES):
             text = x.text.upper()
@@ -185,7 +333,7 @@ def _find_exchange_user_by_mailbox(ex_resource, mailbox, last_updated_at=None):
         props['name'] = user_name
         break
     else:
-        return None
+        return None, []
 
     # Try to find exuser again based on x500_addresses
     if ex_user is None and x500_addresses:
@@ -213,28 +361,30 @@ def _find_exchange_user_by_mailbox(ex_resource, mailbox, last_updated_at=None):
 
     existing_x500_addresses = set([x.upper() for x in ex_user.x500_addresses.values_list('address', flat=True)])
     new_x500_addresses = set(x500_addresses) - existing_x500_addresses
-    for addr in new_x500_addresses:
-        ExchangeUserX500Address.objects.create(
-            exchange=ex_resource.exchange,
-            user=ex_user,
-            address=addr
-        )
+    ExchangeUserX500Address.objects.bulk_create([
+        ExchangeUserX500Address(exchange=ex_resource.exchange, user=ex_user, address=addr)
+        for addr in new_x500_addresses
+    ])
 
-    return ex_user
+    return ex_user, x500_addresses
 
 
-def _determine_organizer(ex_resource, calendar_item):
+# The mailboxes _determine_organizer may look up
+ORGANIZER_MAILBOX_XPATH = 't:Organizer/t:Mailbox | t:RequiredAttendees/t:Attendee[1]/t:Mailbox'
+
+
+def _determine_organizer(users, calendar_item):
     item_updated_at = calendar_item.get('updated_at')
     organizer = calendar_item.find('t:Organizer', namespaces=NAMESPACES)
     if organizer is None:
         return None
 
     mailbox = organizer.find('t:Mailbox', namespaces=NAMESPACES)
-    ex_user = _find_exchange_user_by_mailbox(ex_resource, mailbox, item_updated_at)
+    ex_user = users.get(mailbox, item_updated_at)
     if ex_user is None:
         return None
 
-    if ex_user.email_address.lower() == ex_resource.principal_email.lower():
+    if ex_user.email_address.lower() == users.ex_resource.principal_email.lower():
         # Sometimes the reservation appears to be made by the resource
         # itself. We do a bit of heuristics to try to determine the actual
         # organizer.
@@ -245,12 +395,12 @@ def _determine_organizer(ex_resource, calendar_item):
         if first_attendee is None:
             return None
         mailbox = first_attendee.find('t:Mailbox', namespaces=NAMESPACES)
-        ex_user = _find_exchange_user_by_mailbox(ex_resource, mailbox, item_updated_at)
+        ex_user = users.get(mailbox, item_updated_at)
 
     return ex_user
 
 
-def _parse_item_props(ex_resource, item):
+def _parse_item_props(users, item):
     item_props = dict(
         start=iso8601.parse_date(item.find('t:Start', namespaces=NAMESPACES).text),
         end=iso8601.parse_date(item.find('t:End', namespaces=NAMESPACES).text),
@@ -263,7 +413,7 @@ def _parse_item_props(ex_resource, item):
         if el.text:
             item_props['updated_at'] = iso8601.parse_date(el.text)
 
-    organizer = _determine_organizer(ex_resource, item)
+    organizer = _determine_organizer(users, item)
     if organizer is None:
         # The DisplayTo field appears to usually (?) contain the
         # name of the reserver.
@@ -303,34 +453,13 @@ def fetch_reservation_data(ex_reservation):
     return items[0]
 
 
-@atomic
-def sync_from_exchange(ex_resource, future_days=365, no_op=False):
+def fetch_calendar_items(ex_resource, start_date, end_date):
     """
-    Synchronize from Exchange to Respa
+    Fetch the calendar items of an Exchange resource between the given dates
 
-    Synchronizes current and future events for the given Exchange resource into
-    the relevant Respa resource as reservations.
-
-    :param ex_resource: The Exchange resource to sync
     :type ex_resource: respa_exchange.models.ExchangeResource
-    :param future_days: How many days into the future to look
-    :type future_days: int
-    :param no_op: If True, do not save the reservations
-    :type no_op: bool
+    :rtype: dict[respa_exchange.ews.objs.ItemID, lxml.etree.Element]
     """
-
-    # To avoid race conditions with the Respa API processes, we lock the
-    # resource on database level before starting sync.
-    ex_resource = ExchangeResource.objects.select_for_update().get(id=ex_resource.id)
-
-    if not ex_resource.sync_to_respa and not no_op:
-        return
-    start_date = now().replace(hour=0, minute=0, second=0)
-    end_date = start_date + datetime.timedelta(days=future_days)
-
-    with configure_scope() as scope:
-        scope.set_extra('resource', str(ex_resource))
-
     log.info(
         "%s: Requesting items between (%s..%s)",
         ex_resource.principal_email,
@@ -347,59 +476,278 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
     for item in gcir.send(session):
         calendar_items[ItemID.from_tree(item)] = item
 
-    hashes = set(item_id.hash for item_id in calendar_items.keys())
-
     log.info(
         "%s: Received %d items",
         ex_resource.principal_email,
         len(calendar_items)
     )
+    return calendar_items
+
+
+def fetch_calendar_changes(ex_resource, sync_state, id_only=False):
+    """
+    Fetch the changes to the calendar of an Exchange resource since the sync state
+
+    Returns the new sync state, the created and updated calendar items and
+    the hashes of the item IDs of the deleted items.
+
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :type sync_state: str|None
+    :rtype: tuple[str, dict[respa_exchange.ews.objs.ItemID, lxml.etree.Element], set[str]]
+    """
+    session = ex_resource.exchange.get_ews_session()
+    changed = {}
+    deleted = set()
+    while True:
+        request = SyncCalendarItemsRequest(
+            principal=ex_resource.principal_email, sync_state=sync_state, id_only=id_only
+        )
+        sync_state, includes_last_item, changes = request.send(session)
+        for change, item in changes:
+            if change == "delete":
+                changed.pop(item.hash, None)
+                deleted.add(item.hash)
+            else:
+                item_id = ItemID.from_tree(item)
+                deleted.discard(item_id.hash)
+                changed[item_id.hash] = (item_id, item)
+        if includes_last_item:
+            break
+
+    log.info(
+        "%s: Received %d changed and %d deleted items",
+        ex_resource.principal_email,
+        len(changed),
+        len(deleted)
+    )
+    return sync_state, dict(changed.values()), deleted
+
+
+def _parse_calendar_item(users, item):
+    with configure_scope() as scope:
+        # Send the raw XML to Sentry for better debugging
+        scope.set_extra('item_xml', element_to_string(item))
+    return _parse_item_props(users, item)
+
+
+def _parse_changed_items(users, calendar_items):
+    """
+    Parse the calendar items that are new or have changed since they were saved
+
+    The organizers of all the items are looked up in one go first.
+
+    :type users: ExchangeUserCache
+    :rtype: dict[respa_exchange.ews.objs.ItemID, dict]
+    """
+    change_keys = dict(
+        ExchangeReservation.objects.filter(item_id_hash__in=[item_id.hash for item_id in calendar_items])
+        .values_list('item_id_hash', '_change_key')
+    )
+    changed_items = {
+        item_id: item for item_id, item in calendar_items.items()
+        if change_keys.get(item_id.hash) != item_id.change_key
+    }
+    users.prefetch(
+        mailbox for item in changed_items.values()
+        for mailbox in item.xpath(ORGANIZER_MAILBOX_XPATH, namespaces=NAMESPACES)
+    )
+    return {item_id: _parse_calendar_item(users, item) for item_id, item in changed_items.items()}
+
+
+# Time passing moves calendar items into the synced range without them
+# changing, so they are found only by fetching the whole range again.
+FULL_SYNC_INTERVAL = datetime.timedelta(hours=24)
+
+
+def sync_from_exchange(ex_resource, future_days=365, no_op=False, full=False):
+    """
+    Synchronize from Exchange to Respa
+
+    Synchronizes current and future events for the given Exchange resource into
+    the relevant Respa resource as reservations.
+
+    Only the items changed since the previous sync are fetched, unless the
+    whole range has not been fetched in FULL_SYNC_INTERVAL, the changes
+    include recurring items or Exchange no longer accepts the sync state.
+    The items are fetched from Exchange, and the new and changed ones parsed,
+    before the resource is locked, so that a slow Exchange server does not
+    keep Respa from reserving the resource.
+
+    :param ex_resource: The Exchange resource to sync
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :param future_days: How many days into the future to look
+    :type future_days: int
+    :param no_op: If True, do not save the reservations
+    :type no_op: bool
+    :param full: If True, fetch all the items in the range
+    :type full: bool
+    """
+    state = ExchangeResource.objects.filter(id=ex_resource.id, sync_to_respa=True) \
+        .values('sync_state', 'full_sync_at').first()
+    if state is None and not no_op:
+        return
+    start_date = now().replace(hour=0, minute=0, second=0)
+    end_date = start_date + datetime.timedelta(days=future_days)
+
+    with configure_scope() as scope:
+        scope.set_extra('resource', str(ex_resource))
 
     if no_op:
+        fetch_calendar_items(ex_resource, start_date, end_date)
         with configure_scope() as scope:
             scope.remove_extra('resource')
         return
 
+    synced = False
+    if not full and state['sync_state'] and state['full_sync_at'] and \
+            state['full_sync_at'] > now() - FULL_SYNC_INTERVAL:
+        try:
+            synced = _sync_changes_from_exchange(ex_resource, state['sync_state'], start_date, end_date)
+        except SoapFault as fault:
+            log.warning("%s: Syncing the changes failed (%s), syncing all items", ex_resource.principal_email, fault)
+    if not synced:
+        _sync_all_from_exchange(ex_resource, start_date, end_date)
+
+    with configure_scope() as scope:
+        scope.remove_extra('item_xml')
+        scope.remove_extra('resource')
+
+    log.info("%s: download processing complete", ex_resource.principal_email)
+
+
+def _sync_all_from_exchange(ex_resource, start_date, end_date):
+    # The sync state is taken before the items, so that the next sync
+    # sees any change made in between.
+    try:
+        sync_state, _, _ = fetch_calendar_changes(ex_resource, None, id_only=True)
+    except SoapFault as fault:
+        log.warning("%s: Getting the sync state failed (%s)", ex_resource.principal_email, fault)
+        sync_state = ''
+    synced_at = now()
+
+    calendar_items = fetch_calendar_items(ex_resource, start_date, end_date)
+    users = ExchangeUserCache(ex_resource)
+    item_props = _parse_changed_items(users, calendar_items)
+    _save_calendar_items(
+        ex_resource, start_date, end_date, calendar_items, item_props, users,
+        sync_state=sync_state, full_sync_at=synced_at,
+    )
+
+
+def _sync_changes_from_exchange(ex_resource, sync_state, start_date, end_date):
+    """
+    Sync the items changed since the sync state
+
+    Returns False if the changes can't be synced incrementally.
+
+    :rtype: bool
+    """
+    sync_state, changed_items, deleted_hashes = fetch_calendar_changes(ex_resource, sync_state)
+
+    # A deleted recurring series is reported by the ID of its master item,
+    # but the reservations are stored by the IDs of its occurrences
+    known_hashes = set(ExchangeReservation.objects.filter(
+        item_id_hash__in=deleted_hashes,
+        reservation__resource__exchange_resource=ex_resource,
+    ).values_list('item_id_hash', flat=True))
+    if known_hashes != deleted_hashes:
+        log.info("%s: Unknown items deleted", ex_resource.principal_email)
+        return False
+
+    calendar_items = {}
+    for item_id, item in changed_items.items():
+        # The occurrences of recurring items are listed only by the full fetch
+        if item.findtext('t:CalendarItemType', namespaces=NAMESPACES) not in (None, 'Single'):
+            log.info("%s: Recurring items changed", ex_resource.principal_email)
+            return False
+        begin = iso8601.parse_date(item.findtext('t:Start', namespaces=NAMESPACES))
+        end = iso8601.parse_date(item.findtext('t:End', namespaces=NAMESPACES))
+        if begin < end_date and end > start_date:
+            calendar_items[item_id] = item
+        else:
+            deleted_hashes.add(item_id.hash)
+
+    users = ExchangeUserCache(ex_resource)
+    item_props = _parse_changed_items(users, calendar_items)
+    _save_calendar_items(
+        ex_resource, start_date, end_date, calendar_items, item_props, users,
+        deleted_hashes=deleted_hashes, sync_state=sync_state,
+    )
+    return True
+
+
+@atomic
+def _save_calendar_items(ex_resource, start_date, end_date, calendar_items, item_props, users,
+                         deleted_hashes=None, **sync_fields):
+    """
+    Update the reservations of the resource to match the calendar items
+
+    :type calendar_items: dict[respa_exchange.ews.objs.ItemID, lxml.etree.Element]
+    :param item_props: the parsed properties of the items that were new or
+                       changed when they were fetched
+    :type item_props: dict[respa_exchange.ews.objs.ItemID, dict]
+    :param users: the organizer lookup the items were parsed with
+    :type users: ExchangeUserCache
+    :param deleted_hashes: the item ID hashes of the deleted items, or None
+                           if the calendar items are all the items in the range
+    :type deleted_hashes: set[str]|None
+    :param sync_fields: the sync state fields of the resource to update
+    """
+    # To avoid race conditions with the Respa API processes, we lock the
+    # resource on database level before changing its reservations.
+    locked = ExchangeResource.objects.select_for_update().filter(id=ex_resource.id, sync_to_respa=True)
+    if not locked.exists():
+        return
+
+    hashes = set(item_id.hash for item_id in calendar_items.keys())
+
     # First handle deletions . . .
-    items_to_delete = ExchangeReservation.objects.select_related("reservation").filter(
+    items_to_delete = ExchangeReservation.objects.filter(
         managed_in_exchange=True,  # Reservations we've downloaded ...
         reservation__begin__gte=start_date,  # that are in ...
-        reservation__end__lte=end_date,  # ... our get items range ...
         reservation__resource__exchange_resource=ex_resource,  # and belong to this resource,
-    ).exclude(item_id_hash__in=hashes)  # but aren't ones we're going to mangle
-
-    for ex_reservation in items_to_delete:
-        log.info("Deleting: %s", ex_reservation)
-        reservation = ex_reservation.reservation
-        ex_reservation.delete()
-        reservation.delete()
+    )
+    if deleted_hashes is None:
+        items_to_delete = items_to_delete.filter(
+            reservation__end__lte=end_date,  # ... our get items range ...
+        ).exclude(item_id_hash__in=hashes)  # but aren't ones we're going to mangle
+    else:
+        items_to_delete = items_to_delete.filter(item_id_hash__in=deleted_hashes)
 
-    # And then creations/additions
+    reservation_ids = list(items_to_delete.values_list('reservation', flat=True))
+    if reservation_ids:
+        log.info("%s: Deleting %d reservations", ex_resource.principal_email, len(reservation_ids))
+        ExchangeReservation.objects.filter(reservation__in=reservation_ids).delete()
+        Reservation.objects.filter(id__in=reservation_ids).delete()
 
+    # And then creations/additions, in bulk
     extant_exchange_reservations = {
         ex_reservation.item_id_hash: ex_reservation
         for ex_reservation
         in ExchangeReservation.objects.select_related("reservation").filter(item_id_hash__in=hashes)
     }
 
+    new_items = []
+    changed_items = []
     for item_id, item in calendar_items.items():
-        with configure_scope() as scope:
-            # Send the raw XML to Sentry for better debugging
-            scope.set_extra('item_xml', element_to_string(item))
-
         ex_reservation = extant_exchange_reservations.get(item_id.hash)
+        if ex_reservation and ex_reservation._change_key == item_id.change_key:
+            continue
 
-        item_props = _parse_item_props(ex_resource, item)
+        # The reservation may have changed since the items were parsed
+        props = item_props.get(item_id) or _parse_calendar_item(users, item)
 
         if not ex_reservation:  # It's a new one!
-            ex_reservation = _create_reservation_from_exchange(item_id, ex_resource, item_props)
+            new_items.append((item_id, props))
         else:
-            if ex_reservation._change_key != item_id.change_key:
-                # Things changed, so edit the reservation
-                _update_reservation_from_exchange(item_id, ex_reservation, ex_resource, item_props)
-
-    with configure_scope() as scope:
-        scope.remove_extra('item_xml')
-        scope.remove_extra('resource')
+            # Things changed, so edit the reservation
+            changed_items.append((item_id, ex_reservation, props))
+
+    previous_times = _update_reservations_from_exchange(ex_resource, changed_items)
+    created = _create_reservations_from_exchange(ex_resource, new_items)
+    _send_reservations_saved(
+        ex_resource.resource, created, [ex_reservation.reservation for _, ex_reservation, _ in changed_items],
+        previous_times,
+    )
 
-    log.info("%s: download processing complete", ex_resource.principal_email)
+    locked.update(**sync_fields)
@@ -1,6 +1,7 @@
 from .base import EWSRequest
 from .folders import get_distinguished_folder_id_element
 from .objs import ItemID
+from .session import SoapFault
 from .utils import format_date_for_xml
 from .xml import M, NAMESPACES, T
 
@@ -45,6 +46,63 @@ class FindCalendarItemsRequest(EWSRequest):
         return resp.xpath("//t:CalendarItem", namespaces=NAMESPACES)
 
 
+class SyncCalendarItemsRequest(EWSRequest):
+    """
+    An EWS request to request the changes to a given principal's calendar folder since a sync state.
+    """
+
+    def __init__(self, principal, sync_state=None, id_only=False, max_changes=512):
+        """
+        Initialize the request.
+
+        :param principal: The principal email whose calendar to query.
+        :param sync_state: The sync state returned by an earlier request, or None to get all items
+        :param id_only: If True, return only the item IDs of the changed items
+        :param max_changes: The maximum number of changes to return
+        """
+        body = M.SyncFolderItems(
+            M.ItemShape(
+                T.BaseShape('IdOnly' if id_only else 'AllProperties')
+            ),
+            M.SyncFolderId(get_distinguished_folder_id_element(principal, "calendar")),
+        )
+        if sync_state:
+            body.append(M.SyncState(sync_state))
+        body.append(M.MaxChangesReturned(str(max_changes)))
+        super().__init__(body, impersonation=principal)
+
+    def send(self, sess):
+        """
+        Send the sync request.
+
+        Returns the new sync state, whether all the changes were returned,
+        the CalendarItem XML elements of the created and updated items and
+        the Item IDs of the deleted items, in the order of the changes.
+
+        :type sess: respa_exchange.session.ExchangeSession
+        :rtype: tuple[str, bool, list[tuple[str, lxml.etree.Element|ItemID]]]
+        """
+        resp = sess.soap(self)
+        message = resp.find("*//m:SyncFolderItemsResponseMessage", namespaces=NAMESPACES)
+        if message.attrib["ResponseClass"] != "Success":
+            raise SoapFault(
+                fault_code=message.findtext("m:ResponseCode", namespaces=NAMESPACES),
+                fault_string=message.findtext("m:MessageText", namespaces=NAMESPACES),
+            )
+        changes = []
+        for change in message.iterfind("m:Changes/*", namespaces=NAMESPACES):
+            item = change.find("t:CalendarItem", namespaces=NAMESPACES)
+            if change.tag == "{%s}Delete" % NAMESPACES["t"]:
+                changes.append(("delete", ItemID.from_tree(change)))
+            elif item is not None:
+                changes.append(("update", item))
+        return (
+            message.findtext("m:SyncState", namespaces=NAMESPACES),
+            message.findtext("m:IncludesLastItemInRange", namespaces=NAMESPACES) == "true",
+            changes,
+        )
+
+
 class GetCalendarItemsRequest(EWSRequest):
     """
     An EWS request to request the detailed information about given items.
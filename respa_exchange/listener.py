@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from queue import Empty, Queue
 
 from django.db import connections
@@ -11,7 +12,7 @@ from respa_exchange.ews.notifications import (
 )
 from respa_exchange.ews.session import SoapFault
 from respa_exchange.management.base import get_active_download_resources
-from respa_exchange.models import ExchangeConfiguration
+from respa_exchange.models import ExchangeConfiguration, ExchangeResource
 from respa_exchange.utils.timeout import EventedTimeout
 
 log = logging.getLogger('respa_exchange.listener')
@@ -245,9 +246,20 @@ class NotificationListener(object):
     SUBSCRIPTION_MANAGE_INTERVAL = 180
     DATABASE_RECONNECT_INTERVAL = 1800
 
-    def __init__(self, sync_after_start=False):
+    def __init__(self, sync_after_start=False, sync_workers=1):
+        """
+        :param sync_workers: How many resources are synced from Exchange at the same time
+        :type sync_workers: int
+        """
         exchanges = ExchangeConfiguration.objects.filter(enabled=True)
         self.sync_after_start = sync_after_start
+        self.sync_pool = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix='Sync') \
+            if sync_workers > 1 else None
+        self._sync_lock = threading.Lock()
+        self._worker_state = threading.local()
+        self._syncing = set()  # ids of the resources being synced
+        self._resync = {}  # resources changed while being synced, by id
+        self.sync_durations = {}  # seconds the last sync of each resource took, by principal email
         self.listeners = {ex: ExchangeListener(ex, self.post_event, sync_after_start) for ex in exchanges}
         self.events = Queue()
         self.subscription_manage_timer = EventedTimeout(
@@ -366,14 +378,98 @@ class NotificationListener(object):
             if not event.resource:  # pragma: no cover
                 log.warn('Unable to handle resourceless event %r', event)
                 return
-            # TODO: Maybe process different events in different ways? ->
-            #       Right now, whatever happens we just re-sync everything.
+            # Whatever happened, the sync fetches the changes made since the
+            # previous one.
             changed_resources.add(event.resource)
 
+        if changed_resources:
+            metrics = self.get_sync_metrics()
+            log.info('Syncing %d resources, %d being synced, %d waiting for resync',
+                     len(changed_resources), metrics['syncing'], metrics['waiting'])
         for resource in changed_resources:
-            sync_from_exchange(resource)
+            self.submit_sync(resource)
+
+    def submit_sync(self, resource):
+        """
+        Sync the resource from Exchange, in the worker pool if there is one
+
+        A resource is synced by one worker at a time. If it changes while
+        being synced, it is synced again afterwards, as the running sync
+        may have missed the change.
+
+        :type resource: respa_exchange.models.ExchangeResource
+        """
+        with self._sync_lock:
+            if resource.id in self._syncing:
+                self._resync[resource.id] = resource
+                return
+            self._syncing.add(resource.id)
+        self._start_sync(resource)
+
+    def _start_sync(self, resource):
+        if self.sync_pool:
+            try:
+                self.sync_pool.submit(self._sync_resource, resource, in_worker=True)
+            except RuntimeError:  # the listener is closing
+                with self._sync_lock:
+                    self._syncing.discard(resource.id)
+        else:
+            self._sync_resource(resource)
+
+    def _get_worker_resource(self, resource):
+        """
+        Return a copy of the resource to sync in a worker thread
+
+        The copy uses an Exchange configuration, and so an EWS session, of
+        the worker thread's own.
+        """
+        exchanges = getattr(self._worker_state, 'exchanges', None)
+        if exchanges is None:
+            exchanges = self._worker_state.exchanges = {}
+        if resource.exchange_id not in exchanges:
+            exchanges[resource.exchange_id] = ExchangeConfiguration.objects.get(id=resource.exchange_id)
+        worker_resource = ExchangeResource.objects.get(id=resource.id)
+        worker_resource.exchange = exchanges[resource.exchange_id]
+        return worker_resource
+
+    def _sync_resource(self, resource, in_worker=False):
+        start = time.monotonic()
+        try:
+            sync_from_exchange(self._get_worker_resource(resource) if in_worker else resource)
+        except Exception as e:
+            log.exception('Syncing %s failed' % resource, exc_info=e)
+        finally:
+            if in_worker:
+                # worker threads have database connections of their own
+                connections.close_all()
+            elapsed = time.monotonic() - start
+            self.sync_durations[resource.principal_email] = elapsed
+            log.info('%s: synced in %.2f s', resource.principal_email, elapsed)
+            with self._sync_lock:
+                resync = self._resync.pop(resource.id, None)
+                if resync is None:
+                    self._syncing.discard(resource.id)
+        if resync is not None:
+            self._start_sync(resync)
+
+    def get_sync_metrics(self):
+        """
+        Return the number of queued events and of resources being synced or
+        waiting for a resync, and the latest sync durations of the resources
+
+        :rtype: dict
+        """
+        with self._sync_lock:
+            return {
+                'queued_events': self.events.qsize(),
+                'syncing': len(self._syncing),
+                'waiting': len(self._resync),
+                'durations': dict(self.sync_durations),
+            }
 
     def close(self):
         for listener in self.listeners.values():
             listener.close()
         self.listeners.clear()
+        if self.sync_pool:
+            self.sync_pool.shutdown(wait=True)
@@ -13,6 +13,8 @@ class Command(BaseCommand):
                             help='List supported exchange resources')
         parser.add_argument('--resource', action='append', dest='resources',
                             help='Sync only specified resource(s)')
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='Fetch all the items instead of the changes since the previous sync')
 
     def handle(self, verbosity, *args, **options):
         if verbosity >= 2:
@@ -32,4 +34,4 @@ class Command(BaseCommand):
             resources = select_resources(resources, options['resources'])
 
         for resource in resources:
-            sync_from_exchange(resource)
+            sync_from_exchange(resource, full=options['full'])
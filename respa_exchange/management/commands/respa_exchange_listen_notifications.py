@@ -18,6 +18,8 @@ class Command(BaseCommand):
         parser.add_argument('--daemonize', action='store_true', help='daemonize the listener')
         parser.add_argument('--pid-file', metavar='FILE', help='store the PID in the given file')
         parser.add_argument('--log-file', metavar='FILE', help='write logs to the given file')
+        parser.add_argument('--sync-workers', type=int, default=4,
+                            help='resources synced from Exchange at the same time (default: 4)')
 
     def handle(self, verbosity, *args, **options):
         log_handler = None
@@ -43,7 +45,7 @@ class Command(BaseCommand):
 
             def run_listener():
                 atexit.register(stop_listener)
-                listener = NotificationListener(sync_after_start=True)
+                listener = NotificationListener(sync_after_start=True, sync_workers=options['sync_workers'])
                 listener.start()
 
             def stop_listener():
@@ -59,5 +61,5 @@ class Command(BaseCommand):
                 pid = str(os.getpid())
                 with open(pid_file, 'w') as f:
                     f.write(pid)
-            with closing(NotificationListener()) as listener:
+            with closing(NotificationListener(sync_workers=options['sync_workers'])) as listener:
                 listener.start()
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('respa_exchange', '0010_add_exchange_user_updated_at_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangeresource',
+            name='sync_state',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='exchangeresource',
+            name='full_sync_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
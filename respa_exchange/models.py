@@ -107,6 +107,10 @@ class ExchangeResource(models.Model):
         unique=True,
         help_text=_('the email address for this resource in Exchange')
     )
+    # The EWS SyncFolderItems state of the calendar, for syncing only the
+    # items changed since the last sync
+    sync_state = models.TextField(blank=True, editable=False)
+    full_sync_at = models.DateTimeField(null=True, editable=False)
 
     class Meta:
         verbose_name = _("Exchange resource")
@@ -1,5 +1,7 @@
 from collections import defaultdict
 
+import iso8601
+
 from respa_exchange.ews.utils import format_date_for_xml
 from respa_exchange.ews.xml import M, NAMESPACES, T
 
@@ -67,16 +69,25 @@ class CRUDItemHandlers(object):
 class FindItemsHandler(object):
     def __init__(self):
         self._email_to_props = defaultdict(dict)
+        self._changes = []  # (email, item id) pairs; the sync state is an index to this
+        self._series = defaultdict(dict)  # the occurrence ids of recurring master item ids
+        self.find_item_count = 0
+        self.resolve_names_count = 0
 
     def handle_find_items(self, request):
         if not request.xpath("//m:FindItem", namespaces=NAMESPACES):
             return  # pragma: no cover
+        self.find_item_count += 1
         email_address = request.xpath("//t:EmailAddress", namespaces=NAMESPACES)[0].text
+        view = request.xpath("//m:CalendarView", namespaces=NAMESPACES)[0]
+        start_date = iso8601.parse_date(view.get('StartDate'))
+        end_date = iso8601.parse_date(view.get('EndDate'))
 
         items = [
             self._generate_calendar_item(props)
             for props
             in self._email_to_props.get(email_address, {}).values()
+            if props['start'] < end_date and props['end'] > start_date
         ]
         return M.FindItemResponse(
             M.ResponseMessages(
@@ -94,9 +105,61 @@ class FindItemsHandler(object):
             )
         )
 
+    def handle_sync_folder_items(self, request):
+        if not request.xpath("//m:SyncFolderItems", namespaces=NAMESPACES):
+            return  # pragma: no cover
+        email_address = request.xpath("//t:EmailAddress", namespaces=NAMESPACES)[0].text
+        id_only = request.xpath("//t:BaseShape", namespaces=NAMESPACES)[0].text == 'IdOnly'
+        max_changes = int(request.xpath("//m:MaxChangesReturned", namespaces=NAMESPACES)[0].text)
+        sync_state = request.xpath("//m:SyncState", namespaces=NAMESPACES)
+        sync_state = sync_state[0].text if sync_state else 'state-0'
+        if not sync_state.startswith('state-'):
+            return M.SyncFolderItemsResponse(
+                M.ResponseMessages(
+                    M.SyncFolderItemsResponseMessage(
+                        {'ResponseClass': 'Error'},
+                        M.MessageText('Synchronization state data is corrupt or otherwise invalid.'),
+                        M.ResponseCode('ErrorInvalidSyncStateData'),
+                    )
+                )
+            )
+
+        position = int(sync_state[len('state-'):])
+        changes = []
+        for email, id in self._changes[position:]:
+            if len(changes) == max_changes:
+                break
+            position += 1
+            if email != email_address:
+                continue
+            if id in self._series[email]:
+                # only the master item of a series is synced
+                occurrence_id = self._series[email][id][0]
+                props = dict(self._email_to_props[email][occurrence_id], id=id, type='RecurringMaster')
+            else:
+                props = self._email_to_props[email].get(id)
+            if props is None:
+                changes.append(T.Delete(id.to_xml()))
+            elif id_only:
+                changes.append(T.Update(T.CalendarItem(id.to_xml())))
+            else:
+                changes.append(T.Update(self._generate_calendar_item(props)))
+        return M.SyncFolderItemsResponse(
+            M.ResponseMessages(
+                M.SyncFolderItemsResponseMessage(
+                    {'ResponseClass': 'Success'},
+                    M.ResponseCode('NoError'),
+                    M.SyncState('state-%d' % position),
+                    M.IncludesLastItemInRange('true' if position == len(self._changes) else 'false'),
+                    M.Changes(*changes),
+                )
+            )
+        )
+
     def handle_resolve_names(self, request):
         if not request.xpath("//m:ResolveNames", namespaces=NAMESPACES):
             return  # pragma: no cover
+        self.resolve_names_count += 1
         ldap_address = request.xpath("//m:UnresolvedEntry", namespaces=NAMESPACES)[0].text
         assert ldap_address == '/O=Dummy'
         return M.ResolveNamesResponse(
@@ -136,7 +199,7 @@ class FindItemsHandler(object):
             T.End(format_date_for_xml(props['end'])),
             T.LegacyFreeBusyStatus('Busy'),
             T.Location(""),
-            T.CalendarItemType('Single'),
+            T.CalendarItemType(props.get('type', 'Single')),
             T.Organizer(
                 T.Mailbox(
                     T.Name(props['organizer_name']),
@@ -149,6 +212,19 @@ class FindItemsHandler(object):
 
     def add_item(self, email, props):
         self._email_to_props[email][props["id"]] = props
+        self._changes.append((email, props["id"]))
 
     def delete_item(self, email, id):
         self._email_to_props[email].pop(id, None)
+        self._changes.append((email, id))
+
+    def add_series(self, email, master_id, occurrences):
+        for props in occurrences:
+            self._email_to_props[email][props["id"]] = dict(props, type='Occurrence')
+        self._series[email][master_id] = [props["id"] for props in occurrences]
+        self._changes.append((email, master_id))
+
+    def delete_series(self, email, master_id):
+        for id in self._series[email].pop(master_id):
+            self._email_to_props[email].pop(id, None)
+        self._changes.append((email, master_id))
@@ -56,6 +56,8 @@ def test_download(
         return  # No need to test the rest.
     assert ex_resource.reservations.count() == 2
     ex = _check_imported_reservation(item_id, item_dict)
+    assert ex.organizer.email_address == 'dummy@example.com'
+    assert delegate.resolve_names_count == 1  # The items share the organizer
 
     # Resync, with nothing changed:
     sync_from_exchange(ex_resource)
@@ -74,6 +76,92 @@ def test_download(
     assert ex_resource.reservations.count() == 1
 
 
+@pytest.mark.django_db
+def test_incremental_download(settings, space_resource, exchange):
+    email = "%s@example.com" % get_random_string()
+    item_dict = _generate_item_dict()
+    delegate = FindItemsHandler()
+    delegate.add_item(email, item_dict)
+    SoapSeller.wire(settings, delegate)
+    ex_resource = ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email=email,
+        exchange=exchange,
+        sync_to_respa=True
+    )
+
+    # The first sync fetches all the items
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 1
+    assert ex_resource.reservations.count() == 1
+    ex_resource.refresh_from_db()
+    assert ex_resource.sync_state and ex_resource.full_sync_at
+
+    # ... and the following ones only the changes
+    other_item_dict = _generate_item_dict()
+    delegate.add_item(email, other_item_dict)
+    sync_from_exchange(ex_resource)
+    assert ex_resource.reservations.count() == 2
+    _check_imported_reservation(other_item_dict["id"], other_item_dict)
+
+    delegate.delete_item(email, item_dict["id"])
+    item_dict = dict(_generate_item_dict(), start=now() + timedelta(days=400), end=now() + timedelta(days=401))
+    delegate.add_item(email, item_dict)  # Outside the synced range
+    sync_from_exchange(ex_resource)
+    assert ex_resource.reservations.count() == 1
+    assert delegate.find_item_count == 1
+
+    # An invalid sync state or an old full sync means syncing all the items
+    ExchangeResource.objects.filter(id=ex_resource.id).update(sync_state='invalid')
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 2
+    ExchangeResource.objects.filter(id=ex_resource.id).update(full_sync_at=now() - timedelta(days=2))
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 3
+    assert ex_resource.reservations.count() == 1
+
+
+@pytest.mark.django_db
+def test_incremental_download_of_recurring_items(settings, space_resource, exchange):
+    email = "%s@example.com" % get_random_string()
+    item_dict = _generate_item_dict()
+    delegate = FindItemsHandler()
+    delegate.add_item(email, item_dict)
+    SoapSeller.wire(settings, delegate)
+    ex_resource = ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email=email,
+        exchange=exchange,
+        sync_to_respa=True
+    )
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 1
+
+    # The occurrences of a new series are only listed by a full sync
+    master_id = ItemID(get_random_string(), get_random_string())
+    occurrences = [
+        dict(_generate_item_dict(), start=now() + timedelta(days=days), end=now() + timedelta(days=days, hours=1))
+        for days in (1, 8)
+    ]
+    delegate.add_series(email, master_id, occurrences)
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 2
+    assert ex_resource.reservations.count() == 3
+
+    # ... and deleting the series is reported by the ID of its master item only
+    delegate.delete_series(email, master_id)
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 3
+    assert ex_resource.reservations.count() == 1
+    _check_imported_reservation(item_dict["id"], item_dict)
+
+    # The deletions of known items are still synced incrementally
+    delegate.delete_item(email, item_dict["id"])
+    sync_from_exchange(ex_resource)
+    assert delegate.find_item_count == 3
+    assert ex_resource.reservations.count() == 0
+
+
 def _check_imported_reservation(item_id, item_dict):
     ex = ExchangeReservation.objects.filter(item_id_hash=item_id.hash).first()
     assert moments_close_enough(ex.reservation.begin, item_dict['start'])
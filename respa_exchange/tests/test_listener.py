@@ -1,3 +1,6 @@
+import threading
+import time
+
 import pytest
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
@@ -111,3 +114,38 @@ def test_listener(settings, space_resource, exchange, monkeypatch):
     notification_listener.start()
     # ... so when `sync_resource` is called, this'll eventually happen:
     assert ex_resource in synced_resources
+
+
+@pytest.mark.django_db(transaction=True)
+def test_listener_sync_pool(space_resource, exchange, monkeypatch):
+    ex_resource = ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email='%s@example.com' % get_random_string(),
+        exchange=exchange,
+        sync_to_respa=True,
+    )
+    notification_listener = listener.NotificationListener(sync_workers=2)
+
+    release = threading.Event()
+    synced_resources = []
+
+    def sync_resource(resource):
+        synced_resources.append(resource)
+        release.wait(5)
+
+    monkeypatch.setattr(listener, 'sync_from_exchange', sync_resource)
+    # Changes to a resource being synced are collected into one resync
+    for i in range(3):
+        notification_listener.submit_sync(ex_resource)
+    assert notification_listener.get_sync_metrics()['waiting'] == 1
+    release.set()
+    for i in range(50):
+        if not notification_listener.get_sync_metrics()['syncing']:
+            break
+        time.sleep(0.1)
+    notification_listener.close()
+
+    assert synced_resources == [ex_resource, ex_resource]
+    # The workers sync copies of their own
+    assert synced_resources[0] is not ex_resource
+    assert ex_resource.principal_email in notification_listener.get_sync_metrics()['durations']
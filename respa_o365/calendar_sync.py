@@ -1,13 +1,14 @@
 import logging
 import json
 
-from django.db import transaction, DatabaseError
+from django.db import transaction
 from respa_o365.respa_availabilility_repository import RespaAvailabilityRepository
 from respa_o365.o365_availability_repository import O365AvailabilityRepository
 import string
 import random
 
 from django.conf import settings
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -36,31 +37,43 @@ def add_to_queue(link):
     OutlookSyncQueue.objects.create(calendar_link=link)
 
 def process_queue():
-    try:
-        queue = OutlookSyncQueue.objects.all().order_by('calendar_link_id')
-        if not queue:
-            logger.info("Nothing to sync.")
-            return
-
-        logger.info("Handling {} entries from sync queue.".format(queue.count()))
-        previous_id = None
-        index = 0
-        for item in queue:
-            index = index + 1
-            logger.debug("%d: starting transaction", index)
-            with transaction.atomic():
-                logger.debug("%d: transaction started", index)
-                link_id = item.calendar_link_id
-                same_than_previous = link_id == previous_id
-                previous_id = link_id
-                if not same_than_previous:
-                    link = OutlookCalendarLink.objects.get(pk=link_id)
-                    perform_sync_to_exchange(link, lambda sync: sync.sync_all())
-                item.delete()
-            logger.debug("%d: transaction done", index)
-    except DatabaseError as e:
-        logger.warning("Outlook synchronisation failed due database error.", exc_info=e)
-        return
+    """
+    Sync every calendar link in the queue once, one link at a time
+
+    The o365_process_sync_queue command syncs the links in parallel.
+    """
+    synced = 0
+    while True:
+        claimed_at = timezone.now()
+        link_ids = OutlookSyncQueue.objects.claim(1, claimed_at)
+        if not link_ids:
+            break
+        try:
+            sync_queued_link(link_ids[0], claimed_at)
+        except Exception:
+            logger.exception("Outlook synchronisation of calendar link %s failed.", link_ids[0])
+        else:
+            synced += 1
+    logger.info("Synced {} calendar links from sync queue.".format(synced))
+
+
+def sync_queued_link(link_id, claimed_at):
+    """
+    Sync a calendar link claimed from the queue and remove the claimed entries
+
+    No transaction is held while the Graph API is called. If the sync
+    fails, the entries stay claimed and are retried after the claim has
+    expired.
+
+    :type link_id: int
+    :type claimed_at: datetime.datetime
+    """
+    link = OutlookCalendarLink.objects.select_related('resource', 'user').filter(pk=link_id).first()
+    if link is None:
+        return  # the queue entries went with the link
+    perform_sync_to_exchange(link, lambda sync: sync.sync_all())
+    OutlookSyncQueue.objects.filter(calendar_link=link, claimed_at=claimed_at).delete()
+
 
 def perform_sync_to_exchange(link, func):
     # Sync reservations
@@ -1,18 +1,63 @@
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Any, Optional
-from django.core.management.base import BaseCommand
-from tendo import singleton
-from respa_o365.calendar_sync import process_queue
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connections
+from django.utils import timezone
+from respa_o365.calendar_sync import sync_queued_link
+from respa_o365.models import OutlookSyncQueue
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    'Processes the Outlook sync queue'
+    'Processes the Outlook sync queue, syncing the queued calendar links in parallel'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--workers', type=int, default=4, help='Calendar links synced in parallel (default: 4)')
+        parser.add_argument('--continuous', action='store_true',
+                            help='Keep processing the queue instead of exiting when it is empty')
+        parser.add_argument('--poll-interval', type=float, default=2,
+                            help='Seconds between checks of the queue in continuous mode (default: 2)')
+
+    def _sync_link(self, link_id, claimed_at):
+        try:
+            sync_queued_link(link_id, claimed_at)
+        except Exception:
+            logger.exception("Outlook synchronisation of calendar link %s failed.", link_id)
+            return False
+        finally:
+            # worker threads have database connections of their own
+            connections.close_all()
+        return True
 
     def handle(self, *args: Any, **options: Any) -> Optional[str]:
         logger.info("Processing sync queue.")
-        try:
-            me = singleton.SingleInstance(flavor_id="o365_process_sync_queue")
-        except singleton.SingleInstanceException:
-            return
-        process_queue()
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        start = time.monotonic()
+        synced = failed = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Links are claimed as workers become free, so a slow link
+                # does not hold up the others.
+                if len(pending) < workers:
+                    claimed_at = timezone.now()
+                    for link_id in OutlookSyncQueue.objects.claim(workers - len(pending), claimed_at):
+                        pending.add(executor.submit(self._sync_link, link_id, claimed_at))
+                if not pending:
+                    if not options['continuous']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result():
+                        synced += 1
+                    else:
+                        failed += 1
+
+        elapsed = time.monotonic() - start
+        logger.info("Synced %d calendar links in %.2f s, %d failed", synced, elapsed, failed)
+        self.stdout.write("Synced %d calendar links in %.2f s, %d failed" % (synced, elapsed, failed))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('respa_o365', '0007_one_to_one'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlooksyncqueue',
+            name='claimed_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Time of claiming'),
+        ),
+    ]
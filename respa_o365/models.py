@@ -2,7 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 
 from respa_o365.availability_sync_item import period_to_item
@@ -72,10 +72,47 @@ class OutlookCalendarAvailability(models.Model):
         return None
     
 
+# A link whose sync has not finished in this time is given to another worker
+SYNC_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class OutlookSyncQueueQuerySet(models.QuerySet):
+    def claim(self, count, at):
+        """
+        Claim the queued entries of at most `count` calendar links
+
+        All the entries of a link are claimed together, so a link queued many
+        times is synced once. Links locked by another worker or claimed less
+        than SYNC_CLAIM_TIMEOUT ago are skipped, so the links can be synced
+        in parallel outside of any transaction. Returns the ids of the
+        claimed links.
+
+        :type count: int
+        :type at: datetime.datetime the claim time stored in the entries
+        :rtype: list[int]
+        """
+        from django.db import transaction
+
+        expired = at - SYNC_CLAIM_TIMEOUT
+        with transaction.atomic():
+            link_ids = list(
+                OutlookCalendarLink.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=self.values('calendar_link'))
+                .exclude(pk__in=self.filter(claimed_at__gt=expired).values('calendar_link'))
+                .order_by('pk').values_list('pk', flat=True)[:count]
+            )
+            if link_ids:
+                self.filter(calendar_link__in=link_ids).update(claimed_at=at)
+        return link_ids
+
+
 class OutlookSyncQueue(models.Model):
     calendar_link = models.ForeignKey('OutlookCalendarLink', verbose_name=_('Calendar Link'),
                     blank=False, null=False, on_delete=models.CASCADE)
     created_at = models.DateTimeField(verbose_name=_('Time of creation'), auto_now_add=True)
+    claimed_at = models.DateTimeField(verbose_name=_('Time of claiming'), null=True, editable=False)
+
+    objects = OutlookSyncQueueQuerySet.as_manager()
 
 def utc_datetime(local_datetime):
     tz = pytz.timezone(settings.TIME_ZONE)
@@ -43,12 +43,19 @@ class Event:
 UTC = pytz.timezone("UTC")
 local_tz = pytz.timezone(settings.TIME_ZONE)
 time_format = '%Y-%m-%dT%H:%M:%S.%f%z'
+# The fields of events the repositories use
+EVENT_FIELDS = 'id,subject,body,start,end,createdDateTime,lastModifiedDateTime'
+# The window of a delta query is fixed when it is started, so it is
+# started over once the window has moved this much.
+DELTA_WINDOW_REFRESH = timedelta(days=1)
+
 
 class O365Calendar:
     def __init__(self,  microsoft_api, known_events={}, calendar_id=None, event_prefix=None):
         self._calendar_id = calendar_id
         self._api = microsoft_api
-        self._known_events = known_events
+        self._known_events = dict(known_events)
+        self._changes = {}
         self._event_prefix = event_prefix
         self._start_date = (datetime.now(tz=timezone.utc) - timedelta(days=settings.O365_SYNC_DAYS_BACK)).replace(microsecond=0)
         self._end_date = (datetime.now(tz=timezone.utc) + timedelta(days=settings.O365_SYNC_DAYS_FORWARD)).replace(microsecond=0)
@@ -100,7 +107,7 @@ class O365Calendar:
         return e
 
     def get_event(self, event_id):
-        url = self._get_single_event_url(event_id)
+        url = self._get_single_event_select_url(event_id)
         try:
             json = self._api.get(url)
         except MicrosoftApiError:
@@ -180,37 +187,137 @@ class O365Calendar:
         return event.change_key()
 
     def get_changes(self, memento=None):
-        # Microsoft API does not provide general API to fetch changes.
-        # There is delta for primary calendar, but this does not work in cases
-        # where calendar id needs to be defined. Thus this method is not
-        # able to return whole status as memento. Items seen during last
-        # call is used to detect deleted items between calls.
-        # Method is not immutable against memento as it should.
-        if memento:
-            time = datetime.strptime(memento, time_format)
-        else:
-            time = datetime(1970, 1, 1, tzinfo=timezone.utc)
-        events = self.get_events()
-        deleted_keys = set(self._known_events) - set(events)
-        deleted = { key: self._known_events[key] for key in deleted_keys }
-        self._known_events = events
-        events = {i: e for i, e in events.items() if e.modified_at > time}
-        new_memento = reduce(lambda a, b: max(a, b.modified_at), events.values(), time)
-        result = {id: (status(r, time), r.change_key()) for id, r in events.items()}
-        for key, value in deleted.items():
+        """
+        Returns the changes to the events since the memento and a new memento
+
+        The memento holds a calendarView delta link, so that only the events
+        created, updated or deleted since the previous call are fetched.
+        Without a delta link, or when its window is older than
+        DELTA_WINDOW_REFRESH, all the events of the window are fetched to
+        start a new delta, and events not modified since the memento are
+        left out. Events seen during the last call are used to detect the
+        events deleted in between. The result is kept for the memento, so
+        get_changes_by_ids does not fetch the changes again.
+        """
+        if memento in self._changes:
+            return self._changes[memento]
+
+        state = parse_memento(memento)
+        time = state['modified_at']
+        events = None
+        if state.get('delta_link') and state['window_start'] > self._start_date - DELTA_WINDOW_REFRESH:
+            try:
+                events, deleted, delta_link = self._get_delta_changes(state['delta_link'])
+                window_start = state['window_start']
+            except MicrosoftApiError as e:
+                logger.warning("Delta query failed, fetching all events: %s", e)
+        if events is None:
+            try:
+                events, deleted, delta_link = self._get_all_changes(time)
+                window_start = self._start_date
+            except MicrosoftApiError as e:
+                logger.warning("Fetching events failed: %s", e)
+                return {}, memento
+
+        result = {id: (e.status, e.change_key()) for id, e in events.items()}
+        for key in deleted:
+            value = self._known_events.pop(key)
             if value['end'] and value['end'] > self._start_date and value['end'] < self._end_date:
                 result[key] = (ChangeType.DELETED, "")
             else:
                 result[key] = (ChangeType.EXPIRED, "")
-
-        return result, new_memento.strftime(time_format)
+        self._known_events.update({id: {"begin": e.begin, "end": e.end} for id, e in events.items()})
+
+        modified_at = reduce(lambda a, b: max(a, b.modified_at), events.values(), time)
+        new_memento = json.dumps({
+            'delta_link': delta_link,
+            'window_start': window_start.strftime(time_format),
+            'modified_at': modified_at.strftime(time_format),
+        })
+        self._changes[memento] = result, new_memento
+        return result, new_memento
+
+    def _get_all_changes(self, time):
+        """
+        Fetch all the events of the window, starting a new delta
+
+        Returns the events modified after `time`, the known events that no
+        longer exist and the delta link.
+        """
+        events, _, delta_link = self._get_delta(self._get_delta_url())
+        events = {id: e for id, e in events.items() if self.event_prefix_matches(e.subject)}
+        known_events = self._known_events
+        deleted = set(known_events) - set(events)
+        # The events not modified are known from now on as well
+        self._known_events = {id: {"begin": e.begin, "end": e.end} for id, e in events.items()}
+        self._known_events.update({id: known_events[id] for id in deleted})
+        events = {id: e for id, e in events.items() if e.modified_at > time}
+        for e in events.values():
+            e.status = status(e, time)
+        return events, deleted, delta_link
+
+    def _get_delta_changes(self, delta_link):
+        """
+        Fetch the events changed since the delta link was returned
+
+        Returns the created and updated events, the known events that were
+        deleted and the next delta link.
+        """
+        events, removed, delta_link = self._get_delta(delta_link)
+        for id, e in list(events.items()):
+            if self.event_prefix_matches(e.subject):
+                e.status = ChangeType.UPDATED if id in self._known_events else ChangeType.CREATED
+            else:
+                del events[id]
+                removed.add(id)
+        return events, removed & set(self._known_events), delta_link
+
+    def _get_delta(self, url):
+        """
+        Follow a calendarView delta query through its pages
+
+        Returns the created and updated events, the ids of the removed
+        events and the delta link for the next query.
+
+        :rtype: tuple[dict[str, Event], set[str], str]
+        """
+        events = {}
+        removed = set()
+        while True:
+            logger.info("Retrieving event changes from calendar at {}".format(url))
+            response = self._api.get(url)
+            if response is None or 'error' in response:
+                raise MicrosoftApiError("Delta query failed: {}".format(response and response.get('error')))
+            for event in response.get('value', []):
+                event_id = event.get('id')
+                if '@removed' in event:
+                    events.pop(event_id, None)
+                    removed.add(event_id)
+                else:
+                    removed.discard(event_id)
+                    events[event_id] = self.json_to_event(event)
+            url = response.get('@odata.nextLink')
+            if url is None:
+                return events, removed, response.get('@odata.deltaLink')
 
     def get_changes_by_ids(self, item_ids, memento=None):
         changes, new_memento = self.get_changes(memento)
         return {i: changes.get(i, (ChangeType.NO_CHANGE, "")) for i in item_ids}, new_memento
 
+    def _get_delta_url(self):
+        qs = 'startDateTime={}&endDateTime={}'.format(
+            parse.quote_plus(self._start_date.isoformat()), parse.quote_plus(self._end_date.isoformat())
+        )
+        if self._calendar_id is not None:
+            return 'me/calendars/{}/calendarView/delta?{}'.format(self._calendar_id, qs)
+
+        return 'me/calendarView/delta?{}'.format(qs)
+
     def _get_events_list_url(self):
-        qs = 'startDateTime={}&endDateTime={}&$top=50'.format(parse.quote_plus(self._start_date.isoformat()), parse.quote_plus(self._end_date.isoformat()))
+        qs = 'startDateTime={}&endDateTime={}&$top=50&$select={}'.format(
+            parse.quote_plus(self._start_date.isoformat()), parse.quote_plus(self._end_date.isoformat()),
+            EVENT_FIELDS
+        )
         if self._calendar_id is not None:
             return 'me/calendars/{}/calendarView?{}'.format(self._calendar_id, qs)
 
@@ -222,13 +329,35 @@ class O365Calendar:
         
         return 'me/events/{}'.format(event_id)
 
+    def _get_single_event_select_url(self, event_id):
+        return '{}?$select={}'.format(self._get_single_event_url(event_id), EVENT_FIELDS)
+
     def _get_create_event_url(self):
         if self._calendar_id is not None:
             return 'me/calendars/{}/events'.format(self._calendar_id)
         
         return 'me/events'
 
-    
+
+def parse_memento(memento):
+    """
+    Returns the delta link, the window start and the modification time held by a memento
+
+    Mementos from before the delta queries hold only the modification time.
+    """
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    if not memento:
+        return {'modified_at': epoch}
+    try:
+        state = json.loads(memento)
+    except ValueError:
+        return {'modified_at': datetime.strptime(memento, time_format)}
+    return {
+        'delta_link': state['delta_link'],
+        'window_start': datetime.strptime(state['window_start'], time_format),
+        'modified_at': datetime.strptime(state['modified_at'], time_format),
+    }
+
 
 def status(item, time):
     # Temporary logging method
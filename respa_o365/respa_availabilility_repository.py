@@ -31,18 +31,21 @@ class RespaAvailabilityRepository:
         period.save()
         Day.objects.create(closed=False, weekday=item.begin.weekday(), opens=naive_time(item.begin), closes=fixed_end_time(item.end), period=period)
         period.save()
-        Resource.objects.get(pk=self.__resource_id).update_opening_hours()
+        Resource.objects.get(pk=self.__resource_id).update_opening_hours(period.start, period.end)
         return period.id, period_change_key
 
     def set_item(self, item_id, item):
         period = Period.objects.get(id=item_id)
+        previous_start, previous_end = period.start, period.end
         Day.objects.filter(period=period).delete()
         period.start = naive_date(item.begin)
         period.end = naive_date(item.end)
         period._from_o365_sync = True
         Day.objects.create(closed=False, weekday=item.begin.weekday(), opens=naive_time(item.begin), closes=fixed_end_time(item.end), period=period)
         period.save()
-        Resource.objects.get(pk=self.__resource_id).update_opening_hours()
+        Resource.objects.get(pk=self.__resource_id).update_opening_hours(
+            min(previous_start, period.start), max(previous_end, period.end)
+        )
         return period_change_key
 
     def get_item(self, item_id):
@@ -54,7 +57,7 @@ class RespaAvailabilityRepository:
             period = Period.objects.get(id=item_id)
             period._from_o365_sync = True
             period.delete()
-            Resource.objects.get(pk=self.__resource_id).update_opening_hours()
+            Resource.objects.get(pk=self.__resource_id).update_opening_hours(period.start, period.end)
         except Exception:
             logger.error("Failed deleting period {}".format(item_id), exc_info=True)
 
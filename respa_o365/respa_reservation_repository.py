@@ -49,6 +49,9 @@ class RespaReservations:
         reservation.comments = item.comments
         reservation.begin = item.begin
         reservation.end = item.end
+        # The times come from Outlook unvalidated, so leave the reservation
+        # out of the collision constraints.
+        reservation.enforced_cooldown = None
         reservation._from_o365_sync = True
         reservation.save()
         return reservation_change_key(item)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from urllib import parse
+from respa_o365.o365_calendar import O365Calendar
+from respa_o365.sync_operations import ChangeType
+
+
+class GraphApiStub:
+    """
+    Answers calendarView delta queries of a calendar kept in memory
+
+    The delta token is an index to the log of changed event ids.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self.changes = []
+        self.requests = []
+
+    def save_event(self, event_id, subject, begin, end):
+        created = self.events.get(event_id, {}).get("createdDateTime", graph_time(datetime.now(tz=timezone.utc)))
+        self.events[event_id] = {
+            "id": event_id,
+            "subject": subject,
+            "body": {"contentType": "HTML", "content": ""},
+            "start": {"dateTime": graph_time(begin), "timeZone": "UTC"},
+            "end": {"dateTime": graph_time(end), "timeZone": "UTC"},
+            "createdDateTime": created,
+            "lastModifiedDateTime": graph_time(datetime.now(tz=timezone.utc)),
+        }
+        self.changes.append(event_id)
+
+    def delete_event(self, event_id):
+        del self.events[event_id]
+        self.changes.append(event_id)
+
+    def get(self, path):
+        self.requests.append(path)
+        query = parse.parse_qs(parse.urlparse(path).query)
+        if "$deltatoken" in query:
+            changed = dict.fromkeys(self.changes[int(query["$deltatoken"][0]):])
+        else:
+            changed = self.events
+        value = [
+            self.events.get(event_id, {"id": event_id, "@removed": {"reason": "deleted"}})
+            for event_id in changed
+        ]
+        return {
+            "value": value,
+            "@odata.deltaLink": "me/calendarView/delta?$deltatoken={}".format(len(self.changes)),
+        }
+
+
+def graph_time(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f0")
+
+
+def test_get_changes_fetches_only_changed_events():
+    api = GraphApiStub()
+    begin = datetime.now(tz=timezone.utc).replace(microsecond=0)
+    api.save_event("a", "Varaus Varaamo", begin, begin + timedelta(hours=1))
+    api.save_event("b", "Varaus Varaamo", begin, begin + timedelta(hours=1))
+    api.save_event("c", "Something else", begin, begin + timedelta(hours=1))
+
+    # The first sync fetches all the events and starts a delta
+    calendar = O365Calendar(microsoft_api=api, event_prefix="Varaus Varaamo")
+    changes, memento = calendar.get_changes()
+    assert {id: change for id, (change, _) in changes.items()} == {
+        "a": ChangeType.CREATED, "b": ChangeType.CREATED,
+    }
+    assert "$deltatoken" not in api.requests[-1]
+
+    api.save_event("a", "Varaus Varaamo", begin, begin + timedelta(hours=2))
+    api.delete_event("b")
+    api.save_event("d", "Varaus Varaamo", begin, begin + timedelta(hours=1))
+
+    # ... and later syncs only the changes since
+    known_events = {id: {"begin": begin, "end": begin + timedelta(hours=1)} for id in ("a", "b")}
+    calendar = O365Calendar(microsoft_api=api, known_events=known_events, event_prefix="Varaus Varaamo")
+    requests = len(api.requests)
+    changes, new_memento = calendar.get_changes(memento)
+    assert {id: change for id, (change, _) in changes.items()} == {
+        "a": ChangeType.UPDATED, "b": ChangeType.DELETED, "d": ChangeType.CREATED,
+    }
+    assert len(api.requests) == requests + 1
+    assert "$deltatoken=3" in api.requests[-1]
+
+    # The changes are not fetched again for the statuses of single events
+    statuses, _ = calendar.get_changes_by_ids(["a", "e"], memento)
+    assert statuses == {"a": changes["a"], "e": (ChangeType.NO_CHANGE, "")}
+    assert len(api.requests) == requests + 1
+
+    changes, _ = calendar.get_changes(new_memento)
+    assert changes == {}
@@ -0,0 +1,61 @@
+import pytest
+from datetime import timedelta
+from django.utils import timezone
+from resources.models import ResourceType, Resource, Unit
+from users.models import User
+from respa_o365 import calendar_sync
+from respa_o365.calendar_sync import add_to_queue, sync_queued_link
+from respa_o365.models import OutlookCalendarLink, OutlookSyncQueue
+
+
+@pytest.fixture
+def links():
+    unit = Unit.objects.create(name="unit", time_zone='Europe/Helsinki')
+    resource_type = ResourceType.objects.get_or_create(id="test_space", name="test_space", main_type="space")[0]
+    links = []
+    for i in range(2):
+        resource = Resource.objects.create(type=resource_type, authentication="none", name="resource %d" % i, unit=unit)
+        user = User.objects.create(username="user%d" % i)
+        links.append(OutlookCalendarLink.objects.create(
+            resource=resource, user=user, token="{}", microsoft_user_id="ms%d" % i,
+        ))
+    return links
+
+
+@pytest.mark.django_db
+def test_claim_collapses_entries_and_skips_claimed_links(links):
+    first, second = links
+    for _ in range(3):
+        add_to_queue(first)
+    add_to_queue(second)
+    now = timezone.now()
+
+    # All the entries of a link are claimed at once
+    assert OutlookSyncQueue.objects.claim(1, now) == [first.id]
+    assert OutlookSyncQueue.objects.filter(calendar_link=first, claimed_at=now).count() == 3
+
+    # A link being synced is not claimed again, even when queued again
+    add_to_queue(first)
+    assert OutlookSyncQueue.objects.claim(10, now) == [second.id]
+    assert OutlookSyncQueue.objects.claim(10, now) == []
+
+    # ... unless its claim has expired
+    later = now + timedelta(hours=1)
+    assert OutlookSyncQueue.objects.claim(10, later) == [first.id, second.id]
+
+
+@pytest.mark.django_db
+def test_sync_queued_link_removes_claimed_entries(links, monkeypatch):
+    synced = []
+    monkeypatch.setattr(calendar_sync, 'perform_sync_to_exchange', lambda link, func: synced.append(link.id))
+    link = links[0]
+    add_to_queue(link)
+    add_to_queue(link)
+    claimed_at = timezone.now()
+    OutlookSyncQueue.objects.claim(1, claimed_at)
+    add_to_queue(link)  # queued while the link is synced
+
+    sync_queued_link(link.id, claimed_at)
+    assert synced == [link.id]
+    assert OutlookSyncQueue.objects.filter(calendar_link=link).count() == 1
+    assert OutlookSyncQueue.objects.get(calendar_link=link).claimed_at is None
@@ -14,6 +14,7 @@ from datetime import datetime, timedelta
 import time
 
 from resources.models import Reservation
+from resources.models.reservation import reservation_constraint_errors
 from resources.models.utils import send_respa_mail
 
 
@@ -89,7 +90,8 @@ class RespaOutlookConfiguration(models.Model):
                 reservation.end = appointment.end
             try:
                 reservation.clean()
-                reservation.save()
+                with reservation_constraint_errors():
+                    reservation.save()
             except ValidationError:
                 appointment.start = cache.begin
                 appointment.end = cache.end